@@ -0,0 +1 @@
+"""Headless analytics helpers used by the Streamlit app."""
@@ -0,0 +1,91 @@
+"""IsolationForest anomaly detection with fitted detectors cached per dataset."""
+import joblib
+import numpy as np
+import sklearn
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from analytics.charts import HISTOGRAM_BINS, histogram
+from analytics.sketch import QuantileSketch
+from analytics.store import artifact_key, cached_artifact, input_signature
+
+ANOMALY_FEATURES = ['ANNUAL_PREM', 'LOSS_RATIO', 'RISK_SCORE', 'EXPECTED_VS_ACTUAL']
+# Scores lie in (-1, 0) and crowd around -0.5, so their sketch is finer than the dataset's
+SCORE_ACCURACY = 1e-4
+
+
+class AnomalyDetector:
+    """A fitted scaler and forest together with the scores of the training rows."""
+
+    def __init__(self, features, scaler, forest, scores):
+        self.features = features
+        self.scaler = scaler
+        self.forest = forest
+        self.scores = scores
+
+    def threshold(self, contamination):
+        # The ``contamination`` quantile of the training scores, within SCORE_ACCURACY of the exact one: read
+        # from a sketch kept with the detector instead of selecting from all scores each time the slider moves.
+        # The forest itself is fitted with contamination='auto', so its own offset_ plays no part
+        sketch = self.__dict__.get('_sketch')
+        if sketch is None:
+            sketch = self._sketch = QuantileSketch.from_values(self.scores, SCORE_ACCURACY)
+        return sketch.quantile(contamination)
+
+    def flag(self, contamination):
+        return self.scores < self.threshold(contamination)
+
+    def most_anomalous(self, n):
+        """Row positions of the ``n`` lowest-scoring rows, most anomalous first."""
+        n = min(n, len(self.scores))
+        # Kept on the instance, which is itself cached per dataset
+        ranked = getattr(self, '_ranked', None)
+        if ranked is None or len(ranked) < n:
+            candidates = np.argpartition(self.scores, n - 1)[:n] if 0 < n < len(self.scores) else np.arange(n)
+            ranked = candidates[np.argsort(self.scores[candidates], kind='stable')]
+            self._ranked = ranked
+        return ranked[:n]
+
+    def score_histogram(self, bins=HISTOGRAM_BINS):
+        histograms = self.__dict__.setdefault('_histograms', {})
+        if bins not in histograms:
+            histograms[bins] = histogram(self.scores, bins)
+        return histograms[bins]
+
+    def score(self, df):
+        X = df[self.features].fillna(df[self.features].mean())
+        return _score_samples(self.forest, self.scaler.transform(X))
+
+
+def _score_samples(forest, X):
+    # Scoring is not bound by the fit-time n_jobs; spread tree traversal over all cores
+    with joblib.parallel_config(backend='threading', n_jobs=-1):
+        return forest.score_samples(X)
+
+
+def _fit(df, features, n_estimators, random_state):
+    X = df[features].fillna(df[features].mean())
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    # The decision threshold is applied afterwards from the scores, so the
+    # fitted forest does not depend on the contamination setting
+    forest = IsolationForest(n_estimators=n_estimators, contamination='auto',
+                             random_state=random_state, n_jobs=-1)
+    forest.fit(X_scaled)
+    return AnomalyDetector(features, scaler, forest, _score_samples(forest, X_scaled))
+
+
+def fit_detector(df, features, n_estimators=100, random_state=42, fingerprint=None):
+    """Fit (or reuse) an :class:`AnomalyDetector` for ``df``.
+
+    With a ``fingerprint`` the detector is cached in memory and persisted on
+    disk, keyed by dataset, features and their dtypes, forest parameters and
+    sklearn version.
+    """
+    features = list(features)
+    if fingerprint is None:
+        return _fit(df, features, n_estimators, random_state)
+    key = artifact_key(fingerprint, features, input_signature(df, features), n_estimators, random_state,
+                       sklearn.__version__)
+    return cached_artifact('isolation_forest', key,
+                           lambda: _fit(df, features, n_estimators, random_state), fingerprint=fingerprint)
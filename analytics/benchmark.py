@@ -0,0 +1,192 @@
+"""Benchmark harness: time ingestion, derived metrics and every analysis on synthetic portfolios."""
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from analytics.config import CACHE_DIR, dataframe_backend
+from analytics.store import atomic_write
+from analytics.synthetic import XLSX_MAX_ROWS, write_portfolio
+
+BENCH_DATA_DIR = os.path.join(CACHE_DIR, 'benchmark_data')
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+SIZE_SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def parse_size(value):
+    """``'10k'`` -> 10000, ``'1m'`` -> 1000000."""
+    value = value.strip().lower().replace('_', '')
+    if value[-1:] in SIZE_SUFFIXES:
+        return int(float(value[:-1]) * SIZE_SUFFIXES[value[-1]])
+    return int(value)
+
+
+def peak_rss_mb():
+    """High-water resident memory of this process, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def dataset_path(n_rows, fmt, seed=0, data_dir=BENCH_DATA_DIR):
+    """Path of the synthetic extract for a case, generating it on first use."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'portfolio_{n_rows}_s{seed}.{fmt}')
+    if not os.path.exists(path):
+        with atomic_write(path, suffix=f'.tmp.{fmt}') as tmp_path:
+            write_portfolio(tmp_path, n_rows, seed=seed)
+    return path
+
+
+class _Timer:
+    def __init__(self):
+        self.stages = []
+
+    def run(self, stage, func, rows=None):
+        before = peak_rss_mb()
+        started = time.perf_counter()
+        value = func()
+        seconds = time.perf_counter() - started
+        after = peak_rss_mb()
+        self.stages.append({
+            'stage': stage,
+            'seconds': round(seconds, 4),
+            'rows': rows if rows is not None else (len(value) if hasattr(value, '__len__') else None),
+            'peak_rss_mb': after,
+            # Growth of the high-water mark; zero when the stage fits in memory already touched
+            'peak_growth_mb': round(after - before, 1) if after is not None else None,
+        })
+        return value
+
+
+def run_case(path, analyses):
+    """Time every stage for one extract. Runs in a fresh process so peak memory is per case."""
+    from analytics.derived import with_derived
+    from analytics.engine import AnalysisContext, run_analysis
+    from analytics.ingestion import read_extract
+
+    timer = _Timer()
+    with open(path, 'rb') as f:
+        df, _ = timer.run('ingest', lambda: read_extract(os.path.basename(path), f))
+    timer.stages[-1]['rows'] = len(df)
+    # No fingerprint: nothing is served from the snapshot, memo or artifact caches
+    df = timer.run('derive', lambda: with_derived(df))
+    ctx = AnalysisContext(df)
+    timer.run('cube', lambda: ctx.cube, rows=len(df))
+    for name in analyses:
+        timer.run(f'analysis:{name}', lambda: run_analysis(name, ctx), rows=len(df))
+    return {'stages': timer.stages, 'peak_rss_mb': peak_rss_mb()}
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import numpy
+    import sklearn
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': numpy.__version__,
+        'sklearn': sklearn.__version__,
+        'backend': dataframe_backend(),
+        'git_revision': _git_revision(),
+    }
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, formats=('csv',), analyses=None, seed=0, results_dir=RESULTS_DIR,
+                  data_dir=BENCH_DATA_DIR, log=print):
+    """Benchmark every size/format case and save the results; returns ``(path, results)``."""
+    from analytics.engine import ANALYSES
+
+    analyses = list(analyses or ANALYSES)
+    cases = []
+    for n_rows in sizes:
+        for fmt in formats:
+            case = {'rows': n_rows, 'format': fmt}
+            cases.append(case)
+            if fmt == 'xlsx' and n_rows > XLSX_MAX_ROWS:
+                case['skipped'] = f'XLSX holds at most {XLSX_MAX_ROWS:,} rows'
+                log(f'{n_rows:>12,} {fmt:<5} skipped: {case["skipped"]}')
+                continue
+            path = dataset_path(n_rows, fmt, seed, data_dir)
+            case['file_mb'] = round(os.path.getsize(path) / 1024 / 1024, 1)
+            try:
+                # A new spawned process per case keeps peak memory and warm caches independent
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    case.update(pool.submit(run_case, path, analyses).result())
+            except Exception as e:
+                case['error'] = f'{type(e).__name__}: {e}'
+                log(f'{n_rows:>12,} {fmt:<5} failed: {case["error"]}')
+                continue
+            total = sum(stage['seconds'] for stage in case['stages'])
+            log(f'{n_rows:>12,} {fmt:<5} {total:8.2f}s  peak {case["peak_rss_mb"]} MB')
+
+    results = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': environment(),
+        'seed': seed,
+        'analyses': analyses,
+        'cases': cases,
+    }
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+    return path, results
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def latest_results(results_dir=RESULTS_DIR, exclude=None):
+    """Most recent saved results file other than ``exclude``, or None."""
+    if not os.path.isdir(results_dir):
+        return None
+    paths = sorted(os.path.join(results_dir, name) for name in os.listdir(results_dir)
+                   if name.startswith('bench-') and name.endswith('.json'))
+    paths = [path for path in paths if exclude is None or os.path.abspath(path) != os.path.abspath(exclude)]
+    return paths[-1] if paths else None
+
+
+def stage_frame(results):
+    """One row per (rows, format, stage) with its timing and memory."""
+    records = [dict(stage, rows=case['rows'], format=case['format'])
+               for case in results['cases'] for stage in case.get('stages', [])]
+    columns = ['rows', 'format', 'stage', 'seconds', 'peak_rss_mb']
+    return pd.DataFrame(records, columns=columns + ['peak_growth_mb'])[columns]
+
+
+def compare_results(baseline, current):
+    """Stage timings of ``current`` against ``baseline``; ``ratio`` > 1 means slower."""
+    base, new = stage_frame(baseline), stage_frame(current)
+    merged = base.merge(new, on=['rows', 'format', 'stage'], how='outer', suffixes=('_base', '_new'))
+    merged['ratio'] = (merged['seconds_new'] / merged['seconds_base']).round(2)
+    # Keep stages in pipeline order rather than alphabetical
+    order = {stage: i for i, stage in enumerate(dict.fromkeys([*base['stage'], *new['stage']]))}
+    merged['order'] = merged['stage'].map(order)
+    return merged.sort_values(['rows', 'format', 'order']).drop(columns='order').reset_index(drop=True)
@@ -0,0 +1,111 @@
+"""Chart-sized data: server-side histogram bins and deterministic, outlier-preserving scatter samples.
+
+Plotting the full portfolio ships every policy to the browser. These helpers
+reduce a column to fixed-size bins or a few thousand representative rows that
+always include each plotted column's extremes, and the results are cached per
+dataset so reruns reuse them.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from analytics.memo import fingerprint_cache
+
+HISTOGRAM_BINS = 50
+SCATTER_POINTS = 2000
+# Rows kept from each end of every plotted numeric column
+TAIL_POINTS = 25
+SAMPLE_SEED = 0
+
+
+def _floats(values):
+    if isinstance(values, pd.Series):
+        return values.to_numpy(dtype='float64', na_value=np.nan)
+    return np.asarray(values, dtype='float64')
+
+
+def histogram(values, bins=HISTOGRAM_BINS):
+    """Equal-width bins over the finite values: one row per bin with ``left``, ``right``, ``mid``, ``count``."""
+    values = _floats(values)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return pd.DataFrame(columns=['left', 'right', 'mid', 'count'])
+    counts, edges = np.histogram(values, bins=bins)
+    return pd.DataFrame({
+        'left': edges[:-1],
+        'right': edges[1:],
+        'mid': (edges[:-1] + edges[1:]) / 2,
+        'count': counts,
+    })
+
+
+@fingerprint_cache(maxsize=16)
+def column_histogram(df, column, bins=HISTOGRAM_BINS):
+    return histogram(df[column], bins)
+
+
+def tail_ids(values, n=TAIL_POINTS):
+    """Positions of the ``n`` smallest and ``n`` largest finite values."""
+    values = _floats(values)
+    finite = np.flatnonzero(np.isfinite(values))
+    if len(finite) <= 2 * n:
+        return finite
+    finite_values = values[finite]
+    low = np.argpartition(finite_values, n)[:n]
+    high = np.argpartition(finite_values, -n)[-n:]
+    return finite[np.concatenate([low, high])]
+
+
+def downsample_ids(n_rows, size=SCATTER_POINTS, extremes=(), tail=TAIL_POINTS, seed=SAMPLE_SEED):
+    """Sorted positions of at most ``size`` rows (plus the tails), identical on every call.
+
+    The ``tail`` lowest and highest rows of each array in ``extremes`` are always
+    kept; the remainder is a seeded uniform sample of the other rows.
+    """
+    kept = [tail_ids(values, tail) for values in extremes]
+    kept = np.unique(np.concatenate(kept)) if kept else np.empty(0, dtype=np.int64)
+    remaining = size - len(kept)
+    if remaining > 0 and n_rows > len(kept):
+        rng = np.random.default_rng(seed)
+        candidates = rng.choice(n_rows, size=min(n_rows, remaining + len(kept)), replace=False)
+        candidates = candidates[~np.isin(candidates, kept)][:remaining]
+        kept = np.union1d(kept, candidates)
+    return kept
+
+
+@fingerprint_cache(maxsize=16)
+def sample_ids(df, columns, size=SCATTER_POINTS, tail=TAIL_POINTS):
+    """:func:`downsample_ids` for ``df`` keeping the extremes of the numeric ``columns`` (a tuple)."""
+    extremes = [df[col] for col in columns if is_numeric_dtype(df[col].dtype)]
+    return downsample_ids(len(df), size, extremes, tail)
+
+
+def scatter_sample(df, columns, size=SCATTER_POINTS, fingerprint=None):
+    """The ``columns`` of a deterministic, tail-preserving sample of ``df`` for a scatter plot."""
+    columns = tuple(columns)
+    return df[list(columns)].take(sample_ids(df, columns, size, fingerprint=fingerprint))
+
+
+# Grid used to rasterise dense scatters, as (height, width)
+RASTER_SHAPE = (320, 480)
+
+
+def window_mask(x, y, bounds):
+    """Points inside ``bounds`` = ``(x0, x1, y0, y1)``, edges included."""
+    x0, x1, y0, y1 = bounds
+    return (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+
+
+def density_grid(x, y, labels, n_labels, bounds, shape=RASTER_SHAPE):
+    """Point counts per label on a grid over ``bounds``: shape ``(n_labels, height, width)``.
+
+    Row 0 of the grid is the bottom edge (``y0``); points outside ``bounds`` are ignored.
+    """
+    height, width = shape
+    x0, x1, y0, y1 = bounds
+    inside = window_mask(x, y, bounds)
+    x, y, labels = x[inside], y[inside], labels[inside]
+    col = np.minimum(((x - x0) / ((x1 - x0) or 1) * width).astype(np.int64), width - 1)
+    row = np.minimum(((y - y0) / ((y1 - y0) or 1) * height).astype(np.int64), height - 1)
+    cell = (labels.astype(np.int64) * height + row) * width + col
+    return np.bincount(cell, minlength=n_labels * height * width).reshape(n_labels, height, width)
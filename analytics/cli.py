@@ -0,0 +1,354 @@
+"""Command-line tools: run the app's analyses over extracts without a browser, and benchmark them.
+
+Examples::
+
+    python -m analytics run extracts/*.csv --output results --analyses premium_loss,anomaly_detection
+    python -m analytics run huge_extract.csv --out-of-core
+    python -m analytics bench --sizes 10k,100k,1m --formats csv,xlsx --baseline latest
+    python -m analytics parity --rows 1m
+    python -m analytics movement march.csv april.csv --output movement
+    python -m analytics footprint extract.csv
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from analytics import benchmark
+from analytics.config import BACKENDS
+from analytics.derived import derive_metrics, with_derived
+from analytics.engine import ANALYSES, AnalysisContext, run_analysis
+from analytics.footprint import compact_frame, footprint_report
+from analytics.incremental import IncrementalUnavailable, ValuationStore, movement_report, revalue, value_extract
+from analytics.ingestion import extract_fingerprint, fingerprint_file, ingest_path
+from analytics.instrumentation import StageRecorder
+from analytics.outofcore import OutOfCoreContext, OutOfCoreDataset, spill_extract
+from analytics.parity import check_parity
+from analytics.synthetic import write_portfolio
+
+OUTPUT_FORMATS = ('parquet', 'json')
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return str(value)
+    if value is pd.NA or value is pd.NaT:
+        return None
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _flat_table(table):
+    """Parquet/JSON need flat string column names and no meaningful index."""
+    table = table.copy(deep=False)
+    if not isinstance(table.index, pd.RangeIndex):
+        table = table.reset_index()
+    if isinstance(table.columns, pd.MultiIndex):
+        table.columns = ['_'.join(str(part) for part in col if part != '') for col in table.columns]
+    else:
+        table.columns = [str(col) for col in table.columns]
+    return table
+
+
+def write_result(result, out_dir, fmt='parquet'):
+    os.makedirs(out_dir, exist_ok=True)
+    files = []
+    for table_name, table in result.tables.items():
+        path = os.path.join(out_dir, f'{table_name}.{fmt}')
+        table = _flat_table(table)
+        if fmt == 'parquet':
+            table.to_parquet(path, index=False)
+        else:
+            table.to_json(path, orient='records', indent=1)
+        files.append(path)
+    path = os.path.join(out_dir, 'metrics.json')
+    with open(path, 'w') as f:
+        json.dump(result.metrics, f, indent=1, default=_json_default)
+    files.append(path)
+    return files
+
+
+def output_names(paths):
+    """Output directory name per path: its file stem, plus a short hash of its path where stems repeat."""
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    return [stem if stems.count(stem) == 1 else
+            f'{stem}-{hashlib.blake2b(os.path.abspath(path).encode(), digest_size=4).hexdigest()}'
+            for path, stem in zip(paths, stems)]
+
+
+def process_file(path, analyses, output_dir, fmt='parquet', options=None, out_of_core=False, output_name=None):
+    """Ingest one extract and write every requested analysis; returns its manifest entry.
+
+    Results go under ``output_dir/output_name`` (by default the file stem).
+    With ``out_of_core`` the extract is spilled to Parquet and aggregated with
+    DuckDB rather than loaded (see ``analytics.outofcore``). Otherwise the
+    frame is compacted as in the app, so both report the same figures.
+    """
+    options = options or {}
+    started = time.perf_counter()
+    timings = StageRecorder(file=path)
+    entry = {'file': path, 'analyses': {}}
+    try:
+        with timings.stage('ingest') as record:
+            if out_of_core:
+                name = os.path.basename(path).lower()
+                with open(path, 'rb') as f:
+                    fingerprint = extract_fingerprint(name, f, fingerprint_file(path))
+                    spilled, failures = spill_extract(name, f, fingerprint)
+                dataset = OutOfCoreDataset([spilled])
+                rows = dataset.n_rows
+            else:
+                fingerprint, df, failures = ingest_path(path)
+                rows = len(df)
+            record['rows'] = rows
+    except Exception as e:
+        entry['error'] = f'{type(e).__name__}: {e}'
+        entry['stages'] = timings.snapshot()
+        return entry
+
+    timings.context['fingerprint'] = fingerprint
+    with timings.stage('derive', rows=rows):
+        if out_of_core:
+            ctx = OutOfCoreContext(dataset, fingerprint)
+        else:
+            ctx = AnalysisContext(compact_frame(with_derived(df, fingerprint=fingerprint)), fingerprint)
+            derive_metrics.evict(fingerprint)
+    output_name = output_name or os.path.splitext(os.path.basename(path))[0]
+    entry.update(fingerprint=fingerprint, rows=rows, out_of_core=out_of_core,
+                 coercion_failures={col: n for col, n in failures.items() if n})
+    for name in analyses:
+        try:
+            with timings.stage(f'analysis:{name}', rows=rows):
+                result = run_analysis(name, ctx, **options.get(name, {}))
+            files = write_result(result, os.path.join(output_dir, output_name, name), fmt)
+            entry['analyses'][name] = {'files': files}
+        except Exception as e:
+            # One failing analysis should not lose the others for this file
+            entry['analyses'][name] = {'error': f'{type(e).__name__}: {e}'}
+    entry['seconds'] = round(time.perf_counter() - started, 3)
+    entry['stages'] = timings.snapshot()
+    return entry
+
+
+def run_batch(paths, analyses, output_dir, fmt='parquet', workers=None, options=None, out_of_core=False):
+    """Process extracts in parallel (one process per file) and write ``manifest.json``.
+
+    Each file's results go in a directory named after it (see :func:`output_names`).
+    """
+    # A file given twice, however spelt (e.g. a.csv and ./a.csv), is processed once
+    unique = {}
+    for path in paths:
+        unique.setdefault(os.path.abspath(path), path)
+    paths = list(unique.values())
+    names = output_names(paths)
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    entries = []
+    if workers <= 1:
+        entries = [process_file(path, analyses, output_dir, fmt, options, out_of_core, name)
+                   for path, name in zip(paths, names)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(process_file, path, analyses, output_dir, fmt, options, out_of_core, name)
+                       for path, name in zip(paths, names)]
+            entries = [future.result() for future in as_completed(futures)]
+        entries.sort(key=lambda entry: paths.index(entry['file']))
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump({'format': fmt, 'analyses': analyses, 'files': entries}, f, indent=1, default=_json_default)
+    return entries
+
+
+def _analysis_names(value):
+    if value == 'all':
+        return list(ANALYSES)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in ANALYSES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown analyses: {', '.join(unknown)} "
+                                         f"(choose from {', '.join(ANALYSES)})")
+    return names
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m analytics', description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run analyses over one or more extracts')
+    run.add_argument('files', nargs='+', help='CSV/XLSX policy extracts')
+    run.add_argument('-o', '--output', default='analytics_output', help='output directory')
+    run.add_argument('-a', '--analyses', type=_analysis_names, default=list(ANALYSES),
+                     help="comma-separated analysis names, or 'all' (default)")
+    run.add_argument('-f', '--format', choices=OUTPUT_FORMATS, default='parquet', help='table output format')
+    run.add_argument('-j', '--workers', type=int, default=None, help='parallel file workers (default: one per CPU)')
+    run.add_argument('--contamination', type=float, default=0.1, help='expected anomaly share')
+    run.add_argument('--criterion', choices=['silhouette', 'elbow'], default='silhouette',
+                     help='how the cluster count is chosen')
+    run.add_argument('--model-id', default=None, help='score with a registered model instead of training')
+    run.add_argument('--out-of-core', action='store_true',
+                     help='keep each extract on disk and aggregate it with DuckDB; model-based analyses use a sample')
+    run.add_argument('--backend', choices=BACKENDS, default=None,
+                     help='DataFrame engine for parsing, derived metrics and the cube (default: ANALYTICS_BACKEND)')
+
+    generate = commands.add_parser('generate', help='write a synthetic policy extract')
+    generate.add_argument('rows', type=benchmark.parse_size, help="number of policies, e.g. 10000, 100k, 10m")
+    generate.add_argument('path', help='output .csv or .xlsx path')
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('--invalid-share', type=float, default=0.0,
+                          help='share of ANNUAL_PREM values written as unparseable text')
+
+    bench = commands.add_parser('bench', help='benchmark ingestion and analyses on synthetic extracts')
+    bench.add_argument('--sizes', type=lambda value: [benchmark.parse_size(size) for size in value.split(',')],
+                       default=benchmark.DEFAULT_SIZES, help='comma-separated row counts (default: 10k,100k,1m)')
+    bench.add_argument('--formats', type=lambda value: value.split(','), default=['csv'],
+                       help='comma-separated extract formats: csv, xlsx')
+    bench.add_argument('-a', '--analyses', type=_analysis_names, default=list(ANALYSES))
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--results-dir', default=benchmark.RESULTS_DIR)
+    bench.add_argument('--baseline', default=None,
+                       help="results file to compare against, or 'latest' for the previous run")
+    bench.add_argument('--backend', choices=BACKENDS, default=None,
+                       help='DataFrame engine for parsing, derived metrics and the cube (default: ANALYTICS_BACKEND)')
+
+    parity = commands.add_parser('parity', help='check that every DataFrame backend gives the same results')
+    parity.add_argument('files', nargs='*', help='extracts to check (default: a synthetic one)')
+    parity.add_argument('--rows', type=benchmark.parse_size, default=100_000,
+                        help='size of the synthetic extract (default: 100k)')
+    parity.add_argument('--seed', type=int, default=0)
+    parity.add_argument('--invalid-share', type=float, default=0.01,
+                        help='share of unparseable values in the synthetic extract')
+
+    movement = commands.add_parser('movement', help='revalue an extract against the previous one and report the movement')
+    movement.add_argument('previous', help='previous CSV/XLSX extract')
+    movement.add_argument('current', help='current CSV/XLSX extract')
+    movement.add_argument('-o', '--output', default='analytics_output/movement', help='output directory')
+    movement.add_argument('-f', '--format', choices=OUTPUT_FORMATS, default='parquet', help='table output format')
+
+    footprint = commands.add_parser('footprint', help="report each column's memory at default widths, as loaded and compacted")
+    footprint.add_argument('file', help='CSV/XLSX policy extract')
+
+    compare = commands.add_parser('compare', help='compare two saved benchmark results')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    return parser
+
+
+def _print_comparison(baseline_path, current_path):
+    comparison = benchmark.compare_results(benchmark.load_results(baseline_path),
+                                           benchmark.load_results(current_path))
+    print(f'Baseline: {baseline_path}')
+    print(comparison.to_string(index=False))
+
+
+def _check_parity(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = args.files
+        if not paths:
+            paths = [os.path.join(tmp_dir, 'portfolio.csv')]
+            write_portfolio(paths[0], args.rows, seed=args.seed, invalid_share=args.invalid_share)
+        failed = False
+        for path in paths:
+            differences = check_parity(path)
+            failed = failed or bool(differences)
+            print(f"{args.files and path or f'synthetic {args.rows:,} rows'}: "
+                  f"{'differences found' if differences else 'backends agree'} ({', '.join(BACKENDS)})")
+            for backend, item, difference in differences:
+                print(f'  {backend} {item}: {difference}', file=sys.stderr)
+    return 1 if failed else 0
+
+
+def _report_movement(args):
+    store = ValuationStore()
+    paths = [args.previous, args.current]
+    (previous_fp, previous_df, _), (current_fp, current_df, _) = [ingest_path(path) for path in paths]
+    # Valuations are shared with the app, so a previous month valued there is reused as is
+    previous = store.load(previous_fp) or value_extract(previous_df, previous_fp)
+    start = time.perf_counter()
+    try:
+        current, delta = revalue(current_df, previous, current_fp)
+    except IncrementalUnavailable as e:
+        print(f'{args.current}: {e}', file=sys.stderr)
+        return 1
+    seconds = time.perf_counter() - start
+    for valuation, path in [(previous, args.previous), (current, args.current)]:
+        try:
+            store.save(valuation, [os.path.basename(path)])
+        except OSError:
+            pass
+    result = movement_report(previous, current, delta)
+    write_result(result, args.output, args.format)
+    print(result.tables['movement'].to_string(index=False))
+    metrics = result.metrics
+    print(f"{metrics['inserted']:,} new, {metrics['removed']:,} exited, {metrics['updated']:,} changed; "
+          f"revalued {'incrementally' if metrics['incremental'] else 'in full'} in {seconds:.2f}s")
+    print(f'Results written to {args.output}')
+    return 0
+
+
+def _report_footprint(args):
+    _, df, _ = ingest_path(args.file)
+    df = with_derived(df)
+    report = footprint_report(df, compact_frame(df))
+    print(report.to_string(index=False))
+    total = report.iloc[-1]
+    print(f"{total['Default MB'] / total['Compact MB']:.1f}x smaller than at default widths, "
+          f"{total['Loaded MB'] / total['Compact MB']:.1f}x smaller than as loaded")
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'backend', None):
+        # Read by analytics.config.dataframe_backend, and inherited by worker processes
+        os.environ['ANALYTICS_BACKEND'] = args.backend
+    if args.command == 'parity':
+        return _check_parity(args)
+    if args.command == 'movement':
+        return _report_movement(args)
+    if args.command == 'footprint':
+        return _report_footprint(args)
+    if args.command == 'generate':
+        write_portfolio(args.path, args.rows, seed=args.seed, invalid_share=args.invalid_share)
+        print(f'Wrote {args.rows:,} policies to {args.path}')
+        return 0
+    if args.command == 'bench':
+        path, _ = benchmark.run_benchmark(args.sizes, args.formats, args.analyses, seed=args.seed,
+                                          results_dir=args.results_dir)
+        print(f'Results written to {path}')
+        baseline = (benchmark.latest_results(args.results_dir, exclude=path) if args.baseline == 'latest'
+                    else args.baseline)
+        if baseline:
+            _print_comparison(baseline, path)
+        return 0
+    if args.command == 'compare':
+        _print_comparison(args.baseline, args.current)
+        return 0
+
+    options = {
+        'anomaly_detection': {'contamination': args.contamination},
+        'advanced_clustering': {'criterion': args.criterion},
+        'predictive_analytics': {'model_id': args.model_id},
+    }
+    entries = run_batch(args.files, args.analyses, args.output, args.format, args.workers, options,
+                        args.out_of_core)
+
+    failed = False
+    for entry in entries:
+        errors = [f"{name}: {status['error']}" for name, status in entry['analyses'].items() if 'error' in status]
+        if 'error' in entry:
+            errors.append(entry['error'])
+        failed = failed or bool(errors)
+        summary = f"{entry['rows']:,} rows in {entry['seconds']}s" if 'rows' in entry else 'not ingested'
+        print(f"{entry['file']}: {summary}")
+        for error in errors:
+            print(f'  error: {error}', file=sys.stderr)
+    print(f"Results written to {os.path.join(args.output, 'manifest.json')}")
+    return 1 if failed else 0
@@ -0,0 +1,192 @@
+"""K-means segmentation with automatic choice of K, evaluated in parallel."""
+import threading
+from collections import OrderedDict
+from functools import cached_property
+
+import numpy as np
+import sklearn
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA
+from sklearn.metrics import pairwise_distances_argmin, silhouette_score
+from sklearn.preprocessing import StandardScaler
+
+from analytics.charts import RASTER_SHAPE, density_grid, window_mask
+from analytics.store import artifact_key, cached_artifact, input_signature
+
+CLUSTER_FEATURES = ['ANNUAL_PREM', 'LOSS_RATIO', 'RISK_SCORE', 'EXPECTED_VS_ACTUAL']
+K_RANGE = tuple(range(2, 8))
+# Portfolios above this size are clustered with MiniBatchKMeans
+MINIBATCH_THRESHOLD = 200_000
+SAMPLE_SIZE = 5_000
+STRATIFY_BY = 'CL_PBAND'
+CRITERIA = ('silhouette', 'elbow')
+DENSITY_GRIDS_KEPT = 8
+# Selections are shared between sessions; a module lock keeps them picklable for the artifact store
+_density_lock = threading.Lock()
+
+
+class ClusterSelection:
+    """Chosen K with the evaluation curves, centroids and per-policy assignments."""
+
+    def __init__(self, features, k, k_values, inertias, silhouettes, criterion,
+                 centroids, labels, pca_coords, explained_variance):
+        self.features = features
+        self.k = k
+        self.k_values = k_values
+        self.inertias = inertias
+        self.silhouettes = silhouettes
+        self.criterion = criterion
+        self.centroids = centroids
+        self.labels = labels
+        self.pca_coords = pca_coords
+        self.explained_variance = explained_variance
+
+    @property
+    def label_names(self):
+        return [f'Premium Segment {chr(65 + i)}' for i in range(self.k)]
+
+    @cached_property
+    def pca_bounds(self):
+        """``(x0, x1, y0, y1)`` extent of the PCA projection."""
+        x, y = self.pca_coords[:, 0], self.pca_coords[:, 1]
+        return float(x.min()), float(x.max()), float(y.min()), float(y.max())
+
+    @cached_property
+    def pca_core_bounds(self):
+        """Extent of the central 99% of the PCA projection on each axis, which outliers would otherwise dwarf."""
+        (x0, y0), (x1, y1) = np.quantile(self.pca_coords, [0.005, 0.995], axis=0)
+        return float(x0), float(x1), float(y0), float(y1)
+
+    @cached_property
+    def pca_centers(self):
+        """Mean PCA position and size of each cluster: arrays ``(k, 2)`` and ``(k,)``."""
+        counts = np.bincount(self.labels, minlength=self.k)
+        centers = np.column_stack([
+            np.bincount(self.labels, weights=self.pca_coords[:, i], minlength=self.k) / np.maximum(counts, 1)
+            for i in range(2)
+        ])
+        return centers, counts
+
+    def window_ids(self, bounds):
+        """Positions of the policies whose PCA coordinates fall inside ``bounds``."""
+        return np.flatnonzero(window_mask(self.pca_coords[:, 0], self.pca_coords[:, 1], bounds))
+
+    def density(self, bounds, shape=RASTER_SHAPE):
+        """Per-cluster :func:`~analytics.charts.density_grid` of the PCA projection over ``bounds``."""
+        # The selection is cached per dataset, so recent grids are kept on it
+        key = (tuple(bounds), tuple(shape))
+        with _density_lock:
+            grids = self.__dict__.setdefault('_density_grids', OrderedDict())
+            if key in grids:
+                grids.move_to_end(key)
+                return grids[key]
+        grid = density_grid(self.pca_coords[:, 0], self.pca_coords[:, 1], self.labels, self.k, bounds, shape)
+        with _density_lock:
+            grids[key] = grid
+            grids.move_to_end(key)
+            while len(grids) > DENSITY_GRIDS_KEPT:
+                grids.popitem(last=False)
+        return grid
+
+
+def stratified_sample(strata, size, seed=42):
+    """Row positions of a sample that keeps each stratum's share of the portfolio."""
+    n = len(strata)
+    if n <= size:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    _, codes = np.unique(strata, return_inverse=True)
+    counts = np.bincount(codes)
+    picks = []
+    for code, count in enumerate(counts):
+        take = max(1, int(round(size * count / n)))
+        members = np.flatnonzero(codes == code)
+        picks.append(rng.choice(members, size=min(take, count), replace=False))
+    return np.sort(np.concatenate(picks))
+
+
+def _make_model(k, minibatch, random_state):
+    if minibatch:
+        return MiniBatchKMeans(n_clusters=k, batch_size=4096, n_init=3, random_state=random_state)
+    return KMeans(n_clusters=k, n_init=10, random_state=random_state)
+
+
+def _evaluate_k(X, sample_idx, k, minibatch, random_state):
+    model = _make_model(k, minibatch, random_state).fit(X)
+    X_sample = X[sample_idx]
+    sample_labels = model.predict(X_sample)
+    silhouette = silhouette_score(X_sample, sample_labels) if len(set(sample_labels)) > 1 else -1.0
+    return k, float(model.inertia_), float(silhouette), model.cluster_centers_
+
+
+def _elbow(k_values, inertias):
+    # Point of the normalised inertia curve furthest below the chord joining its ends
+    x = (np.asarray(k_values) - k_values[0]) / (k_values[-1] - k_values[0])
+    y = np.asarray(inertias)
+    y = (y - y.min()) / (y.max() - y.min()) if y.max() > y.min() else np.zeros_like(y)
+    distance = (1 - x) - y
+    return k_values[int(np.argmax(distance))]
+
+
+def _select(df, features, k_values, criterion, sample_size, random_state, n_jobs):
+    X = df[features].fillna(df[features].mean())
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    strata = (df[STRATIFY_BY].astype(str).to_numpy() if STRATIFY_BY in df.columns
+              else np.zeros(len(df), dtype=np.int8))
+    sample_idx = stratified_sample(strata, sample_size, seed=random_state)
+    minibatch = len(df) > MINIBATCH_THRESHOLD
+
+    # Candidate K values are independent, so each is fitted in its own process
+    results = Parallel(n_jobs=min(n_jobs, len(k_values)) if n_jobs > 0 else n_jobs)(
+        delayed(_evaluate_k)(X_scaled, sample_idx, k, minibatch, random_state) for k in k_values
+    )
+    results.sort(key=lambda result: result[0])
+    inertias = [result[1] for result in results]
+    silhouettes = [result[2] for result in results]
+    if criterion == 'silhouette':
+        k = k_values[int(np.argmax(silhouettes))]
+    else:
+        k = _elbow(k_values, inertias)
+    centers = dict((result[0], result[3]) for result in results)[k]
+
+    labels = pairwise_distances_argmin(X_scaled, centers).astype(np.int8)
+    pca = PCA(n_components=2)
+    pca_coords = pca.fit_transform(X_scaled).astype(np.float32)
+    return ClusterSelection(
+        features=features,
+        k=k,
+        k_values=list(k_values),
+        inertias=inertias,
+        silhouettes=silhouettes,
+        criterion=criterion,
+        centroids=scaler.inverse_transform(centers),
+        labels=labels,
+        pca_coords=pca_coords,
+        explained_variance=pca.explained_variance_ratio_,
+    )
+
+
+def select_clusters(df, features, k_values=K_RANGE, criterion='silhouette',
+                    sample_size=SAMPLE_SIZE, random_state=42, n_jobs=-1, fingerprint=None):
+    """Evaluate each candidate K and return the preferred :class:`ClusterSelection`.
+
+    ``criterion`` is ``'silhouette'`` (scored on a sample stratified by premium
+    band) or ``'elbow'`` on the inertia curve. With a ``fingerprint`` the result
+    is cached in memory and on disk.
+    """
+    if criterion not in CRITERIA:
+        raise ValueError(f'Unknown criterion: {criterion}')
+    features = list(features)
+    k_values = list(k_values)
+
+    def build():
+        return _select(df, features, k_values, criterion, sample_size, random_state, n_jobs)
+
+    if fingerprint is None:
+        return build()
+    key = artifact_key(fingerprint, features, input_signature(df, features), k_values, criterion, sample_size,
+                       random_state, sklearn.__version__)
+    return cached_artifact('kmeans_selection', key, build, fingerprint=fingerprint)
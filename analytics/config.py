@@ -0,0 +1,15 @@
+"""Shared locations and settings for the analytics package."""
+import os
+
+CACHE_DIR = os.environ.get('ANALYTICS_CACHE_DIR', '.analytics_cache')
+
+# DataFrame engines for parsing, derived metrics and the summary cube; results are the same with either
+BACKENDS = ('pandas', 'polars')
+
+
+def dataframe_backend():
+    """Engine selected with ``ANALYTICS_BACKEND`` (read on every call, so a CLI flag can set it)."""
+    backend = os.environ.get('ANALYTICS_BACKEND', 'pandas')
+    if backend not in BACKENDS:
+        raise ValueError(f"ANALYTICS_BACKEND must be one of {', '.join(BACKENDS)}, not {backend!r}")
+    return backend
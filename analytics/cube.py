@@ -0,0 +1,178 @@
+"""Pre-aggregated summary cube answering dashboard group-bys from additive partials."""
+import numpy as np
+import pandas as pd
+
+from analytics.config import dataframe_backend
+from analytics.memo import fingerprint_cache
+
+CUBE_DIMS = ['CL_PBAND', 'ENTRY_YEAR', 'ENTRY_MONTH', 'ENTRY_SEASON', 'POLICY_VINTAGE',
+             'RISK_SEGMENT', 'ADEQUACY_CATEGORY']
+CUBE_MEASURES = ['ANNUAL_PREM', 'RES_GP_PUPS', 'LOSS_RATIO', 'PREMIUM_ADEQUACY']
+# Columns whose non-null count is tracked without sums (e.g. policy counts)
+COUNT_ONLY = ['POL_NUMBER']
+
+# Row-level conditions counted per cell for headline KPIs
+CUBE_FLAGS = {
+    'PROFITABLE': lambda df: df['PREMIUM_ADEQUACY'] > 0,
+    'BREAK_EVEN': lambda df: df['LOSS_RATIO'] <= 1.0,
+    'HIGH_LOSS_RATIO': lambda df: df['LOSS_RATIO'] > 1.5,
+}
+
+ROWS = 'ROWS'
+
+
+def _partial(col, stat):
+    return f'{col}__{stat}'
+
+
+class SummaryCube:
+    """Count, shifted sum and shifted sum of squares per cell of ``CUBE_DIMS``.
+
+    Sums are taken about a per-measure ``shift`` (the dataset mean) so that
+    variances recovered from the partials do not lose precision. Partials are
+    additive: cubes built with the same shift can be merged cell by cell.
+    """
+
+    def __init__(self, cells, dims, measures, counts, flags, shift):
+        self.cells = cells
+        self.dims = dims
+        self.measures = measures
+        self.counts = counts
+        self.flags = flags
+        self.shift = shift
+
+    @property
+    def total_rows(self):
+        return int(self.cells[ROWS].sum())
+
+    def _partials(self, dims):
+        columns = [col for col in self.cells.columns if col not in self.dims]
+        if not dims:
+            return self.cells[columns].sum().to_frame().T
+        return self.cells.groupby(list(dims), observed=True, sort=True)[columns].sum()
+
+    def _stat(self, partials, col, stat):
+        n = partials[_partial(col, 'count')]
+        if stat == 'count':
+            return n.astype('int64')
+        s = partials[_partial(col, 'sum')]
+        shift = self.shift[col]
+        if stat == 'sum':
+            return s + shift * n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = s / n
+            if stat == 'mean':
+                return (mean + shift).where(n > 0)
+            # Sample variance (ddof=1) like pandas
+            ss = partials[_partial(col, 'sumsq')]
+            var = ((ss - s * mean) / (n - 1)).clip(lower=0).where(n > 1)
+        if stat == 'var':
+            return var
+        if stat == 'std':
+            return np.sqrt(var)
+        raise ValueError(f'Unknown statistic: {stat}')
+
+    def rollup(self, dims, spec):
+        """Group-by equivalent of ``df.groupby(dims).agg(spec)`` answered from the cube.
+
+        ``spec`` maps a measure (or a count-only column) to a statistic or a list
+        of statistics among count, sum, mean, var and std. Like pandas, a list in
+        any entry produces ``(column, stat)`` MultiIndex columns.
+        """
+        dims = [dims] if isinstance(dims, str) else list(dims)
+        partials = self._partials(dims)
+        multi = any(isinstance(stats, (list, tuple)) for stats in spec.values())
+        result = {}
+        for col, stats in spec.items():
+            for stat in ([stats] if isinstance(stats, str) else stats):
+                key = (col, stat) if multi else col
+                result[key] = self._stat(partials, col, stat)
+        result = pd.DataFrame(result, index=partials.index)
+        if multi:
+            result.columns = pd.MultiIndex.from_tuples(result.columns)
+        return result
+
+    def total(self, col, stat):
+        """Portfolio-wide statistic, e.g. ``total('ANNUAL_PREM', 'sum')``."""
+        return self._stat(self._partials([]), col, stat).iloc[0]
+
+    def flag_count(self, flag, dims=()):
+        partials = self._partials(list(dims))
+        counts = partials[_partial(flag, 'flag')].astype('int64')
+        return counts.iloc[0] if not dims else counts
+
+    def row_count(self, dims):
+        return self._partials(list(dims))[ROWS].astype('int64')
+
+    def updated(self, added=None, removed=None):
+        """This cube with the rows of cube ``added`` put in and those of ``removed`` taken out.
+
+        Both must be built over the same dims with this cube's ``shift`` (pass
+        ``shift=cube.shift`` to :func:`build_cube`); cells left empty are dropped.
+        """
+        parts = [self.cells]
+        if added is not None:
+            parts.append(added.cells)
+        if removed is not None:
+            negated = removed.cells.copy()
+            partials = [col for col in negated.columns if col not in self.dims]
+            negated[partials] = -negated[partials]
+            parts.append(negated)
+        for col in self.dims:
+            dtypes = [part[col].dtype for part in parts]
+            if isinstance(dtypes[0], pd.CategoricalDtype) and any(dtype != dtypes[0] for dtype in dtypes):
+                # Labels read from the data (e.g. bands) may differ between extracts
+                categories = sorted(set().union(*(dtype.categories for dtype in dtypes)))
+                dtype = pd.CategoricalDtype(pd.Index(categories, dtype=dtypes[0].categories.dtype),
+                                            ordered=dtypes[0].ordered)
+                parts = [part.assign(**{col: part[col].astype(dtype)}) for part in parts]
+        cells = pd.concat(parts, ignore_index=True)
+        if self.dims:
+            cells = cells.groupby(self.dims, observed=True, dropna=False, sort=False).sum().reset_index()
+        else:
+            cells = cells.sum().to_frame().T
+        cells = cells[cells[ROWS] > 0].reset_index(drop=True)
+        return SummaryCube(cells, self.dims, self.measures, self.counts, self.flags, self.shift)
+
+
+def build_cube(df, shift=None):
+    """Aggregate ``df`` into a :class:`SummaryCube` in one group-by pass."""
+    dims = [col for col in CUBE_DIMS if col in df.columns]
+    measures = [col for col in CUBE_MEASURES if col in df.columns]
+    counts = [col for col in COUNT_ONLY if col in df.columns]
+    flags = list(CUBE_FLAGS)
+    if shift is None:
+        shift = {col: float(np.nan_to_num(df[col].mean(), posinf=0.0, neginf=0.0)) for col in measures}
+
+    partials = {ROWS: np.ones(len(df), dtype=np.int64)}
+    for col in measures:
+        centered = df[col].to_numpy(dtype=np.float64, na_value=np.nan) - shift[col]
+        valid = ~np.isnan(centered)
+        partials[_partial(col, 'count')] = valid.astype(np.int64)
+        partials[_partial(col, 'sum')] = centered
+        partials[_partial(col, 'sumsq')] = centered * centered
+    for col in counts:
+        partials[_partial(col, 'count')] = df[col].notna().to_numpy(dtype=np.int64)
+    for flag in flags:
+        partials[_partial(flag, 'flag')] = CUBE_FLAGS[flag](df).to_numpy(dtype=np.int64)
+
+    if dataframe_backend() == 'polars':
+        from analytics.polars_backend import group_cells
+        cells = group_cells(partials, {col: df[col] for col in dims})
+        return SummaryCube(cells, dims, measures, counts, flags, shift)
+
+    frame = pd.DataFrame(partials, index=df.index)
+    for col in dims:
+        frame[col] = df[col]
+    # NaN sums are skipped, which matches pandas' NaN-skipping aggregations
+    if dims:
+        cells = frame.groupby(dims, observed=True, dropna=False, sort=False).sum().reset_index()
+    else:
+        cells = frame.sum().to_frame().T
+    return SummaryCube(cells, dims, measures, counts, flags, shift)
+
+
+@fingerprint_cache(maxsize=4)
+def summary_cube(df):
+    """Summary cube for ``df``, cached per ``fingerprint=`` when one is given."""
+    return build_cube(df)
@@ -0,0 +1,105 @@
+"""Per-policy derived metrics, computed in one vectorised pass per dataset."""
+import numpy as np
+import pandas as pd
+
+from analytics.config import dataframe_backend
+from analytics.memo import fingerprint_cache
+
+VALUATION_YEAR = 2024
+EPSILON = 1e-6
+
+SEASON_LABELS = ['Q1', 'Q2', 'Q3', 'Q4']
+# Indexed by ENTRY_MONTH (0 is unused); months 10-12 fall in Q4
+MONTH_TO_SEASON = np.array([-1, 0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3], dtype=np.int8)
+
+RISK_SEGMENT_BINS = np.array([0, 0.5, 1.0, 1.5, np.inf])
+RISK_SEGMENT_LABELS = ['Low Risk', 'Medium Risk', 'High Risk', 'Critical Risk']
+
+ADEQUACY_BINS = np.array([-np.inf, -10000, 0, 10000, np.inf])
+ADEQUACY_LABELS = ['Highly Inadequate', 'Inadequate', 'Adequate', 'Highly Adequate']
+
+DERIVED_COLS = [
+    'LOSS_RATIO', 'PREMIUM_ADEQUACY', 'EXPECTED_VS_ACTUAL', 'RISK_SCORE',
+    'COMBINED_RISK_SCORE', 'RISK_SEGMENT', 'ADEQUACY_CATEGORY',
+    'POLICY_VINTAGE', 'ENTRY_SEASON',
+]
+
+
+def _float_column(df, col, dtype):
+    return df[col].to_numpy(dtype=dtype, na_value=np.nan)
+
+
+def _bin_codes(values, bins):
+    # Same intervals as pd.cut(right=True): (b0, b1], (b1, b2], ...; anything else is -1
+    codes = np.searchsorted(bins, values, side='left').astype(np.int8) - 1
+    codes[(codes < 0) | (codes >= len(bins) - 1)] = -1
+    return codes
+
+
+def policy_measures(df, float32=False):
+    """Per-policy ratios as arrays, with risk segment and adequacy category as bin codes."""
+    dtype = np.float32 if float32 else np.float64
+    res = _float_column(df, 'RES_GP_PUPS', dtype)
+    prem = _float_column(df, 'PREM_GP_PUPS', dtype)
+    annual = _float_column(df, 'ANNUAL_PREM', dtype)
+    act = _float_column(df, 'ACT_GP_PUP', dtype)
+    exp = _float_column(df, 'EXP_GP_PUP', dtype)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        loss_ratio = res / (prem + dtype(EPSILON))
+        adequacy = prem - res
+        expected_vs_actual = act / (exp + dtype(EPSILON))
+        risk_score = res / (annual + dtype(EPSILON))
+        risk_score *= 100
+
+        # Weighted blend used for risk segmentation, built in place
+        combined = loss_ratio * dtype(0.4)
+        combined += risk_score * dtype(0.3 / 100)
+        combined += expected_vs_actual * dtype(0.3)
+
+    return {
+        'LOSS_RATIO': loss_ratio,
+        'PREMIUM_ADEQUACY': adequacy,
+        'EXPECTED_VS_ACTUAL': expected_vs_actual,
+        'RISK_SCORE': risk_score,
+        'COMBINED_RISK_SCORE': combined,
+        'RISK_SEGMENT': _bin_codes(combined, RISK_SEGMENT_BINS),
+        'ADEQUACY_CATEGORY': _bin_codes(adequacy, ADEQUACY_BINS),
+    }
+
+
+def compute_derived(df, float32=False):
+    """Return a frame holding only the derived columns for ``df``."""
+    if dataframe_backend() == 'polars':
+        from analytics.polars_backend import policy_measures as measures
+    else:
+        measures = policy_measures
+    columns = measures(df, float32=float32)
+    columns['RISK_SEGMENT'] = pd.Categorical.from_codes(columns['RISK_SEGMENT'], categories=RISK_SEGMENT_LABELS,
+                                                        ordered=True)
+    columns['ADEQUACY_CATEGORY'] = pd.Categorical.from_codes(columns['ADEQUACY_CATEGORY'],
+                                                             categories=ADEQUACY_LABELS, ordered=True)
+
+    if 'ENTRY_YEAR' in df.columns:
+        columns['POLICY_VINTAGE'] = VALUATION_YEAR - df['ENTRY_YEAR']
+    if 'ENTRY_MONTH' in df.columns:
+        months = df['ENTRY_MONTH'].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = np.isin(months, np.arange(1, 13))
+        season_codes = np.full(len(months), -1, dtype=np.int8)
+        season_codes[valid] = MONTH_TO_SEASON[months[valid].astype(np.int8)]
+        columns['ENTRY_SEASON'] = pd.Categorical.from_codes(season_codes, categories=SEASON_LABELS)
+
+    return pd.DataFrame(columns, index=df.index)
+
+
+@fingerprint_cache(maxsize=4)
+def derive_metrics(df, float32=False):
+    """Derived columns for ``df``, cached per ``fingerprint=`` when one is given."""
+    return compute_derived(df, float32=float32)
+
+
+def with_derived(df, fingerprint=None, float32=False):
+    """Return ``df`` with the derived columns appended (replacing any stale ones)."""
+    derived = derive_metrics(df, fingerprint=fingerprint, float32=float32)
+    base = df.drop(columns=[col for col in derived.columns if col in df.columns])
+    return pd.concat([base, derived], axis=1)
@@ -0,0 +1,337 @@
+"""Headless implementations of the app's analyses, usable without Streamlit."""
+from functools import cached_property
+
+import pandas as pd
+
+from analytics.charts import HISTOGRAM_BINS, column_histogram
+from analytics.cube import summary_cube
+from analytics.filtering import policy_index
+from analytics.memo import fingerprint_cache
+from analytics.sketch import segment_sketches
+
+# The sklearn-backed modules (anomaly, clustering, registry) are imported inside
+# the analyses that need them, so the light analyses start without sklearn.
+
+
+@fingerprint_cache(maxsize=16)
+def count_above_quantile(df, col, q):
+    """Number of values of ``df[col]`` above its quantile ``q``, cached per ``fingerprint=`` when one is given."""
+    values = df[col]
+    return int((values > values.quantile(q)).sum())
+
+
+class AnalysisContext:
+    """A dataset (with derived metrics) and its fingerprint; shared structures are built lazily.
+
+    The whole-portfolio queries below are also answered by
+    ``analytics.outofcore.OutOfCoreContext``, which keeps the data on disk.
+    """
+
+    out_of_core = False
+
+    def __init__(self, df, fingerprint=None):
+        self.df = df
+        self.fingerprint = fingerprint
+
+    @cached_property
+    def cube(self):
+        return summary_cube(self.df, fingerprint=self.fingerprint)
+
+    @cached_property
+    def sketches(self):
+        return segment_sketches(self.df, fingerprint=self.fingerprint)
+
+    @cached_property
+    def index(self):
+        return policy_index(self.df, fingerprint=self.fingerprint)
+
+    @property
+    def n_rows(self):
+        return len(self.df)
+
+    def has(self, *cols):
+        return all(col in self.df.columns for col in cols)
+
+    def count_above_quantile(self, col, q):
+        # Exact, and computed once per dataset: a sketch can be off by a whole bucket of values tied at the quantile
+        return count_above_quantile(self.df, col, q, fingerprint=self.fingerprint)
+
+    def histogram(self, col, bins=HISTOGRAM_BINS):
+        return column_histogram(self.df, col, bins, fingerprint=self.fingerprint)
+
+    def value_counts(self, col):
+        return self.df[col].value_counts(sort=False)
+
+    def labels(self, col):
+        return self.index.labels(col)
+
+
+class AnalysisResult:
+    """Named tables and scalar metrics from one analysis.
+
+    ``extras`` carries objects only an interactive caller needs (per-policy
+    scores, fitted models); they are not written by the batch runner.
+    """
+
+    def __init__(self, name, tables=None, metrics=None, extras=None):
+        self.name = name
+        self.tables = tables or {}
+        self.metrics = metrics or {}
+        self.extras = extras or {}
+
+
+def headline_kpis(ctx):
+    cube = ctx.cube
+    return {
+        'total_policies': cube.total_rows,
+        'total_premium': cube.total('ANNUAL_PREM', 'sum'),
+        'avg_loss_ratio': cube.total('LOSS_RATIO', 'mean'),
+        'profitable_count': cube.flag_count('PROFITABLE'),
+        'high_risk_count': ctx.count_above_quantile('RISK_SCORE', 0.9),
+    }
+
+
+def executive_dashboard(ctx):
+    cube = ctx.cube
+    tables = {}
+    if ctx.has('CL_PBAND'):
+        tables['loss_by_band'] = cube.rollup('CL_PBAND', {
+            'LOSS_RATIO': 'mean',
+            'POL_NUMBER': 'count',
+            'ANNUAL_PREM': 'sum'
+        }).reset_index()
+    metrics = {
+        'profitable_ratio': cube.flag_count('PROFITABLE') / cube.total_rows,
+        'high_loss_ratio_count': cube.flag_count('HIGH_LOSS_RATIO'),
+        'avg_premium_adequacy': cube.total('PREMIUM_ADEQUACY', 'mean'),
+        'avg_loss_ratio': cube.total('LOSS_RATIO', 'mean'),
+    }
+    return AnalysisResult('executive_dashboard', tables, metrics)
+
+
+def risk_segmentation(ctx):
+    cube = ctx.cube
+    risk_dist = cube.row_count(['RISK_SEGMENT']).reset_index()
+    risk_dist.columns = ['Risk_Segment', 'Count']
+    risk_analysis = cube.rollup('RISK_SEGMENT', {
+        'ANNUAL_PREM': ['count', 'sum', 'mean'],
+        'LOSS_RATIO': 'mean',
+        'PREMIUM_ADEQUACY': 'mean',
+        'RES_GP_PUPS': 'sum'
+    }).round(2)
+    critical_risk_count = int(risk_analysis[('ANNUAL_PREM', 'count')].get('Critical Risk', 0))
+    metrics = {
+        'critical_risk_count': critical_risk_count,
+        'high_risk_premium': risk_analysis[('ANNUAL_PREM', 'sum')].reindex(['High Risk', 'Critical Risk']).sum(),
+        'critical_risk_share': critical_risk_count / cube.total_rows,
+    }
+    return AnalysisResult('risk_segmentation', {'risk_distribution': risk_dist, 'risk_analysis': risk_analysis},
+                          metrics)
+
+
+def premium_loss(ctx):
+    cube = ctx.cube
+    adequacy_dist = cube.row_count(['ADEQUACY_CATEGORY']).reset_index()
+    adequacy_dist.columns = ['Category', 'Count']
+    tables = {'adequacy_distribution': adequacy_dist}
+    if ctx.has('CL_PBAND'):
+        tables['band_analysis'] = cube.rollup('CL_PBAND', {
+            'ANNUAL_PREM': ['sum', 'mean', 'count'],
+            'RES_GP_PUPS': ['sum', 'mean'],
+            'LOSS_RATIO': 'mean',
+            'PREMIUM_ADEQUACY': ['mean', 'sum']
+        }).round(2)
+        # Quartiles and whiskers per band for a box plot, from the bands' quantile sketches
+        tables['loss_ratio_by_band'] = ctx.sketches.box_summary('LOSS_RATIO', 'CL_PBAND').reset_index()
+    metrics = {
+        'total_profit': cube.total('PREMIUM_ADEQUACY', 'sum'),
+        'profitable_policies': cube.flag_count('PROFITABLE'),
+        'profitable_share': cube.flag_count('PROFITABLE') / cube.total_rows,
+        'avg_loss_ratio': cube.total('LOSS_RATIO', 'mean'),
+        'break_even_count': cube.flag_count('BREAK_EVEN'),
+    }
+    return AnalysisResult('premium_loss', tables, metrics)
+
+
+def temporal_patterns(ctx):
+    cube = ctx.cube
+    tables = {}
+    metrics = {}
+    if ctx.has('ENTRY_YEAR', 'ENTRY_MONTH'):
+        tables['yearly_trends'] = cube.rollup('ENTRY_YEAR', {
+            'POL_NUMBER': 'count',
+            'ANNUAL_PREM': 'sum',
+            'LOSS_RATIO': 'mean',
+            'RES_GP_PUPS': 'sum'
+        }).reset_index()
+        tables['monthly_trends'] = cube.rollup('ENTRY_MONTH', {
+            'POL_NUMBER': 'count',
+            'ANNUAL_PREM': 'mean',
+            'LOSS_RATIO': 'mean'
+        }).reset_index()
+        if ctx.has('ENTRY_SEASON'):
+            tables['quarterly_analysis'] = cube.rollup('ENTRY_SEASON', {
+                'POL_NUMBER': 'count',
+                'ANNUAL_PREM': ['sum', 'mean'],
+                'LOSS_RATIO': 'mean',
+                'PREMIUM_ADEQUACY': 'mean'
+            }).round(2)
+
+        yearly, monthly = tables['yearly_trends'], tables['monthly_trends']
+        metrics['latest_year_loss_ratio'] = yearly.loc[yearly['ENTRY_YEAR'].idxmax(), 'LOSS_RATIO']
+        metrics['best_month'] = monthly.loc[monthly['LOSS_RATIO'].idxmin(), 'ENTRY_MONTH']
+        metrics['worst_month'] = monthly.loc[monthly['LOSS_RATIO'].idxmax(), 'ENTRY_MONTH']
+    if ctx.has('POLICY_VINTAGE'):
+        tables['vintage_analysis'] = cube.rollup('POLICY_VINTAGE', {
+            'LOSS_RATIO': 'mean',
+            'ANNUAL_PREM': 'sum',
+            'POL_NUMBER': 'count'
+        }).reset_index()
+    return AnalysisResult('temporal_patterns', tables, metrics)
+
+
+def anomaly_detection(ctx, contamination=0.1, n_estimators=100):
+    from analytics.anomaly import ANOMALY_FEATURES, fit_detector
+
+    df = ctx.df
+    features = [col for col in ANOMALY_FEATURES if col in df.columns]
+    if len(features) < 2:
+        return AnalysisResult('anomaly_detection')
+
+    detector = fit_detector(df, features, n_estimators=n_estimators, fingerprint=ctx.fingerprint)
+    threshold = detector.threshold(contamination)
+    is_anomaly = detector.scores < threshold
+
+    flagged = df[is_anomaly].assign(ANOMALY_SCORE=detector.scores[is_anomaly])
+    top_anomalies = flagged.nlargest(10, 'LOSS_RATIO')[
+        ['POL_NUMBER', 'ANNUAL_PREM', 'LOSS_RATIO', 'RISK_SCORE', 'ANOMALY_SCORE']
+    ].round(2)
+    anomaly_count = int(is_anomaly.sum())
+    metrics = {
+        'threshold': threshold,
+        'anomaly_count': anomaly_count,
+        'anomaly_share': anomaly_count / len(df),
+        'avg_anomaly_loss_ratio': flagged['LOSS_RATIO'].mean(),
+        'premium_at_risk': flagged['ANNUAL_PREM'].sum(),
+    }
+    return AnalysisResult('anomaly_detection', {'top_anomalies': top_anomalies}, metrics,
+                          {'detector': detector, 'scores': detector.scores, 'is_anomaly': is_anomaly})
+
+
+def advanced_clustering(ctx, criterion='silhouette'):
+    from analytics.clustering import CLUSTER_FEATURES, select_clusters
+
+    df = ctx.df
+    features = [col for col in CLUSTER_FEATURES if col in df.columns]
+    if len(features) < 2:
+        return AnalysisResult('advanced_clustering')
+
+    selection = select_clusters(df, features, criterion=criterion, fingerprint=ctx.fingerprint)
+    cluster_labels = pd.Categorical.from_codes(selection.labels, categories=selection.label_names)
+    clustered = df[['ANNUAL_PREM', 'LOSS_RATIO', 'RISK_SCORE', 'PREMIUM_ADEQUACY']].assign(CLUSTER_LABEL=cluster_labels)
+
+    cluster_dist = clustered['CLUSTER_LABEL'].value_counts().reset_index()
+    cluster_dist.columns = ['Cluster', 'Count']
+    cluster_analysis = clustered.groupby('CLUSTER_LABEL', observed=True).agg({
+        'ANNUAL_PREM': ['count', 'mean', 'sum'],
+        'LOSS_RATIO': 'mean',
+        'RISK_SCORE': 'mean',
+        'PREMIUM_ADEQUACY': 'mean'
+    }).round(2)
+    centroids = pd.DataFrame(selection.centroids, columns=selection.features,
+                             index=pd.Index(selection.label_names, name='CLUSTER_LABEL')).round(2)
+    k_selection = pd.DataFrame({'K': selection.k_values, 'INERTIA': selection.inertias,
+                                'SILHOUETTE': selection.silhouettes})
+    tables = {
+        'k_selection': k_selection,
+        'cluster_distribution': cluster_dist,
+        'cluster_analysis': cluster_analysis,
+        'centroids': centroids,
+    }
+    metrics = {
+        'chosen_k': selection.k,
+        'criterion': criterion,
+        'best_cluster': cluster_analysis[('LOSS_RATIO', 'mean')].idxmin(),
+        'worst_cluster': cluster_analysis[('LOSS_RATIO', 'mean')].idxmax(),
+    }
+    return AnalysisResult('advanced_clustering', tables, metrics,
+                          {'selection': selection, 'cluster_labels': cluster_labels})
+
+
+def predictive_analytics(ctx, model_id=None, registry=None):
+    """Train (or reuse) the claims model, or score the data with registered ``model_id``."""
+    from analytics.registry import (PREDICTIVE_FEATURES, TARGET, ModelRegistry, feature_importance_frame,
+                                    holdout_split, model_inputs, regression_metrics, train_or_reuse)
+
+    df = ctx.df
+    features = [col for col in PREDICTIVE_FEATURES if col in df.columns]
+    if len(features) < 2 or TARGET not in df.columns:
+        return AnalysisResult('predictive_analytics')
+
+    registry = registry or ModelRegistry()
+    if model_id is None:
+        entry, model = train_or_reuse(df, features, target=TARGET, fingerprint=ctx.fingerprint,
+                                      registry=registry)
+        _, X_test, _, y_test = holdout_split(df, features, TARGET)
+        evaluated_on = 'test data'
+    else:
+        entry, model = registry.get(model_id), registry.load(model_id)
+        if entry is None or model is None:
+            raise KeyError(f'Model {model_id} is not in the registry')
+        X_test, y_test = model_inputs(df, entry['features'], TARGET)
+        evaluated_on = 'the current extract'
+
+    y_pred = model.predict(X_test)
+    metrics = regression_metrics(y_test, y_pred)
+    feature_importance = feature_importance_frame(entry)
+    metrics.update({
+        'model_id': entry['model_id'],
+        'evaluated_on': evaluated_on,
+        'most_important_feature': feature_importance.iloc[-1]['Feature'],
+    })
+    return AnalysisResult('predictive_analytics', {'feature_importance': feature_importance}, metrics,
+                          {'entry': entry, 'y_true': y_test, 'y_pred': y_pred})
+
+
+def policy_explorer(ctx, band='All', max_loss_ratio=5.0, min_premium=0):
+    equals = {'CL_PBAND': band} if band != 'All' else {}
+    ranges = {'LOSS_RATIO': (None, max_loss_ratio), 'ANNUAL_PREM': (min_premium, None)}
+    display_cols = [col for col in ['POL_NUMBER', 'ANNUAL_PREM', 'LOSS_RATIO', 'PREMIUM_ADEQUACY', 'RISK_SCORE']
+                    if ctx.has(col)]
+    tables = {}
+    if ctx.out_of_core:
+        # Filtered in SQL; only the preview rows and the summary statistics are read back
+        dataset = ctx.dataset
+        where, params = dataset.where(equals, ranges)
+        ids = None
+        matched = int(dataset.query(f'SELECT count(*) AS n FROM policies WHERE {where}', params)['n'].iloc[0])
+        if display_cols:
+            tables['preview'] = dataset.query(f'SELECT {", ".join(display_cols)} FROM policies WHERE {where} '
+                                              f'LIMIT 100', params).round(2)
+            tables['summary'] = dataset.describe(display_cols[1:], where, params).round(2)
+    else:
+        df = ctx.df
+        ids = ctx.index.query(equals=equals, ranges=ranges)
+        matched = len(ids)
+        if display_cols:
+            tables['preview'] = df[display_cols].take(ids[:100]).round(2)
+            tables['summary'] = df[display_cols[1:]].take(ids).describe().round(2)
+    return AnalysisResult('policy_explorer', tables, {'matched_policies': matched, 'total_policies': ctx.n_rows},
+                          {'ids': ids, 'display_cols': display_cols, 'equals': equals, 'ranges': ranges})
+
+
+# Analysis name -> (title shown in the app, function)
+ANALYSES = {
+    'executive_dashboard': ('Executive Dashboard', executive_dashboard),
+    'risk_segmentation': ('Risk Segmentation Analysis', risk_segmentation),
+    'premium_loss': ('Premium & Loss Analysis', premium_loss),
+    'temporal_patterns': ('Temporal Patterns', temporal_patterns),
+    'anomaly_detection': ('Anomaly Detection', anomaly_detection),
+    'advanced_clustering': ('Advanced Clustering', advanced_clustering),
+    'predictive_analytics': ('Predictive Analytics', predictive_analytics),
+    'policy_explorer': ('Detailed Policy Explorer', policy_explorer),
+}
+
+
+def run_analysis(name, ctx, **options):
+    return ANALYSES[name][1](ctx, **options)
@@ -0,0 +1,58 @@
+"""Chunked, on-demand export of policy rows as CSV, gzip CSV or Parquet."""
+import tempfile
+import zlib
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EXPORT_CHUNK_ROWS = 100_000
+
+# Format -> (file extension, MIME type, label)
+EXPORT_FORMATS = {
+    'csv': ('.csv', 'text/csv', 'CSV'),
+    'csv.gz': ('.csv.gz', 'application/gzip', 'CSV (gzip)'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet', 'Parquet'),
+}
+
+
+def _chunks(df, ids, columns, chunk_rows):
+    source = df if columns is None else df[columns]
+    ids = np.arange(len(df)) if ids is None else ids
+    # Always yield at least one (possibly empty) chunk so the header is written
+    for start in range(0, max(len(ids), 1), chunk_rows):
+        yield start == 0, source.take(ids[start:start + chunk_rows])
+
+
+def iter_csv(df, ids=None, columns=None, compress=False, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield the CSV export of rows ``ids`` as byte chunks, gzip-compressed if asked."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    for first, chunk in _chunks(df, ids, columns, chunk_rows):
+        data = chunk.to_csv(index=False, header=first).encode()
+        yield compressor.compress(data) if compressor else data
+    if compressor:
+        yield compressor.flush()
+
+
+def write_parquet(f, df, ids=None, columns=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    writer = None
+    for _, chunk in _chunks(df, ids, columns, chunk_rows):
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(f, table.schema)
+        writer.write_table(table)
+    writer.close()
+
+
+def export_file(df, ids=None, fmt='csv', columns=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write the export chunk by chunk to an anonymous temp file and return it rewound."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+    f = tempfile.TemporaryFile()
+    if fmt == 'parquet':
+        write_parquet(f, df, ids, columns, chunk_rows)
+    else:
+        for data in iter_csv(df, ids, columns, compress=fmt == 'csv.gz', chunk_rows=chunk_rows):
+            f.write(data)
+    f.seek(0)
+    return f
@@ -0,0 +1,123 @@
+"""Index-backed row filtering for the policy explorer."""
+import numpy as np
+import pandas as pd
+
+from analytics.memo import fingerprint_cache
+
+RANGE_COLS = ['LOSS_RATIO', 'ANNUAL_PREM']
+EQUALITY_COLS = ['CL_PBAND']
+# Above this share of the book a plain column scan beats probing an index
+SCAN_FRACTION = 0.125
+
+
+class PolicyIndex:
+    """Sorted value indexes for range predicates and row-id lists for equality predicates.
+
+    Queries return sorted row positions, so callers only materialise the rows
+    they actually display or summarise.
+    """
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self._values = {}
+        self._sorted = {}
+        for col in RANGE_COLS:
+            if col not in df.columns:
+                continue
+            values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            order = np.argsort(values, kind='stable')
+            # NaNs sort last; they never satisfy a range predicate
+            n_valid = int(np.count_nonzero(~np.isnan(values)))
+            self._values[col] = values
+            self._sorted[col] = (order[:n_valid], values[order[:n_valid]])
+
+        self._codes = {}
+        self._labels = {}
+        self._members = {}
+        for col in EQUALITY_COLS:
+            if col not in df.columns:
+                continue
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                codes, labels = values.cat.codes.to_numpy(), list(values.cat.categories)
+            else:
+                codes, uniques = pd.factorize(values, sort=True)
+                labels = list(uniques)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+            self._codes[col] = codes
+            self._labels[col] = {label: code for code, label in enumerate(labels)}
+            # Stable sort keeps each label's row ids in ascending order
+            self._members[col] = [order[bounds[code]:bounds[code + 1]] for code in range(len(labels))]
+
+    def labels(self, col):
+        return [label for label, code in self._labels.get(col, {}).items() if len(self._members[col][code])]
+
+    def _range_bounds(self, col, low, high):
+        _, values = self._sorted[col]
+        start = 0 if low is None else np.searchsorted(values, low, side='left')
+        stop = len(values) if high is None else np.searchsorted(values, high, side='right')
+        return start, max(start, stop)
+
+    def _range_mask(self, col, ids, low, high):
+        values = self._values[col] if ids is None else self._values[col][ids]
+        mask = ~np.isnan(values)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+
+    def query(self, equals=None, ranges=None):
+        """Row positions matching ``equals`` ({col: label}) and ``ranges`` ({col: (low, high)}).
+
+        Range bounds are inclusive and either may be ``None``. The most selective
+        predicate is answered from its index; the rest are checked only on its rows.
+        """
+        equals = equals or {}
+        ranges = ranges or {}
+
+        # Size every predicate from its index without touching the rows
+        candidates = []
+        for col, label in equals.items():
+            code = self._labels[col].get(label)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            candidates.append((len(self._members[col][code]), 'equals', col))
+        for col, (low, high) in ranges.items():
+            start, stop = self._range_bounds(col, low, high)
+            candidates.append((stop - start, 'range', col))
+        if not candidates:
+            return np.arange(self.n_rows)
+        size, kind, col = min(candidates, key=lambda candidate: candidate[0])
+
+        if size > self.n_rows * SCAN_FRACTION:
+            # Unselective filters: one vectorised pass over the column arrays
+            mask = np.ones(self.n_rows, dtype=bool)
+            for eq_col, label in equals.items():
+                mask &= self._codes[eq_col] == self._labels[eq_col][label]
+            for range_col, (low, high) in ranges.items():
+                mask &= self._range_mask(range_col, None, low, high)
+            return np.flatnonzero(mask)
+
+        if kind == 'equals':
+            ids = self._members[col][self._labels[col][equals[col]]]
+        else:
+            order, _ = self._sorted[col]
+            start, stop = self._range_bounds(col, *ranges[col])
+            ids = np.sort(order[start:stop])
+
+        # Intersect with the remaining predicates by probing only the candidate rows
+        for eq_col, label in equals.items():
+            if (kind, col) != ('equals', eq_col):
+                ids = ids[self._codes[eq_col][ids] == self._labels[eq_col][label]]
+        for range_col, (low, high) in ranges.items():
+            if (kind, col) != ('range', range_col):
+                ids = ids[self._range_mask(range_col, ids, low, high)]
+        return ids
+
+
+@fingerprint_cache(maxsize=4)
+def policy_index(df):
+    """:class:`PolicyIndex` for ``df``, cached per ``fingerprint=`` when one is given."""
+    return PolicyIndex(df)
@@ -0,0 +1,142 @@
+"""Compact in-memory representation of a dataset, and a per-column report of what it saves.
+
+The schema already reads rating factors as categories and years and months as
+narrow integers. :func:`compact_frame` goes further on the loaded frame:
+
+- the analytic ratios in ``FLOAT32_COLUMNS`` are held as float32 (seven
+  significant digits, far beyond the two decimals they are reported to);
+  other floats, such as amounts, only when every value converts exactly;
+- integers are narrowed to the smallest type that holds their range;
+- strings repeated across policies (labels) are dictionary-encoded as
+  categories, and unique ones such as ``POL_NUMBER`` use 32-bit offsets
+  instead of the default 64-bit ones.
+
+:func:`footprint_report` compares each column with its size at pandas'
+default widths (float64, int64 and object strings) and as loaded.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Derived ratios and scores, held at single precision
+FLOAT32_COLUMNS = ['LOSS_RATIO', 'EXPECTED_VS_ACTUAL', 'RISK_SCORE', 'COMBINED_RISK_SCORE']
+# Strings with at most this many distinct values per row are stored as categories
+CATEGORY_SHARE = 0.5
+# Offsets of pyarrow's ``string`` type are 32-bit
+MAX_STRING_BYTES = 2 ** 31 - 1
+
+REPORT_COLUMNS = ['Column', 'Default dtype', 'Loaded dtype', 'Compact dtype', 'Default MB', 'Loaded MB',
+                  'Compact MB']
+
+_NULLABLE_INTS = ['Int8', 'Int16', 'Int32', 'Int64']
+_INTS = ['int8', 'int16', 'int32', 'int64']
+
+
+def _is_string(series):
+    return pd.api.types.is_string_dtype(series.dtype) and not isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def _compact_float(series, force):
+    if series.dtype != np.float64:
+        return series
+    narrowed = series.astype(np.float32)
+    if force:
+        return narrowed
+    values = series.to_numpy()
+    widened = narrowed.to_numpy(dtype=np.float64)
+    exact = (widened == values) | (np.isnan(values) & np.isnan(widened))
+    return narrowed if exact.all() else series
+
+
+def _compact_int(series):
+    nullable = isinstance(series.dtype, pd.api.extensions.ExtensionDtype)
+    if series.isna().all():
+        return series
+    low, high = series.min(), series.max()
+    for name, numpy_name in zip(_NULLABLE_INTS if nullable else _INTS, _INTS):
+        info = np.iinfo(numpy_name)
+        if info.min <= low and high <= info.max:
+            return series if name == str(series.dtype) else series.astype(name)
+    return series
+
+
+def _compact_string(series):
+    n_unique = series.nunique(dropna=True)
+    if n_unique <= CATEGORY_SHARE * max(len(series), 1):
+        return series.astype('category')
+    values = pa.array(series.array)
+    if values.nbytes > MAX_STRING_BYTES:
+        return series
+    return pd.Series(values.cast(pa.string()), index=series.index, name=series.name,
+                     dtype=pd.ArrowDtype(pa.string()))
+
+
+def compact_column(series):
+    """``series`` in its most compact representation that keeps its values."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(dtype):
+        return series
+    if pd.api.types.is_float_dtype(dtype):
+        return _compact_float(series, force=series.name in FLOAT32_COLUMNS)
+    if pd.api.types.is_integer_dtype(dtype):
+        return _compact_int(series)
+    if _is_string(series):
+        return _compact_string(series)
+    return series
+
+
+def compact_frame(df):
+    """``df`` with every column in its compact representation; unchanged columns are shared, not copied."""
+    return pd.DataFrame({col: compact_column(df[col]) for col in df.columns}, index=df.index)
+
+
+def _object_bytes(series):
+    # Pointer plus Python object per value, as pandas' memory_usage(deep=True) counts an object column
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        sizes = np.array([sys.getsizeof(str(label)) for label in series.cat.categories] + [sys.getsizeof(np.nan)])
+        counts = np.bincount(np.where(codes < 0, len(sizes) - 1, codes), minlength=len(sizes))
+        return 8 * len(series) + int(counts @ sizes)
+    values = pa.array(series.array)
+    n_null = values.null_count
+    if pc.all(pc.string_is_ascii(values)).as_py() is not False:
+        # An ASCII str object is a fixed header plus one byte per character
+        text = int(pc.sum(pc.binary_length(values)).as_py() or 0)
+        return 8 * len(series) + (len(values) - n_null) * sys.getsizeof('') + text + n_null * sys.getsizeof(np.nan)
+    return 8 * len(series) + sum(sys.getsizeof(value) for value in series.astype(object))
+
+
+def default_width(series):
+    """``(dtype, bytes)`` of ``series`` at pandas' default widths: 8-byte numbers and object strings."""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool', len(series)
+    if isinstance(dtype, pd.CategoricalDtype):
+        if pd.api.types.is_numeric_dtype(dtype.categories.dtype):
+            return 'float64', 8 * len(series)
+        return 'object', _object_bytes(series)
+    if pd.api.types.is_integer_dtype(dtype):
+        return ('float64' if series.hasnans else 'int64'), 8 * len(series)
+    if pd.api.types.is_float_dtype(dtype):
+        return 'float64', 8 * len(series)
+    if _is_string(series):
+        return 'object', _object_bytes(series)
+    return str(dtype), int(series.memory_usage(deep=True, index=False))
+
+
+def footprint_report(loaded, compact):
+    """Per-column sizes of ``loaded`` at default widths, as loaded and as ``compact``, with a total row."""
+    rows = []
+    for col in loaded.columns:
+        default_dtype, default_bytes = default_width(loaded[col])
+        rows.append([col, default_dtype, str(loaded[col].dtype), str(compact[col].dtype), default_bytes,
+                     loaded[col].memory_usage(deep=True, index=False),
+                     compact[col].memory_usage(deep=True, index=False)])
+    report = pd.DataFrame(rows, columns=REPORT_COLUMNS)
+    sizes = ['Default MB', 'Loaded MB', 'Compact MB']
+    report.loc[len(report)] = ['Total', '', '', ''] + [report[col].sum() for col in sizes]
+    report[sizes] = (report[sizes] / (1024 * 1024)).round(2)
+    return report
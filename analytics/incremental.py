@@ -0,0 +1,314 @@
+"""Incremental revaluation: diff an extract against a stored valuation by ``POL_NUMBER``.
+
+Only inserted and updated policies get their derived metrics computed; the
+others are carried over from the previous valuation. The summary cube and
+quantile sketches are updated by taking out the old rows of removed and
+updated policies and putting in the new rows of inserted and updated ones, so
+past reading and hashing the extract, a monthly refresh computes in
+proportion to the change rather than to the book. :func:`movement_report`
+summarises what moved between the two valuations.
+
+Persisting is not incremental: :meth:`ValuationStore.save` writes each
+valuation whole, so every refresh still writes (and a cold load still reads)
+the full book on disk. Saving only the changed ``POL_NUMBER`` rows against a
+base valuation would need those chains to survive the index dropping old
+slots, so it is left until that write dominates the ``ingest:revalue`` stage.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from analytics.config import CACHE_DIR
+from analytics.cube import build_cube, summary_cube
+from analytics.derived import VALUATION_YEAR, compute_derived, with_derived
+from analytics.engine import AnalysisResult
+from analytics.schema import POLICY_SCHEMA
+from analytics.sketch import build_sketches, segment_sketches
+from analytics.shared import frame_bytes
+from analytics.store import artifact_path, atomic_write, load_artifact, save_artifact
+
+VALUATION_DIR = os.path.join(CACHE_DIR, 'valuations')
+VALUATION_KIND = 'valuation'
+# Valuations kept on disk, e.g. the last six monthly extracts
+VALUATION_SLOTS = 6
+# Largest valuation also kept in memory, as the current one, between refreshes
+CURRENT_VALUATION_BYTES = int(os.environ.get('ANALYTICS_VALUATION_MEMORY_MB', 512)) * 1024 * 1024
+# Past this share of changed policies a full revaluation costs about the same and carries no drift
+MAX_CHANGE_SHARE = 0.5
+
+KEY = 'POL_NUMBER'
+# Amounts reconciled in the movement report
+MOVEMENT_MEASURES = {'ANNUAL_PREM': 'Annual Premium', 'RES_GP_PUPS': 'Reserves'}
+
+
+class IncrementalUnavailable(ValueError):
+    """The two extracts cannot be matched policy by policy."""
+
+
+def row_hashes(df):
+    """Content hash of each policy's extract columns other than ``POL_NUMBER``, which is matched on directly.
+
+    Derived and source columns are ignored.
+    """
+    columns = [col for col in POLICY_SCHEMA if col in df.columns and col != KEY]
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def _unique_keys(keys):
+    return keys.null_count == 0 and pc.count_distinct(keys).as_py() == len(keys)
+
+
+class Valuation:
+    """A dataset with derived metrics, plus the row hashes and aggregates an incremental refresh starts from."""
+
+    def __init__(self, fingerprint, df, row_hash, cube, sketches, unique_keys, valuation_year=VALUATION_YEAR):
+        self.fingerprint = fingerprint
+        self.df = df
+        self.row_hash = row_hash
+        self.cube = cube
+        self.sketches = sketches
+        # Whether POL_NUMBER identifies each policy, i.e. later extracts can be matched against this one
+        self.unique_keys = unique_keys
+        self.valuation_year = valuation_year
+
+
+class PolicyDelta:
+    """Row positions of inserted, updated, removed and unchanged policies between two valuations.
+
+    ``updated`` and ``unchanged`` index the current extract and line up with
+    ``updated_previous`` and ``unchanged_previous`` in the previous one.
+    """
+
+    def __init__(self, inserted, updated, updated_previous, removed, unchanged, unchanged_previous):
+        self.inserted = inserted
+        self.updated = updated
+        self.updated_previous = updated_previous
+        self.removed = removed
+        self.unchanged = unchanged
+        self.unchanged_previous = unchanged_previous
+        # False when so much changed that everything was revalued
+        self.incremental = True
+
+    @property
+    def n_changed(self):
+        return len(self.inserted) + len(self.updated) + len(self.removed)
+
+
+def diff_policies(previous_keys, previous_hash, keys, hashes):
+    """Match policies on ``POL_NUMBER`` and compare their row hashes.
+
+    ``previous_keys`` must be unique (see ``Valuation.unique_keys``); raises
+    ``IncrementalUnavailable`` unless ``keys`` are filled in and unique too.
+    """
+    # Arrow's hash lookup works on the string buffers directly, without boxing each number
+    previous_keys = pa.array(previous_keys.array)
+    keys = pa.array(keys.array)
+    positions = pc.index_in(keys, value_set=previous_keys).fill_null(-1).to_numpy()
+    matched = positions >= 0
+    # A repeated key either matches the same previous policy twice or is among the new ones
+    if (np.bincount(positions[matched], minlength=len(previous_keys)) > 1).any() or \
+            not _unique_keys(keys.filter(pa.array(~matched))):
+        raise IncrementalUnavailable(f'{KEY} must be filled in and unique in the extract to compare it')
+    same = np.zeros(len(keys), dtype=bool)
+    same[matched] = previous_hash[positions[matched]] == hashes[matched]
+    kept = np.zeros(len(previous_keys), dtype=bool)
+    kept[positions[matched]] = True
+    updated = np.flatnonzero(matched & ~same)
+    unchanged = np.flatnonzero(same)
+    return PolicyDelta(inserted=np.flatnonzero(~matched), updated=updated, updated_previous=positions[updated],
+                       removed=np.flatnonzero(~kept), unchanged=unchanged, unchanged_previous=positions[unchanged])
+
+
+def value_extract(df, fingerprint=None, derive=with_derived):
+    """Full valuation of an extract (extract columns only)."""
+    full = derive(df, fingerprint=fingerprint)
+    unique_keys = KEY in df.columns and _unique_keys(pa.array(df[KEY].array))
+    return Valuation(fingerprint, full, row_hashes(df), summary_cube(full, fingerprint=fingerprint),
+                     segment_sketches(full, fingerprint=fingerprint), unique_keys)
+
+
+def revalue(df, previous, fingerprint=None):
+    """Valuation of the extract ``df`` that reuses ``previous`` for unchanged policies; returns ``(valuation, delta)``.
+
+    Raises ``IncrementalUnavailable`` when the extracts cannot be matched on
+    ``POL_NUMBER`` or were derived differently.
+    """
+    base_columns = [col for col in POLICY_SCHEMA if col in df.columns]
+    if KEY not in df.columns or base_columns != [col for col in POLICY_SCHEMA if col in previous.df.columns]:
+        raise IncrementalUnavailable('The extract columns differ from the previous valuation')
+    if previous.valuation_year != VALUATION_YEAR:
+        raise IncrementalUnavailable(f'The previous valuation was made for {previous.valuation_year}')
+    if not previous.unique_keys:
+        raise IncrementalUnavailable(f'{KEY} is missing or repeated in the previous valuation')
+    hashes = row_hashes(df)
+    delta = diff_policies(previous.df[KEY], previous.row_hash, df[KEY], hashes)
+    if delta.n_changed > MAX_CHANGE_SHARE * max(len(df), 1):
+        delta.incremental = False
+        full = with_derived(df, fingerprint=fingerprint)
+        cube = build_cube(full)
+        sketches = build_sketches(full)
+    else:
+        changed = np.sort(np.concatenate([delta.inserted, delta.updated]))
+        fresh = compute_derived(df.iloc[changed])
+        carried = previous.df[list(fresh.columns)].iloc[delta.unchanged_previous]
+        derived = pd.concat([carried, fresh], ignore_index=True)
+        # Back into the extract's row order
+        order = np.empty(len(df), dtype=np.intp)
+        order[np.concatenate([delta.unchanged, changed])] = np.arange(len(df))
+        derived = derived.take(order)
+        derived.index = df.index
+        full = pd.concat([df.drop(columns=[col for col in derived.columns if col in df.columns]), derived], axis=1)
+
+        shift = previous.cube.shift
+        stale = np.concatenate([delta.removed, delta.updated_previous])
+        added, removed = full.iloc[changed], previous.df.iloc[stale]
+        cube = previous.cube.updated(added=build_cube(added, shift=shift) if len(added) else None,
+                                     removed=build_cube(removed, shift=shift) if len(removed) else None)
+        sketches = previous.sketches.updated(added=build_sketches(added) if len(added) else None,
+                                             removed=build_sketches(removed) if len(removed) else None)
+    if fingerprint is not None:
+        summary_cube.prime(cube, fingerprint=fingerprint)
+        segment_sketches.prime(sketches, fingerprint=fingerprint)
+    return Valuation(fingerprint, full, hashes, cube, sketches, unique_keys=True), delta
+
+
+def _totals(frame, measures):
+    return [len(frame)] + [float(frame[col].sum()) for col in measures]
+
+
+def movement_report(previous, current, delta):
+    """Analysis of movement from ``previous`` to ``current``: new business, exits and changes in force."""
+    measures = [col for col in MOVEMENT_MEASURES if col in current.df.columns]
+    new_business = _totals(current.df.iloc[delta.inserted], measures)
+    exits = _totals(previous.df.iloc[delta.removed], measures)
+    before = _totals(previous.df.iloc[delta.updated_previous], measures)
+    after = _totals(current.df.iloc[delta.updated], measures)
+    movement = pd.DataFrame(
+        [['Opening'] + _totals(previous.df, measures),
+         ['New business'] + new_business,
+         ['Exits'] + [-value for value in exits],
+         ['Changes in force', 0] + [a - b for a, b in zip(after[1:], before[1:])],
+         ['Closing'] + _totals(current.df, measures)],
+        columns=['Movement', 'Policies'] + [MOVEMENT_MEASURES[col] for col in measures])
+
+    tables = {'movement': movement}
+    if 'CL_STATUS' in current.df.columns:
+        # e.g. IF -> PUP for policies made paid-up since the previous valuation
+        old_status = previous.df['CL_STATUS'].iloc[delta.updated_previous].astype(object).fillna('(missing)')
+        new_status = current.df['CL_STATUS'].iloc[delta.updated].astype(object).fillna('(missing)')
+        moved = old_status.to_numpy() != new_status.to_numpy()
+        transitions = pd.DataFrame({'From': old_status.to_numpy()[moved], 'To': new_status.to_numpy()[moved]})
+        tables['status_transitions'] = (transitions.groupby(['From', 'To']).size().rename('Policies')
+                                        .reset_index().sort_values('Policies', ascending=False, ignore_index=True))
+
+    detail = [col for col in ['CL_STATUS'] + measures if col in current.df.columns]
+    parts = []
+    for change, old_rows, new_rows in [('New', None, current.df.iloc[delta.inserted]),
+                                       ('Exit', previous.df.iloc[delta.removed], None),
+                                       ('Updated', previous.df.iloc[delta.updated_previous],
+                                        current.df.iloc[delta.updated])]:
+        rows = new_rows if new_rows is not None else old_rows
+        part = {KEY: rows[KEY].to_numpy(), 'Change': change}
+        for col in detail:
+            part[f'{col} (previous)'] = old_rows[col].to_numpy() if old_rows is not None else None
+            part[f'{col} (current)'] = new_rows[col].to_numpy() if new_rows is not None else None
+        parts.append(pd.DataFrame(part))
+    tables['changes'] = pd.concat(parts, ignore_index=True)
+
+    n_current = len(current.df)
+    metrics = {
+        'previous_policies': len(previous.df),
+        'current_policies': n_current,
+        'inserted': len(delta.inserted),
+        'updated': len(delta.updated),
+        'removed': len(delta.removed),
+        'unchanged': len(delta.unchanged),
+        'changed_share': delta.n_changed / n_current if n_current else 0.0,
+        'incremental': delta.incremental,
+    }
+    return AnalysisResult('movement', tables, metrics)
+
+
+def valuation_bytes(valuation):
+    """In-memory size of ``valuation``'s policies and row hashes; its aggregates are per segment and small."""
+    return frame_bytes(valuation.df) + valuation.row_hash.nbytes
+
+
+_current = None
+_current_lock = threading.Lock()
+# Stores are created per call, so index updates are serialised process-wide
+_index_lock = threading.Lock()
+
+
+def _keep_current(valuation, limit):
+    # Only the latest valuation is kept in memory, and only when it fits in ``limit``
+    global _current
+    with _current_lock:
+        _current = valuation if valuation_bytes(valuation) <= limit else None
+
+
+class ValuationStore:
+    """Recent valuations, indexed in ``valuations/index.json``; the valuations live in the artifact store.
+
+    The last valuation saved or loaded stays in memory, if no larger than
+    ``memory_bytes``, so the next refresh against it skips reading it back;
+    the others are read from disk each time.
+    """
+
+    def __init__(self, root=VALUATION_DIR, slots=VALUATION_SLOTS, memory_bytes=CURRENT_VALUATION_BYTES):
+        self.root = root
+        self.slots = slots
+        self.memory_bytes = memory_bytes
+        self.index_path = os.path.join(root, 'index.json')
+
+    def entries(self):
+        try:
+            with open(self.index_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        entries = [entry for entry in entries if os.path.exists(artifact_path(VALUATION_KIND, entry['fingerprint']))]
+        return sorted(entries, key=lambda entry: entry['created'], reverse=True)
+
+    def load(self, fingerprint):
+        with _current_lock:
+            current = _current
+        if current is not None and current.fingerprint == fingerprint and \
+                os.path.exists(artifact_path(VALUATION_KIND, fingerprint)):
+            return current
+        valuation = load_artifact(VALUATION_KIND, fingerprint)
+        if valuation is not None:
+            _keep_current(valuation, self.memory_bytes)
+        return valuation
+
+    def save(self, valuation, names):
+        """Keep ``valuation`` for later refreshes, dropping the oldest beyond ``slots``.
+
+        The whole valuation is written, not just what changed since the previous one.
+        """
+        save_artifact(VALUATION_KIND, valuation.fingerprint, valuation)
+        _keep_current(valuation, self.memory_bytes)
+        entry = {
+            'fingerprint': valuation.fingerprint,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'names': list(names),
+            'rows': len(valuation.df),
+            'valuation_year': valuation.valuation_year,
+        }
+        with _index_lock:
+            entries = [e for e in self.entries() if e['fingerprint'] != valuation.fingerprint]
+            entries.insert(0, entry)
+            for stale in entries[self.slots:]:
+                try:
+                    os.remove(artifact_path(VALUATION_KIND, stale['fingerprint']))
+                except OSError:
+                    pass
+            with atomic_write(self.index_path) as tmp_path, open(tmp_path, 'w') as f:
+                json.dump(entries[:self.slots], f, indent=1)
+        return entry
@@ -0,0 +1,211 @@
+"""Upload ingestion: parse each extract once and keep a columnar snapshot on disk."""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from analytics.config import CACHE_DIR
+from analytics.schema import (CSV_CHUNK_ROWS, POLICY_SCHEMA, concat_frames, iter_policy_csv,
+                              read_policy_csv)
+from analytics.store import atomic_write
+from analytics.workbook import iter_sheet, read_sheet, sheet_names
+
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, 'snapshots')
+
+# Bump when the snapshot layout or schema changes so stale snapshots are ignored
+SNAPSHOT_VERSION = 2
+
+# Added when several extracts are combined: the file each policy came from
+SOURCE_COLUMN = 'SOURCE_FILE'
+
+
+class SchemaMismatch(ValueError):
+    """Extracts uploaded together do not carry the same schema columns."""
+
+
+def fingerprint_bytes(data):
+    """Content hash of an upload; identical files map to the same snapshot."""
+    digest = hashlib.blake2b(digest_size=16)
+    view = memoryview(data)
+    # Hash in slices so very large uploads are not copied in one go
+    for start in range(0, len(view), 1 << 24):
+        digest.update(view[start:start + (1 << 24)])
+    return digest.hexdigest()
+
+
+def fingerprint_upload(uploaded_file):
+    return fingerprint_bytes(uploaded_file.getbuffer())
+
+
+def fingerprint_file(path):
+    """Content hash of an extract on disk; matches ``fingerprint_bytes`` of its contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def combine_fingerprints(fingerprints):
+    """Fingerprint of several extracts taken in order; a single extract keeps its own."""
+    if len(fingerprints) == 1:
+        return fingerprints[0]
+    return hashlib.blake2b('\n'.join(fingerprints).encode(), digest_size=16).hexdigest()
+
+
+def sheet_fingerprint(fingerprint, sheet):
+    """Fingerprint of one worksheet of a workbook whose content hash is ``fingerprint``."""
+    return hashlib.blake2b(f'{fingerprint}\n{sheet}'.encode(), digest_size=16).hexdigest()
+
+
+def extract_fingerprint(name, buffer, fingerprint, sheet=None):
+    """Snapshot key for an extract: its content hash, qualified by the sheet for XLSX (the first by default)."""
+    if not name.endswith('.xlsx'):
+        return fingerprint
+    return sheet_fingerprint(fingerprint, sheet if sheet is not None else sheet_names(buffer)[0])
+
+
+def snapshot_path(fingerprint):
+    return os.path.join(SNAPSHOT_DIR, f'{fingerprint}.v{SNAPSHOT_VERSION}.parquet')
+
+
+def _meta_path(fingerprint):
+    return os.path.join(SNAPSHOT_DIR, f'{fingerprint}.v{SNAPSHOT_VERSION}.json')
+
+
+def read_extract(name, buffer, chunksize=CSV_CHUNK_ROWS, on_rows=None, sheet=None, on_size=None):
+    """Read a CSV/XLSX extract into schema dtypes; returns ``(df, coercion_failures)``.
+
+    ``chunksize`` applies to CSV. ``sheet`` picks the worksheet of an XLSX
+    workbook (the first by default); ``on_size`` receives its row count once known.
+    """
+    if name.endswith('.csv'):
+        return read_policy_csv(buffer, chunksize=chunksize, on_rows=on_rows)
+    elif name.endswith('.xlsx'):
+        return read_sheet(buffer, sheet, on_rows=on_rows, on_size=on_size)
+    raise ValueError(f'Unsupported file type: {name}')
+
+
+def iter_extract(name, buffer, chunksize=CSV_CHUNK_ROWS, sheet=None, on_size=None):
+    """Yield ``(chunk, coercion_failures)`` for a CSV/XLSX extract as it is parsed (``chunksize`` applies to CSV)."""
+    if name.endswith('.csv'):
+        yield from iter_policy_csv(buffer, chunksize=chunksize)
+    elif name.endswith('.xlsx'):
+        yield from iter_sheet(buffer, sheet, on_size=on_size)
+    else:
+        raise ValueError(f'Unsupported file type: {name}')
+
+
+def write_snapshot(df, fingerprint, meta=None):
+    path = snapshot_path(fingerprint)
+    # Write to a temp file first so a concurrent reader never sees a partial snapshot
+    with atomic_write(path) as tmp_path:
+        df.to_parquet(tmp_path, index=False)
+    if meta is not None:
+        with atomic_write(_meta_path(fingerprint)) as tmp_path, open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+    return path
+
+
+def load_snapshot(fingerprint):
+    path = snapshot_path(fingerprint)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def load_snapshot_meta(fingerprint):
+    try:
+        with open(_meta_path(fingerprint)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def ingest_upload(uploaded_file, sheet=None):
+    """Return ``(fingerprint, df)`` for an upload, parsing it only on first sight."""
+    fingerprint = extract_fingerprint(uploaded_file.name, uploaded_file, fingerprint_upload(uploaded_file), sheet)
+    df = load_snapshot(fingerprint)
+    if df is not None:
+        return fingerprint, df
+
+    uploaded_file.seek(0)
+    df, failures = read_extract(uploaded_file.name, uploaded_file, sheet=sheet)
+    try:
+        write_snapshot(df, fingerprint, meta={'coercion_failures': failures})
+    except OSError:
+        # The snapshot is only an accelerator; a read-only disk must not block analysis
+        pass
+    return fingerprint, df
+
+
+def ingest_path(path, sheet=None):
+    """Return ``(fingerprint, df, coercion_failures)`` for an extract on disk, sharing the upload snapshots."""
+    name = os.path.basename(path).lower()
+    with open(path, 'rb') as f:
+        fingerprint = extract_fingerprint(name, f, fingerprint_file(path), sheet)
+        df = load_snapshot(fingerprint)
+        if df is not None:
+            return fingerprint, df, load_snapshot_meta(fingerprint).get('coercion_failures', {})
+        df, failures = read_extract(name, f, sheet=sheet)
+    try:
+        write_snapshot(df, fingerprint, meta={'coercion_failures': failures})
+    except OSError:
+        pass
+    return fingerprint, df, failures
+
+
+def check_schema_agreement(extracts):
+    """Raise ``SchemaMismatch`` unless every ``(name, columns)`` in ``extracts`` has the same schema columns."""
+    (first_name, first), *rest = extracts
+    expected = set(first)
+    problems = []
+    for name, columns in rest:
+        missing = sorted(expected - set(columns), key=list(POLICY_SCHEMA).index)
+        extra = sorted(set(columns) - expected, key=list(POLICY_SCHEMA).index)
+        if missing:
+            problems.append(f"{name} lacks {', '.join(missing)}")
+        if extra:
+            problems.append(f"{name} has {', '.join(extra)} not in {first_name}")
+    if problems:
+        raise SchemaMismatch('Uploaded files do not share the same columns: ' + '; '.join(problems))
+
+
+def source_names(names):
+    """``SOURCE_COLUMN`` labels for extracts named ``names``; repeated names get a counter."""
+    labels = []
+    for name in names:
+        # Files of the same name from different folders still need distinct tags
+        label, n = name, 1
+        while label in labels:
+            n += 1
+            label = f'{name} ({n})'
+        labels.append(label)
+    return labels
+
+
+def combine_extracts(frames):
+    """Stack the parsed ``(name, df)`` extracts into one frame tagged with ``SOURCE_COLUMN``.
+
+    Schemas must agree (see ``check_schema_agreement``). The input frames are
+    emptied column by column as they are copied.
+    """
+    check_schema_agreement([(name, df.columns) for name, df in frames])
+    names = source_names([name for name, _ in frames])
+    parts = [df for _, df in frames]
+    lengths = [len(df) for df in parts]
+    combined = concat_frames(parts, list(parts[0].columns))
+    combined[SOURCE_COLUMN] = pd.Categorical.from_codes(np.repeat(np.arange(len(names)), lengths),
+                                                        categories=pd.Index(names, dtype='str'))
+    return combined
+
+
+def merge_failures(failures):
+    """Sum per-column coercion failure counts across extracts."""
+    merged = {}
+    for counts in failures:
+        for col, n in counts.items():
+            merged[col] = merged.get(col, 0) + n
+    return merged
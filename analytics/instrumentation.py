@@ -0,0 +1,106 @@
+"""Per-stage timing: wall time, rows and memory delta, kept in memory and logged as JSON lines."""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from analytics.config import CACHE_DIR
+
+STAGE_LOG_PATH = os.environ.get('ANALYTICS_STAGE_LOG', os.path.join(CACHE_DIR, 'logs', 'stages.jsonl'))
+
+_log_lock = threading.Lock()
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def rss_mb():
+    """Current resident memory of the process in MB, or None where it cannot be read.
+
+    The whole server process is measured, so concurrent sessions show up in
+    each other's deltas; treat small deltas as noise.
+    """
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 1024 / 1024
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def append_log(records, path=STAGE_LOG_PATH):
+    if not records or path is None:
+        return
+    lines = ''.join(json.dumps(record, default=str) + '\n' for record in records)
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with _log_lock, open(path, 'a') as f:
+            f.write(lines)
+    except OSError:
+        # Diagnostics must never take the app down
+        pass
+
+
+class StageRecorder:
+    """Collects stage timings for one script run (or one ingestion job).
+
+    ``context`` fields (session id, dataset fingerprint, ...) are added to every
+    record. Nested stages are allowed; a parent's time includes its children.
+    """
+
+    def __init__(self, log_path=STAGE_LOG_PATH, **context):
+        self.log_path = log_path
+        self.context = context
+        self.records = []
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    def begin(self, name, rows=None, **fields):
+        """Open a stage explicitly; pass the returned record to ``end``. Prefer ``stage`` where it fits."""
+        record = {'ts': time.strftime('%Y-%m-%dT%H:%M:%S'), **self.context,
+                  'stage': name, 'rows': rows, **fields, 'depth': self._depth}
+        self._depth += 1
+        # Listed in start order, so a parent stage appears above its children
+        with self._lock:
+            self.records.append(record)
+        record['_started'], record['_rss'] = time.perf_counter(), rss_mb()
+        return record
+
+    def end(self, record, error=None):
+        self._depth -= 1
+        started, memory_before = record.pop('_started'), record.pop('_rss')
+        memory_after = rss_mb()
+        record.update(
+            seconds=round(time.perf_counter() - started, 4),
+            mem_delta_mb=round(memory_after - memory_before, 1) if memory_after is not None else None,
+            rss_mb=round(memory_after, 1) if memory_after is not None else None,
+        )
+        if error is not None:
+            record['error'] = type(error).__name__
+        append_log([record], self.log_path)
+
+    @contextmanager
+    def stage(self, name, rows=None, **fields):
+        """Time the enclosed block; the yielded record can be updated (e.g. ``record['rows'] = n``)."""
+        record = self.begin(name, rows, **fields)
+        try:
+            yield record
+        except BaseException as e:
+            self.end(record, error=e)
+            raise
+        self.end(record)
+
+    def fork(self, **context):
+        """Recorder for a worker thread: its stages nest under the stage open here and are collected here."""
+        child = StageRecorder(self.log_path, **{**self.context, **context})
+        child.records, child._lock, child._depth = self.records, self._lock, self._depth
+        return child
+
+    def snapshot(self):
+        """Finished stages so far."""
+        with self._lock:
+            return [dict(record) for record in self.records if 'seconds' in record]
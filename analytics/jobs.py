@@ -0,0 +1,426 @@
+"""Background ingestion jobs with progress reporting and cancellation."""
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics.derived import derive_metrics, with_derived
+from analytics.footprint import compact_frame, footprint_report
+from analytics.incremental import (IncrementalUnavailable, ValuationStore, movement_report, revalue,
+                                   value_extract)
+from analytics.ingestion import (combine_extracts, combine_fingerprints, extract_fingerprint, fingerprint_bytes,
+                                 load_snapshot, load_snapshot_meta, merge_failures, read_extract, snapshot_path,
+                                 write_snapshot)
+from analytics.instrumentation import StageRecorder
+from analytics.outofcore import OutOfCoreDataset, spill_extract, spill_path
+from analytics.sessions import ReleasedUpload, UploadReleased
+from analytics.shared import frame_bytes
+
+STAGES = ['queued', 'fingerprint', 'parse', 'combine', 'derive', 'revalue', 'compact', 'done']
+
+# Extracts (files or worksheets) parsed at once; the parsers release the GIL for much of their work
+INGEST_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+
+class IngestionCancelled(Exception):
+    pass
+
+
+class _ProgressReader(io.RawIOBase):
+    # File-like view over the upload bytes that counts reads and honours cancellation
+    def __init__(self, data, job):
+        self._buffer = io.BytesIO(data)
+        self._job = job
+        self._size = len(data)
+        self._counted = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._buffer.seek(offset, whence)
+
+    def tell(self):
+        return self._buffer.tell()
+
+    def readinto(self, b):
+        self._job._check_cancelled()
+        n = self._buffer.readinto(b)
+        # Bytes read again after a seek back are not counted twice
+        n_new = min(n, self._size - self._counted)
+        self._counted += n_new
+        self._job._add_bytes(n_new)
+        return n
+
+    def finish(self):
+        # Count whatever was not read, e.g. when a cached copy was used instead
+        self._job._add_bytes(self._size - self._counted)
+        self._counted = self._size
+
+
+class _SheetProgress:
+    # A workbook is unzipped before its rows are read, so byte progress follows the rows parsed instead
+    def __init__(self, job, share):
+        self._job = job
+        self._share = share
+        self._rows_total = None
+        self._credited = 0
+
+    def on_size(self, rows_total):
+        self._rows_total = rows_total
+
+    def on_rows(self, n):
+        self._job._add_rows(n)
+        if self._rows_total:
+            credit = min(self._share * n / self._rows_total, self._share - self._credited)
+            self._credited += credit
+            self._job._add_bytes(credit)
+
+    def finish(self):
+        self._job._add_bytes(self._share - self._credited)
+        self._credited = self._share
+
+
+class IngestionJob:
+    """Parse one or more uploaded extracts on worker threads.
+
+    Several extracts are parsed concurrently, checked for matching schemas and
+    stacked into one frame tagged with the source file. ``sheets`` lists, per
+    upload, the worksheets to read from an XLSX workbook (``None`` for the
+    first); each selected sheet is parsed as an extract of its own. ``derive`` is an
+    optional ``derive(df, fingerprint=...)`` callable applied to the combined
+    frame; the job's ``result`` is ``(fingerprint, df)`` once ``done`` and
+    ``error`` is unset. With ``out_of_core`` the extracts are spilled to
+    Parquet instead and ``result`` is ``(fingerprint, OutOfCoreDataset)``.
+    With ``incremental`` the frame is revalued against the stored valuation
+    ``baseline`` (a fingerprint from ``ValuationStore``) instead of derived in
+    full, ``movement`` is the movement report between the two, and the new
+    valuation is stored for the next refresh; when the extracts cannot be
+    matched, ``movement_note`` says why and a full valuation is made.
+    With ``compact`` the frame is held in the compact representation of
+    :func:`~analytics.footprint.compact_frame`, and ``footprint`` is the
+    per-column report of what that saves. Uploads may be
+    :class:`~analytics.sessions.ReleasedUpload` stand-ins for ones ingested
+    before, which are read back from their snapshots; ``content_fingerprints``
+    then lets the caller release the uploads of this job in turn.
+    With a ``shared`` :class:`~analytics.shared.SharedDatasetCache` a dataset
+    another session already loaded is taken from it without parsing, and a
+    newly loaded one is put in it for others; the result is then shared and
+    read-only. Stage timings are collected on ``timings``.
+    """
+
+    def __init__(self, uploaded_files, derive=None, timings=None, out_of_core=False, sheets=None,
+                 incremental=False, baseline=None, shared=None, compact=False):
+        if not isinstance(uploaded_files, (list, tuple)):
+            uploaded_files = [uploaded_files]
+            sheets = [sheets] if sheets is not None else None
+        sheets = [selected or [None] for selected in sheets] if sheets is not None else [[None]] * len(uploaded_files)
+        self._file_names = [uploaded_file.name for uploaded_file in uploaded_files]
+        # One extract per selected sheet: (upload index, sheet), labelled with the sheet when a workbook gives several
+        self._extracts = [(index, sheet) for index, selected in enumerate(sheets) for sheet in selected]
+        self.names = [self._file_names[index] if len(sheets[index]) == 1 else f'{self._file_names[index]} [{sheet}]'
+                      for index, sheet in self._extracts]
+        self.name = self.names[0] if len(self.names) == 1 else f'{len(self.names)} extracts'
+        # Released uploads have no bytes left, only the content fingerprint their snapshots are found by
+        self._data = [None if isinstance(uploaded_file, ReleasedUpload) else uploaded_file.getvalue()
+                      for uploaded_file in uploaded_files]
+        self._sizes = [uploaded_file.size if data is None else len(data)
+                       for uploaded_file, data in zip(uploaded_files, self._data)]
+        self._released = [uploaded_file if data is None else None
+                          for uploaded_file, data in zip(uploaded_files, self._data)]
+        self.content_fingerprints = [upload.fingerprint if upload is not None else None for upload in self._released]
+        # Extracts still to read from each upload; its buffer is dropped when this reaches zero
+        self._remaining = [len(selected) for selected in sheets]
+        self._derive = derive
+        self.out_of_core = out_of_core
+        self.incremental = incremental and not out_of_core
+        self._baseline = baseline
+        self._shared = shared if not out_of_core else None
+        self.compact = compact and not out_of_core
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        # Set when one extract fails, so the others stop early
+        self._abort_event = threading.Event()
+        self._progress = {
+            'stage': 'queued',
+            'bytes_read': 0,
+            'bytes_total': sum(self._sizes),
+            'rows_parsed': 0,
+            'files_done': 0,
+            'files_total': len(self._extracts),
+        }
+        self.result = None
+        self.error = None
+        self.coercion_failures = {}
+        self.movement = None
+        self.movement_note = None
+        self.footprint = None
+        self.timings = timings or StageRecorder()
+        self._thread = threading.Thread(target=self._run, name=f'ingest-{self.name}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def done(self):
+        return not self._thread.is_alive() and self._progress['stage'] != 'queued'
+
+    def progress(self):
+        with self._lock:
+            return dict(self._progress)
+
+    def _set_stage(self, stage):
+        self._check_cancelled()
+        with self._lock:
+            self._progress['stage'] = stage
+
+    def _add_bytes(self, n):
+        with self._lock:
+            self._progress['bytes_read'] = min(self._progress['bytes_read'] + n, self._progress['bytes_total'])
+
+    def _add_rows(self, n):
+        self._check_cancelled()
+        with self._lock:
+            self._progress['rows_parsed'] += n
+
+    def _check_cancelled(self):
+        if self._cancel_event.is_set() or self._abort_event.is_set():
+            raise IngestionCancelled(self.name)
+
+    def _extract_done(self, file_index):
+        with self._lock:
+            self._remaining[file_index] -= 1
+            # Drop each upload buffer as soon as all of its extracts have been parsed
+            if not self._remaining[file_index]:
+                self._data[file_index] = None
+            self._progress['files_done'] += 1
+
+    def _fingerprint(self, index, timings):
+        file_index, sheet = self._extracts[index]
+        name, data, released = self._file_names[file_index], self._data[file_index], self._released[file_index]
+        if released is not None:
+            # A workbook's first sheet is the default, as when its bytes were read
+            if sheet is None and released.sheets:
+                sheet = released.sheets[0]
+            return extract_fingerprint(name, None, released.fingerprint, sheet)
+        with timings.stage('ingest:fingerprint', bytes=len(data)):
+            content = self.content_fingerprints[file_index] = fingerprint_bytes(data)
+            return extract_fingerprint(name, io.BytesIO(data), content, sheet)
+
+    def _ingest_released(self, file_index, fingerprint, timings):
+        # Read back from the snapshot (or spill) written when the upload was first ingested
+        name = self._file_names[file_index]
+        share = self._sizes[file_index] / sum(1 for extract in self._extracts if extract[0] == file_index)
+        if self.out_of_core:
+            if not (os.path.exists(spill_path(fingerprint)) or os.path.exists(snapshot_path(fingerprint))):
+                raise UploadReleased(name)
+            with timings.stage('ingest:spill') as record:
+                path, failures = spill_extract(name, None, fingerprint)
+                record['path'] = path
+            self._add_bytes(share)
+            self._extract_done(file_index)
+            return fingerprint, path, failures
+        with timings.stage('ingest:load_snapshot') as record:
+            df = load_snapshot(fingerprint)
+            record.update(rows=None if df is None else len(df), hit=df is not None)
+        if df is None:
+            raise UploadReleased(name)
+        self._add_bytes(share)
+        self._add_rows(len(df))
+        self._extract_done(file_index)
+        return fingerprint, df, load_snapshot_meta(fingerprint).get('coercion_failures', {})
+
+    def _ingest_one(self, index, fingerprint, timings):
+        """Return ``(fingerprint, df, coercion_failures)`` for one extract, parsing it only on first sight."""
+        file_index, sheet = self._extracts[index]
+        if self._released[file_index] is not None:
+            return self._ingest_released(file_index, fingerprint, timings)
+        name, data = self._file_names[file_index], self._data[file_index]
+        # A workbook's bytes count towards progress in equal shares per selected sheet
+        share = len(data) / sum(1 for extract in self._extracts if extract[0] == file_index)
+        if name.endswith('.xlsx'):
+            progress = _SheetProgress(self, share)
+            reader, on_rows, on_size = io.BytesIO(data), progress.on_rows, progress.on_size
+        else:
+            progress = reader = _ProgressReader(data, self)
+            on_rows, on_size = self._add_rows, None
+        if self.out_of_core:
+            # Streamed to Parquet chunk by chunk; the parsed rows never accumulate in memory
+            self._set_stage('parse')
+            with timings.stage('ingest:spill') as record:
+                path, failures = spill_extract(name, reader, fingerprint, on_rows=on_rows, sheet=sheet,
+                                               on_size=on_size)
+                record['path'] = path
+            progress.finish()
+            self._extract_done(file_index)
+            return fingerprint, path, failures
+        with timings.stage('ingest:load_snapshot') as record:
+            df = load_snapshot(fingerprint)
+            record.update(rows=None if df is None else len(df), hit=df is not None)
+        if df is None:
+            # Parsing and schema coercion happen together, chunk by chunk
+            self._set_stage('parse')
+            file_type = os.path.splitext(name)[1].lstrip('.').lower()
+            with timings.stage('ingest:parse', file_type=file_type) as record:
+                df, failures = read_extract(name, reader, on_rows=on_rows, sheet=sheet, on_size=on_size)
+                record['rows'] = len(df)
+            progress.finish()
+            try:
+                with timings.stage('ingest:write_snapshot', rows=len(df)):
+                    write_snapshot(df, fingerprint, meta={'coercion_failures': failures})
+            except OSError:
+                pass
+        else:
+            failures = load_snapshot_meta(fingerprint).get('coercion_failures', {})
+            progress.finish()
+            self._add_rows(len(df))
+        self._extract_done(file_index)
+        return fingerprint, df, failures
+
+    def _ingest_all(self, fingerprints, timings):
+        if len(self.names) == 1:
+            return [self._ingest_one(0, fingerprints[0], timings)]
+        with timings.stage('ingest:files', files=len(self.names)) as record, \
+                ThreadPoolExecutor(min(INGEST_WORKERS, len(self.names)), thread_name_prefix='ingest') as pool:
+            futures = [pool.submit(self._ingest_one, index, fingerprint, timings.fork(file=name))
+                       for index, (name, fingerprint) in enumerate(zip(self.names, fingerprints))]
+            parsed = []
+            try:
+                for name, future in zip(self.names, futures):
+                    try:
+                        parsed.append(future.result())
+                    except (IngestionCancelled, UploadReleased):
+                        raise
+                    except Exception as e:
+                        # Name the extract that failed; the original error stays chained
+                        raise ValueError(f'{name}: {e}') from e
+            except BaseException:
+                self._abort_event.set()
+                raise
+            if not self.out_of_core:
+                record['rows'] = sum(len(df) for _, df, _ in parsed)
+        return parsed
+
+    def _revalue(self, df, fingerprint):
+        # Derive only what changed since the baseline valuation, then keep this one as the next baseline
+        store = ValuationStore()
+        previous = store.load(self._baseline) if self._baseline is not None else None
+        valuation = None
+        if previous is not None:
+            try:
+                valuation, delta = revalue(df, previous, fingerprint)
+                self.movement = movement_report(previous, valuation, delta)
+            except IncrementalUnavailable as e:
+                self.movement_note = str(e)
+        elif self._baseline is not None:
+            self.movement_note = 'The previous valuation is no longer stored'
+        if valuation is None:
+            valuation = value_extract(df, fingerprint, derive=self._derive or with_derived)
+        try:
+            store.save(valuation, self.names)
+        except OSError:
+            pass
+        return valuation.df
+
+    def _shared_key(self, fingerprint):
+        # The same upload derived differently (or not at all), or held differently, is a different dataset
+        return fingerprint, getattr(self._derive, '__qualname__', None), self.compact
+
+    def _use_shared(self, fingerprint, timings):
+        # A dataset another session loaded: nothing to parse, and no private copy
+        with timings.stage('ingest:shared_lookup') as record:
+            cached = self._shared.get(self._shared_key(fingerprint))
+            record['hit'] = cached is not None
+        if cached is None:
+            return False
+        df, self.coercion_failures, self.footprint = cached
+        with self._lock:
+            self._progress.update(bytes_read=self._progress['bytes_total'], rows_parsed=len(df),
+                                  files_done=self._progress['files_total'])
+        self._data = None
+        self._set_stage('done')
+        self.result = (fingerprint, df)
+        return True
+
+    def _run(self):
+        try:
+            timings = self.timings
+            self._set_stage('fingerprint')
+            # All extracts are fingerprinted up front, so a dataset already loaded is found before any parsing
+            fingerprints = [self._fingerprint(index, timings if len(self.names) == 1 else timings.fork(file=name))
+                            for index, name in enumerate(self.names)]
+            fingerprint = combine_fingerprints(fingerprints)
+            # Incremental refreshes still revalue, since they report the movement too
+            if self._shared is not None and not self.incremental and self._use_shared(fingerprint, timings):
+                return
+            parsed = self._ingest_all(fingerprints, timings)
+            self.coercion_failures = merge_failures([failures for _, _, failures in parsed])
+            if self.out_of_core:
+                self._set_stage('combine')
+                with timings.stage('ingest:open_spill', files=len(parsed)) as record:
+                    dataset = OutOfCoreDataset([path for _, path, _ in parsed], self.names)
+                    record['rows'] = dataset.n_rows
+                self._set_stage('done')
+                self.result = (fingerprint, dataset)
+                return
+            if len(parsed) == 1:
+                df = parsed[0][1]
+            else:
+                self._set_stage('combine')
+                frames = [(name, df) for name, (_, df, _) in zip(self.names, parsed)]
+                del parsed
+                with timings.stage('ingest:combine', files=len(frames)) as record:
+                    df = combine_extracts(frames)
+                    record['rows'] = len(df)
+                del frames
+
+            if self.incremental:
+                self._set_stage('revalue')
+                with timings.stage('ingest:revalue', rows=len(df)) as record:
+                    df = self._revalue(df, fingerprint)
+                    if self.movement is not None:
+                        record.update(changed=self.movement.metrics['inserted'] + self.movement.metrics['updated']
+                                      + self.movement.metrics['removed'],
+                                      incremental=self.movement.metrics['incremental'])
+            elif self._derive is not None:
+                self._set_stage('derive')
+                with timings.stage('ingest:derive', rows=len(df)):
+                    df = self._derive(df, fingerprint=fingerprint)
+
+            if self.compact:
+                self._set_stage('compact')
+                with timings.stage('ingest:compact', rows=len(df)) as record:
+                    compact = compact_frame(df)
+                    self.footprint = footprint_report(df, compact)
+                    df = compact
+                    # The full-width derived columns memoised while deriving are superseded by the compact frame
+                    derive_metrics.evict(fingerprint)
+                    record['mb'] = float(self.footprint['Compact MB'].iloc[-1])
+
+            if self._shared is not None:
+                # Another session may have loaded the same dataset meanwhile; both then keep its copy
+                df, self.coercion_failures, self.footprint = self._shared.put(
+                    self._shared_key(fingerprint), (df, self.coercion_failures, self.footprint), frame_bytes(df))
+            self._set_stage('done')
+            self.result = (fingerprint, df)
+        except IngestionCancelled:
+            with self._lock:
+                self._progress['stage'] = 'cancelled'
+        except Exception as e:
+            self.error = e
+            with self._lock:
+                self._progress['stage'] = 'failed'
+        finally:
+            # Drop the upload buffers as soon as the job no longer needs them
+            self._data = None
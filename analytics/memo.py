@@ -0,0 +1,168 @@
+"""Small in-process caches keyed by dataset fingerprint.
+
+Every cache registers here, so everything memoised for a dataset can be
+sized (:func:`memoised_bytes`) and released (:func:`evict`) together once the
+dataset itself is let go.
+"""
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+_memos = weakref.WeakSet()
+_listeners = []
+_listeners_lock = threading.Lock()
+# Fingerprint of a result derived from a dataset (e.g. a sample of it) -> the dataset's fingerprint
+_parents = {}
+
+
+def object_bytes(value, _seen=None):
+    """Approximate in-memory size of ``value``: frames and arrays, and the containers and objects holding them."""
+    seen = set() if _seen is None else _seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes + (object_bytes(value.base, seen) if isinstance(value.base, np.ndarray) else 0)
+    if isinstance(value, (pa.Array, pa.ChunkedArray, pa.Table, pa.RecordBatch)):
+        return value.nbytes
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(object_bytes(key, seen) + object_bytes(item, seen)
+                                          for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(object_bytes(item, seen) for item in value)
+    # Other objects by the state they would pickle, e.g. a fitted estimator's arrays
+    try:
+        state = value.__getstate__()
+    except Exception:
+        state = None
+    return sys.getsizeof(value) + (object_bytes(state, seen) if state is not None else 0)
+
+
+def on_memoise(callback):
+    """Call ``callback(fingerprint)`` whenever a result is memoised for a dataset; held weakly if a method."""
+    ref = weakref.WeakMethod(callback) if hasattr(callback, '__self__') else (lambda: callback)
+    with _listeners_lock:
+        _listeners.append(ref)
+
+
+def link(fingerprint, dataset_fingerprint):
+    """Count what is memoised under ``fingerprint`` as the dataset ``dataset_fingerprint``'s, e.g. for a sample."""
+    _parents[fingerprint] = dataset_fingerprint
+
+
+def _family(fingerprint):
+    return {fingerprint} | {child for child, parent in list(_parents.items()) if parent == fingerprint}
+
+
+def _notify(fingerprint):
+    fingerprint = _parents.get(fingerprint, fingerprint)
+    with _listeners_lock:
+        _listeners[:] = [ref for ref in _listeners if ref() is not None]
+        callbacks = [ref() for ref in _listeners]
+    for callback in callbacks:
+        if callback is not None:
+            callback(fingerprint)
+
+
+class FingerprintMemo:
+    """LRU entries keyed by ``(fingerprint, ...)`` tuples, at most ``maxsize`` of them, with their sizes."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        # key -> (value, nbytes)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        _memos.add(self)
+
+    def get(self, key):
+        """``(True, value)`` if ``key`` is cached, else ``(False, None)``."""
+        with self._lock:
+            if key not in self._entries:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, self._entries[key][0]
+
+    def put(self, key, value):
+        nbytes = object_bytes(value)
+        with self._lock:
+            self._entries[key] = (value, nbytes)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        if key[0] is not None:
+            _notify(key[0])
+
+    def bytes_for(self, fingerprint):
+        with self._lock:
+            return sum(nbytes for key, (_, nbytes) in self._entries.items() if key[0] == fingerprint)
+
+    def evict(self, fingerprint):
+        """Drop every entry for ``fingerprint``; returns their size in bytes."""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == fingerprint]
+            return sum(self._entries.pop(key)[1] for key in keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def memoised_bytes(fingerprint):
+    """Size of everything memoised for the dataset ``fingerprint`` and what is linked to it, across every cache."""
+    return sum(memo.bytes_for(member) for member in _family(fingerprint) for memo in list(_memos))
+
+
+def evict(fingerprint):
+    """Release everything memoised for the dataset ``fingerprint`` and what is linked to it; returns the bytes freed."""
+    freed = 0
+    for member in _family(fingerprint):
+        freed += sum(memo.evict(member) for memo in list(_memos))
+        if member != fingerprint:
+            _parents.pop(member, None)
+    return freed
+
+
+def fingerprint_cache(maxsize=4):
+    """Cache ``func(df, *args, fingerprint=..., **kwargs)`` per fingerprint and arguments.
+
+    Calls without a ``fingerprint`` are not cached. Cached results are shared
+    between callers and must be treated as read-only. ``prime`` stores a result
+    computed another way (e.g. updated incrementally) for later calls, and
+    ``evict(fingerprint)`` drops a dataset's results.
+    """
+    def decorator(func):
+        memo = FingerprintMemo(maxsize)
+
+        @wraps(func)
+        def wrapper(df, *args, fingerprint=None, **kwargs):
+            if fingerprint is None:
+                return func(df, *args, **kwargs)
+            key = (fingerprint, args, tuple(sorted(kwargs.items())))
+            found, result = memo.get(key)
+            if found:
+                return result
+            result = func(df, *args, **kwargs)
+            memo.put(key, result)
+            return result
+
+        def prime(result, *args, fingerprint, **kwargs):
+            memo.put((fingerprint, args, tuple(sorted(kwargs.items()))), result)
+
+        wrapper.cache_clear = memo.clear
+        wrapper.prime = prime
+        wrapper.evict = memo.evict
+        wrapper.memo = memo
+        return wrapper
+    return decorator
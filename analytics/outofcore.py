@@ -0,0 +1,427 @@
+"""Out-of-core datasets: extracts spilled to Parquet and aggregated by DuckDB, with bounded samples in memory.
+
+The spill is written chunk by chunk with the same schema coercion as the
+in-memory reader. Afterwards only aggregates (the summary cube, quantile sketches,
+histogram bins, filtered summaries) and a fixed random sample of policies, for
+scatter charts and model fitting, are pulled into pandas; the derived metrics
+and every group-by run as streaming SQL over the Parquet files.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from analytics.charts import HISTOGRAM_BINS, SAMPLE_SEED
+from analytics.config import CACHE_DIR
+from analytics.cube import CUBE_DIMS, CUBE_FLAGS, CUBE_MEASURES, COUNT_ONLY, ROWS, SummaryCube, _partial
+from analytics.derived import (ADEQUACY_BINS, ADEQUACY_LABELS, EPSILON, MONTH_TO_SEASON, RISK_SEGMENT_BINS,
+                               RISK_SEGMENT_LABELS, SEASON_LABELS, VALUATION_YEAR, with_derived)
+from analytics.engine import AnalysisContext
+from analytics.ingestion import (SOURCE_COLUMN, check_schema_agreement, iter_extract, load_snapshot_meta,
+                                 snapshot_path, source_names)
+from analytics.export import EXPORT_FORMATS
+from analytics.memo import fingerprint_cache, link
+from analytics.schema import POLICY_SCHEMA, coerce_frame
+from analytics.sketch import (ACCURACY, COUNT, INF_KEY, KEY, MIN_VALUE, SKETCH_DIMS, SKETCH_METRICS,
+                              SegmentSketches, _scale)
+from analytics.store import artifact_key, atomic_write, cached_artifact
+
+SPILL_DIR = os.path.join(CACHE_DIR, 'spill')
+SPILL_VERSION = 1
+
+# Uploads larger than this default to out-of-core mode in the app
+OUT_OF_CORE_BYTES = int(os.environ.get('ANALYTICS_OUT_OF_CORE_BYTES', 512 * 1024 * 1024))
+# DuckDB spills its own working set to disk beyond this
+DUCKDB_MEMORY_LIMIT = os.environ.get('ANALYTICS_DUCKDB_MEMORY', '1GB')
+# Policies pulled into memory for scatter charts and model fitting
+SAMPLE_ROWS = 200_000
+
+_ARROW_TYPES = {'str': pa.string(), 'category': pa.string(), 'float64': pa.float64(),
+                'Int8': pa.int8(), 'Int16': pa.int16()}
+
+# Row-level conditions of analytics.cube.CUBE_FLAGS, as SQL
+FLAG_SQL = {
+    'PROFITABLE': 'PREMIUM_ADEQUACY > 0',
+    'BREAK_EVEN': 'LOSS_RATIO <= 1.0',
+    'HIGH_LOSS_RATIO': 'LOSS_RATIO > 1.5',
+}
+assert set(FLAG_SQL) == set(CUBE_FLAGS)
+
+# Cube dimensions as pandas dtypes, so rollups match those of an in-memory cube
+_ORDERED_DIMS = {
+    'RISK_SEGMENT': pd.CategoricalDtype(RISK_SEGMENT_LABELS, ordered=True),
+    'ADEQUACY_CATEGORY': pd.CategoricalDtype(ADEQUACY_LABELS, ordered=True),
+    'ENTRY_SEASON': pd.CategoricalDtype(SEASON_LABELS),
+}
+_INT_DIMS = {'ENTRY_YEAR': 'Int16', 'ENTRY_MONTH': 'Int8', 'POLICY_VINTAGE': 'Int16'}
+
+
+def _connect():
+    import duckdb
+
+    os.makedirs(SPILL_DIR, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT}'")
+    con.execute(f"SET temp_directory = '{os.path.join(SPILL_DIR, 'duckdb_tmp')}'")
+    return con
+
+
+def _quote(text):
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+def _number(value):
+    value = float(value)
+    if np.isinf(value):
+        return "'inf'::DOUBLE" if value > 0 else "'-inf'::DOUBLE"
+    return repr(value)
+
+
+def spill_path(fingerprint):
+    return os.path.join(SPILL_DIR, f'{fingerprint}.v{SPILL_VERSION}.parquet')
+
+
+def _spill_meta_path(fingerprint):
+    return os.path.join(SPILL_DIR, f'{fingerprint}.v{SPILL_VERSION}.json')
+
+
+def spill_extract(name, buffer, fingerprint, on_rows=None, sheet=None, on_size=None):
+    """Write an extract (one worksheet for XLSX) to Parquet chunk by chunk; returns ``(path, coercion_failures)``.
+
+    An existing spill (or in-memory snapshot) of the same extract is reused.
+    """
+    if os.path.exists(spill_path(fingerprint)):
+        try:
+            with open(_spill_meta_path(fingerprint)) as f:
+                return spill_path(fingerprint), json.load(f)['coercion_failures']
+        except (OSError, ValueError, KeyError):
+            return spill_path(fingerprint), {}
+    if os.path.exists(snapshot_path(fingerprint)):
+        return snapshot_path(fingerprint), load_snapshot_meta(fingerprint).get('coercion_failures', {})
+
+    path = spill_path(fingerprint)
+    writer = None
+    failures = {}
+    # A failed or interrupted spill leaves no partial file behind
+    with atomic_write(path) as tmp_path:
+        try:
+            for chunk, chunk_failures in iter_extract(name, buffer, sheet=sheet, on_size=on_size):
+                for col, n_failed in chunk_failures.items():
+                    failures[col] = failures.get(col, 0) + n_failed
+                if writer is None:
+                    schema = pa.schema([(col, _ARROW_TYPES[POLICY_SCHEMA[col]]) for col in chunk.columns])
+                    writer = pq.ParquetWriter(tmp_path, schema)
+                writer.write_table(pa.Table.from_pandas(chunk, preserve_index=False).cast(schema))
+                if on_rows is not None:
+                    on_rows(len(chunk))
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            raise ValueError(f'{name} has no rows')
+    with atomic_write(_spill_meta_path(fingerprint)) as tmp_path, open(tmp_path, 'w') as f:
+        json.dump({'coercion_failures': failures}, f)
+    return path, failures
+
+
+class OutOfCoreDataset:
+    """Spilled extracts queried with DuckDB; several files are stacked and tagged with ``SOURCE_COLUMN``."""
+
+    def __init__(self, paths, names=None):
+        self.paths = list(paths)
+        self.names = source_names(names) if names is not None and len(self.paths) > 1 else None
+        schemas = [pq.read_schema(path) for path in self.paths]
+        if self.names is not None:
+            check_schema_agreement([(name, schema.names) for name, schema in zip(self.names, schemas)])
+        self.base_columns = [col for col in POLICY_SCHEMA if col in schemas[0].names]
+        self.file_rows = [pq.ParquetFile(path).metadata.num_rows for path in self.paths]
+        self.n_rows = sum(self.file_rows)
+
+    @property
+    def columns(self):
+        derived = ['LOSS_RATIO', 'PREMIUM_ADEQUACY', 'EXPECTED_VS_ACTUAL', 'RISK_SCORE', 'COMBINED_RISK_SCORE',
+                   'RISK_SEGMENT', 'ADEQUACY_CATEGORY']
+        if 'ENTRY_YEAR' in self.base_columns:
+            derived.append('POLICY_VINTAGE')
+        if 'ENTRY_MONTH' in self.base_columns:
+            derived.append('ENTRY_SEASON')
+        return self.base_columns + ([SOURCE_COLUMN] if self.names else []) + derived
+
+    def _source_sql(self, columns):
+        files = ', '.join(_quote(path) for path in self.paths)
+        select = ', '.join(columns)
+        if self.names:
+            cases = ' '.join(f'WHEN {_quote(path)} THEN {_quote(name)}' for path, name in zip(self.paths, self.names))
+            select += f', CASE filename {cases} END AS {SOURCE_COLUMN}'
+        return f'SELECT {select} FROM read_parquet([{files}], filename = true)'
+
+    @cached_property
+    def relation(self):
+        """SQL for the policies with the derived metrics of ``analytics.derived.compute_derived``."""
+        def ratio(numerator, denominator):
+            # NaN is treated as missing, as pandas does
+            return f"nullif({numerator} / ({denominator} + {_number(EPSILON)}), 'NaN'::DOUBLE)"
+
+        def bins(value, edges, labels):
+            # Same intervals as pd.cut(right=True): (b0, b1], (b1, b2], ...
+            cases = ' '.join(f'WHEN {value} > {_number(low)} AND {value} <= {_number(high)} THEN {_quote(label)}'
+                             for low, high, label in zip(edges[:-1], edges[1:], labels))
+            return f'CASE {cases} END'
+
+        ratios = (f"{ratio('RES_GP_PUPS', 'PREM_GP_PUPS')} AS LOSS_RATIO, "
+                  f"nullif(PREM_GP_PUPS - RES_GP_PUPS, 'NaN'::DOUBLE) AS PREMIUM_ADEQUACY, "
+                  f"{ratio('ACT_GP_PUP', 'EXP_GP_PUP')} AS EXPECTED_VS_ACTUAL, "
+                  f"nullif({ratio('RES_GP_PUPS', 'ANNUAL_PREM')} * 100, 'NaN'::DOUBLE) AS RISK_SCORE")
+        if 'ENTRY_YEAR' in self.base_columns:
+            ratios += f', {VALUATION_YEAR} - ENTRY_YEAR AS POLICY_VINTAGE'
+        if 'ENTRY_MONTH' in self.base_columns:
+            seasons = ' '.join(f'WHEN {month} THEN {_quote(SEASON_LABELS[MONTH_TO_SEASON[month]])}'
+                               for month in range(1, 13))
+            ratios += f', CASE ENTRY_MONTH {seasons} END AS ENTRY_SEASON'
+        combined = (f"nullif(LOSS_RATIO * 0.4 + RISK_SCORE * {_number(0.3 / 100)} + EXPECTED_VS_ACTUAL * 0.3, "
+                    f"'NaN'::DOUBLE)")
+        return (f"SELECT *, {bins('COMBINED_RISK_SCORE', RISK_SEGMENT_BINS, RISK_SEGMENT_LABELS)} AS RISK_SEGMENT, "
+                f"{bins('PREMIUM_ADEQUACY', ADEQUACY_BINS, ADEQUACY_LABELS)} AS ADEQUACY_CATEGORY "
+                f"FROM (SELECT *, {combined} AS COMBINED_RISK_SCORE "
+                f"FROM (SELECT *, {ratios} FROM ({self._source_sql(self.base_columns)})))")
+
+    def query(self, sql, params=None):
+        """Run ``sql`` over a ``policies`` view of the dataset and return the result as a DataFrame."""
+        con = _connect()
+        try:
+            con.execute(f'CREATE TEMP VIEW policies AS {self.relation}')
+            return con.execute(sql, params or []).df()
+        finally:
+            con.close()
+
+    def build_cube(self):
+        """:class:`~analytics.cube.SummaryCube` of the dataset from two streaming SQL passes."""
+        columns = self.columns
+        dims = [col for col in CUBE_DIMS if col in columns]
+        measures = [col for col in CUBE_MEASURES if col in columns]
+        counts = [col for col in COUNT_ONLY if col in columns]
+        flags = list(FLAG_SQL)
+        means = self.query('SELECT ' + ', '.join(f'avg({col}) AS {col}' for col in measures) + ' FROM policies')
+        shift = {col: float(np.nan_to_num(means[col].iloc[0], posinf=0.0, neginf=0.0)) for col in measures}
+
+        partials = [f'count(*) AS {ROWS}']
+        for col in measures:
+            centered = f'({col} - {_number(shift[col])})'
+            partials += [f'count({col}) AS {_partial(col, "count")}',
+                         f'coalesce(sum({centered}), 0) AS {_partial(col, "sum")}',
+                         f'coalesce(sum({centered} * {centered}), 0) AS {_partial(col, "sumsq")}']
+        partials += [f'count({col}) AS {_partial(col, "count")}' for col in counts]
+        partials += [f'count_if({FLAG_SQL[flag]}) AS {_partial(flag, "flag")}' for flag in flags]
+        group_by = f' GROUP BY {", ".join(dims)}' if dims else ''
+        cells = self.query(f'SELECT {", ".join(dims + partials)} FROM policies{group_by}')
+
+        for col in dims:
+            if col in _ORDERED_DIMS:
+                cells[col] = cells[col].astype(_ORDERED_DIMS[col])
+            elif col in _INT_DIMS:
+                cells[col] = cells[col].astype(_INT_DIMS[col])
+            else:
+                cells[col] = cells[col].astype(pd.CategoricalDtype(sorted(cells[col].dropna().unique())))
+        for col in cells.columns.difference(dims):
+            if not col.endswith('__sum') and not col.endswith('__sumsq'):
+                cells[col] = cells[col].astype('int64')
+        return SummaryCube(cells, dims, measures, counts, flags, shift)
+
+    def build_sketches(self):
+        """:class:`~analytics.sketch.SegmentSketches` of the dataset, one streaming SQL group-by per metric."""
+        columns = self.columns
+        dims = [col for col in SKETCH_DIMS if col in columns]
+        log_gamma, offset = _scale(ACCURACY)
+        buckets = {}
+        for metric in [col for col in SKETCH_METRICS if col in columns]:
+            # Same keys as analytics.sketch.bucket_keys
+            key = (f'CASE WHEN isinf({metric}) THEN sign({metric}) * {INF_KEY} '
+                   f'WHEN abs({metric}) < {_number(MIN_VALUE)} THEN 0 '
+                   f'ELSE sign({metric}) * (ceil(ln(abs({metric})) / {_number(log_gamma)}) + {offset}) END')
+            frame = self.query(f'SELECT {", ".join(dims + [f"CAST({key} AS BIGINT) AS {KEY}"])}, '
+                               f'count(*) AS {COUNT} FROM policies WHERE {metric} IS NOT NULL AND NOT isnan({metric}) '
+                               f'GROUP BY ALL')
+            for col in dims:
+                frame[col] = frame[col].astype(_INT_DIMS[col]) if col in _INT_DIMS else \
+                    frame[col].astype(pd.CategoricalDtype(sorted(frame[col].dropna().unique())))
+            buckets[metric] = frame.astype({COUNT: 'int64'})
+        return SegmentSketches(buckets, dims)
+
+    def sample(self, size=SAMPLE_ROWS, seed=SAMPLE_SEED):
+        """A seeded uniform sample of at most ``size`` policies in schema dtypes, in dataset order."""
+        rng = np.random.default_rng(seed)
+        positions = np.sort(rng.choice(self.n_rows, size=min(size, self.n_rows), replace=False))
+        offsets = np.cumsum([0] + self.file_rows)
+        files = np.searchsorted(offsets, positions, side='right') - 1
+        picks = pd.DataFrame({'filename': np.array(self.paths)[files], 'file_row_number': positions - offsets[files],
+                              'position': positions})
+        files_sql = ', '.join(_quote(path) for path in self.paths)
+        con = _connect()
+        try:
+            con.register('picks', picks)
+            sample = con.execute(
+                f'SELECT p.* FROM read_parquet([{files_sql}], filename = true, file_row_number = true) p '
+                f'JOIN picks USING (filename, file_row_number) ORDER BY picks.position').df()
+        finally:
+            con.close()
+        filenames = sample.pop('filename')
+        sample, _ = coerce_frame(sample)
+        if self.names:
+            sample[SOURCE_COLUMN] = pd.Categorical(filenames.map(dict(zip(self.paths, self.names))),
+                                                   categories=self.names)
+        return sample
+
+    def where(self, equals=None, ranges=None):
+        """SQL predicate and parameters for ``PolicyIndex.query``-style filters (inclusive ranges)."""
+        clauses, params = [], []
+        for col, label in (equals or {}).items():
+            clauses.append(f'{col} = ?')
+            params.append(label)
+        for col, (low, high) in (ranges or {}).items():
+            if low is not None:
+                clauses.append(f'{col} >= ?')
+                params.append(float(low))
+            if high is not None:
+                clauses.append(f'{col} <= ?')
+                params.append(float(high))
+        return ' AND '.join(clauses) or 'TRUE', params
+
+    def describe(self, columns, where='TRUE', params=None):
+        """``DataFrame.describe()`` of numeric ``columns`` over the rows matching ``where``."""
+        stats = []
+        for col in columns:
+            stats += [f'count({col})', f'avg({col})', f'stddev_samp({col})', f'min({col})',
+                      f'quantile_cont({col}, 0.25)', f'quantile_cont({col}, 0.5)', f'quantile_cont({col}, 0.75)',
+                      f'max({col})']
+        row = self.query(f'SELECT {", ".join(stats)} FROM policies WHERE {where}', params).iloc[0].to_numpy()
+        return pd.DataFrame(row.astype('float64').reshape(len(columns), 8).T, columns=columns,
+                            index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'])
+
+    def export_file(self, fmt='csv', where='TRUE', params=None):
+        """Matching policies written by DuckDB to an unlinked temp file, returned open and rewound."""
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f'Unknown export format: {fmt}')
+        options = {'csv': 'FORMAT csv, HEADER', 'csv.gz': "FORMAT csv, HEADER, COMPRESSION 'gzip'",
+                   'parquet': 'FORMAT parquet'}[fmt]
+        fd, path = tempfile.mkstemp(suffix=EXPORT_FORMATS[fmt][0])
+        os.close(fd)
+        try:
+            con = _connect()
+            try:
+                con.execute(f'CREATE TEMP VIEW policies AS {self.relation}')
+                # COPY takes no bound parameters, so the filter values are inlined as literals
+                con.execute(f'COPY (SELECT * FROM policies WHERE {_inline(where, params)}) TO {_quote(path)} '
+                            f'({options})')
+            finally:
+                con.close()
+            f = open(path, 'rb')
+        finally:
+            # The open handle keeps the data readable; nothing is left behind on disk
+            os.unlink(path)
+        return f
+
+
+def _inline(where, params):
+    # Substitute parameters as literals, for statements that cannot take bound parameters
+    parts = where.split('?')
+    sql = parts[0]
+    for value, part in zip(params or [], parts[1:]):
+        sql += (_number(value) if isinstance(value, (int, float)) else _quote(value)) + part
+    return sql
+
+
+@fingerprint_cache(maxsize=2)
+def out_of_core_sample(dataset, size=SAMPLE_ROWS):
+    """:meth:`OutOfCoreDataset.sample` with the derived metrics, cached per ``fingerprint=``."""
+    return with_derived(dataset.sample(size))
+
+
+@fingerprint_cache(maxsize=16)
+def out_of_core_count_above(dataset, col, q):
+    """Exact number of values of ``col`` above its quantile ``q`` in one scan, cached per ``fingerprint=``."""
+    counts = dataset.query(f'SELECT count_if({col} > (SELECT quantile_cont({col}, ?) FROM policies)) '
+                           f'AS n FROM policies', [q])
+    return int(counts['n'].iloc[0])
+
+
+@fingerprint_cache(maxsize=16)
+def out_of_core_histogram(dataset, col, bins=HISTOGRAM_BINS):
+    """Equal-width histogram of ``col`` as :func:`~analytics.charts.histogram`, cached per ``fingerprint=``."""
+    bounds = dataset.query(f'SELECT min({col}) AS lo, max({col}) AS hi FROM policies WHERE isfinite({col})')
+    lo, hi = bounds['lo'].iloc[0], bounds['hi'].iloc[0]
+    if pd.isna(lo):
+        return pd.DataFrame(columns=['left', 'right', 'mid', 'count'])
+    if lo == hi:
+        # np.histogram's range for a single distinct value
+        lo, hi = lo - 0.5, hi + 0.5
+    edges = np.linspace(lo, hi, bins + 1)
+    counts = dataset.query(
+        f'SELECT least(CAST(floor(({col} - ?) / ? * {bins}) AS INTEGER), {bins - 1}) AS bin, count(*) AS n '
+        f'FROM policies WHERE isfinite({col}) GROUP BY bin', [float(lo), float(hi - lo)])
+    count = np.zeros(bins, dtype=np.int64)
+    count[counts['bin'].to_numpy()] = counts['n'].to_numpy()
+    return pd.DataFrame({'left': edges[:-1], 'right': edges[1:], 'mid': (edges[:-1] + edges[1:]) / 2,
+                         'count': count})
+
+
+class OutOfCoreContext(AnalysisContext):
+    """:class:`~analytics.engine.AnalysisContext` over an :class:`OutOfCoreDataset`.
+
+    Cube-backed analyses cover every policy. ``df`` is a fixed sample of
+    ``SAMPLE_ROWS`` policies, so charts and the model-based analyses (anomaly
+    detection, clustering, prediction) see that sample; ``fingerprint``
+    identifies the sample so its fitted models are never mixed up with models
+    of the full dataset.
+    """
+
+    out_of_core = True
+
+    def __init__(self, dataset, fingerprint):
+        self.dataset = dataset
+        self.dataset_fingerprint = fingerprint
+        self.fingerprint = hashlib.blake2b(f'{fingerprint}:sample:{SAMPLE_ROWS}:{SAMPLE_SEED}'.encode(),
+                                           digest_size=16).hexdigest()
+        # Results cached for the sample are released with the dataset
+        link(self.fingerprint, fingerprint)
+
+    @cached_property
+    def df(self):
+        return out_of_core_sample(self.dataset, fingerprint=self.dataset_fingerprint)
+
+    @cached_property
+    def cube(self):
+        # A full scan of the spill, so the cube is kept in memory and on disk like fitted models
+        key = artifact_key('out_of_core_cube', self.dataset_fingerprint, SPILL_VERSION)
+        return cached_artifact('cube', key, self.dataset.build_cube, fingerprint=self.dataset_fingerprint)
+
+    @cached_property
+    def sketches(self):
+        key = artifact_key('out_of_core_sketches', self.dataset_fingerprint, SPILL_VERSION)
+        return cached_artifact('sketches', key, self.dataset.build_sketches, fingerprint=self.dataset_fingerprint)
+
+    @property
+    def n_rows(self):
+        return self.dataset.n_rows
+
+    def has(self, *cols):
+        return all(col in self.dataset.columns for col in cols)
+
+    def count_above_quantile(self, col, q):
+        # Exact as in memory (a sketch can be off by the values tied at the quantile), scanned once per dataset
+        return out_of_core_count_above(self.dataset, col, q, fingerprint=self.dataset_fingerprint)
+
+    def histogram(self, col, bins=HISTOGRAM_BINS):
+        return out_of_core_histogram(self.dataset, col, bins, fingerprint=self.dataset_fingerprint)
+
+    def value_counts(self, col):
+        counts = self.dataset.query(f'SELECT {col}, count(*) AS n FROM policies GROUP BY {col} ORDER BY {col}')
+        return pd.Series(counts['n'].to_numpy(), index=pd.Index(counts[col], name=col), name='count')
+
+    def labels(self, col):
+        return [str(label) for label in self.cube.row_count([col]).index]
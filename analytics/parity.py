@@ -0,0 +1,134 @@
+"""Backend parity check: ingest, derive and aggregate an extract with every backend and compare the results.
+
+Conversion failures, categories and integers must match exactly. Parsed floats
+may differ in the last bit (pandas' default float parser is not correctly
+rounded, Polars' is), within ``ROW_RTOL`` -- plus ``ROW_ATOL`` where a measure
+subtracts two amounts -- and aggregates may also differ by summation order,
+within ``RTOL``.
+
+The app and ``python -m analytics run`` both aggregate the compact frame of
+:func:`~analytics.footprint.compact_frame`, whose ratios are float32, so they
+agree with each other exactly. Against full float64 precision, their KPIs and
+metrics agree within ``COMPACT_RTOL``; this is checked for the first backend.
+"""
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from analytics.config import BACKENDS
+from analytics.derived import with_derived
+from analytics.engine import AnalysisContext, headline_kpis, run_analysis
+from analytics.footprint import compact_frame
+from analytics.ingestion import read_extract
+
+# Analyses whose results come from the parser, derived metrics and cube
+PARITY_ANALYSES = ['executive_dashboard', 'risk_segmentation', 'premium_loss', 'temporal_patterns',
+                   'policy_explorer']
+ROW_RTOL = 1e-12
+ROW_ATOL = 1e-9
+RTOL = 1e-9
+# float32 ratios carry seven significant digits; aggregates of them stay well inside this
+COMPACT_RTOL = 1e-6
+
+
+@contextmanager
+def use_backend(backend):
+    previous = os.environ.get('ANALYTICS_BACKEND')
+    os.environ['ANALYTICS_BACKEND'] = backend
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop('ANALYTICS_BACKEND', None)
+        else:
+            os.environ['ANALYTICS_BACKEND'] = previous
+
+
+def run_backend(path, backend, analyses=PARITY_ANALYSES, compact=False):
+    """Everything the backend influences for one extract, computed without any caching.
+
+    With ``compact`` the analyses run on the compact frame, as in the app and the CLI.
+    """
+    with use_backend(backend), open(path, 'rb') as f:
+        df, failures = read_extract(os.path.basename(path).lower(), f)
+        derived = with_derived(df)
+        # No fingerprint, so nothing is shared between the backends' runs
+        ctx = AnalysisContext(compact_frame(derived) if compact else derived)
+        results = {name: run_analysis(name, ctx) for name in analyses}
+        return {
+            'failures': failures,
+            'parsed': df,
+            'derived': derived,
+            'kpis': headline_kpis(ctx),
+            **{f'{name}.{table}': value for name, result in results.items() for table, value in result.tables.items()},
+            **{f'{name}.metrics': result.metrics for name, result in results.items()},
+        }
+
+
+def _frame_difference(expected, actual, rtol, atol):
+    if list(expected.columns) != list(actual.columns):
+        return f'columns differ: {list(expected.columns)} != {list(actual.columns)}'
+    if not expected.index.equals(actual.index):
+        return 'index differs'
+    for col in expected.columns:
+        left, right = expected[col], actual[col]
+        if left.dtype != right.dtype:
+            return f'{col}: dtype {left.dtype} != {right.dtype}'
+        if left.dtype.kind == 'f':
+            same = np.isclose(left.to_numpy(), right.to_numpy(), rtol=rtol, atol=atol, equal_nan=True)
+        elif left.equals(right):
+            continue
+        else:
+            same = ((left == right) | (left.isna() & right.isna())).to_numpy(dtype=bool, na_value=False)
+        if not same.all():
+            row = int(np.argmin(same))
+            return f'{col}: {(~same).sum()} rows differ, first at row {row}: {left.iloc[row]!r} != {right.iloc[row]!r}'
+    return None
+
+
+def compare(expected, actual, rtol=RTOL, atol=0):
+    """Description of the first difference between two results, or None if they agree."""
+    if isinstance(expected, pd.DataFrame):
+        return _frame_difference(expected, actual, rtol, atol)
+    if isinstance(expected, dict):
+        if set(expected) != set(actual):
+            return f'keys differ: {sorted(set(expected) ^ set(actual))}'
+        for key in expected:
+            difference = compare(expected[key], actual[key], rtol, atol)
+            if difference:
+                return f'{key}: {difference}'
+        return None
+    if isinstance(expected, (float, np.floating)):
+        same = np.isclose(expected, actual, rtol=rtol, atol=atol, equal_nan=True)
+    else:
+        same = expected == actual or (pd.isna(expected) and pd.isna(actual))
+    return None if same else f'{expected!r} != {actual!r}'
+
+
+def check_parity(path, backends=BACKENDS, analyses=PARITY_ANALYSES, rtol=RTOL):
+    """Compare every backend against the first; returns ``[(backend, item, difference)]``, empty on parity.
+
+    The first backend's KPIs and metrics on the compact frame are also
+    compared with its full-precision ones, within ``COMPACT_RTOL``.
+    """
+    reference, *others = backends
+    expected = run_backend(path, reference, analyses)
+    differences = []
+    compacted = run_backend(path, reference, analyses, compact=True)
+    for item in expected:
+        if item == 'kpis' or item.endswith('.metrics'):
+            difference = compare(expected[item], compacted[item], COMPACT_RTOL)
+            if difference:
+                differences.append((f'{reference} compact', item, difference))
+    for backend in others:
+        actual = run_backend(path, backend, analyses)
+        for item in expected:
+            if item in ('parsed', 'derived'):
+                difference = compare(expected[item], actual[item], ROW_RTOL, ROW_ATOL)
+            else:
+                difference = compare(expected[item], actual[item], rtol)
+            if difference:
+                differences.append((backend, item, difference))
+    return differences
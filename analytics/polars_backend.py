@@ -0,0 +1,128 @@
+"""Polars implementations of the CSV reader, derived measures and cube group-by, selected with ``ANALYTICS_BACKEND``.
+
+Each function mirrors its pandas/numpy counterpart and returns the same
+pandas structures, so the rest of the package cannot tell the backends apart;
+Polars runs the work on all cores. ``python -m analytics parity`` checks that
+both backends give the same results.
+"""
+import numpy as np
+import pandas as pd
+import polars as pl
+from pandas._libs.parsers import STR_NA_VALUES
+
+from analytics.derived import ADEQUACY_BINS, EPSILON, RISK_SEGMENT_BINS
+from analytics.schema import POLICY_SCHEMA, _coerce_series, normalize_column
+
+# Strings pandas reads as missing, so both readers agree on what is a conversion failure
+NA_STRINGS = sorted(STR_NA_VALUES)
+
+
+def _to_pandas_strings(column):
+    return pd.Series(column.to_numpy(), dtype='object')
+
+
+def read_policy_csv(buffer, on_rows=None):
+    """Polars counterpart of :func:`analytics.schema.read_policy_csv`; returns ``(df, failures)``."""
+    header = pd.read_csv(buffer, nrows=0).columns
+    buffer.seek(0)
+    raw_names = {raw: normalize_column(raw) for raw in header if normalize_column(raw) in POLICY_SCHEMA}
+    # Every column is read as text and converted below with the same rules as the pandas reader
+    raw = pl.read_csv(buffer, columns=list(raw_names), infer_schema=False, null_values=NA_STRINGS)
+    if on_rows is not None:
+        on_rows(raw.height)
+
+    numeric = [raw_col for raw_col, col in raw_names.items() if POLICY_SCHEMA[col] not in ('category', 'str')]
+    parsed = raw.select(
+        [pl.col(raw_col).str.strip_chars().cast(pl.Float64, strict=False) for raw_col in numeric]
+        + [(pl.col(raw_col).str.strip_chars().ne('').fill_null(False)
+            & pl.col(raw_col).str.strip_chars().cast(pl.Float64, strict=False).is_null())
+           .alias(f'{raw_col}__failed') for raw_col in numeric]
+    )
+
+    columns = {}
+    failures = {}
+    for raw_col, col in raw_names.items():
+        dtype = POLICY_SCHEMA[col]
+        if dtype == 'category':
+            # Codes against the sorted distinct values, as the pandas reader's categories are sorted
+            values = raw[raw_col]
+            categories = values.drop_nulls().unique().sort()
+            codes = values.rank('dense').fill_null(0).cast(pl.Int32).to_numpy() - 1
+            columns[col] = pd.Categorical.from_codes(codes, categories=pd.Index(categories.to_list(), dtype='str'))
+            failures[col] = 0
+        elif dtype == 'str':
+            columns[col], failures[col] = _coerce_series(_to_pandas_strings(raw[raw_col]), dtype)
+        else:
+            failed = parsed[f'{raw_col}__failed'].to_numpy()
+            # Unparseable values are kept out of the range checks so each is counted once
+            numbers = pd.Series(parsed[raw_col].to_numpy(), dtype='float64').mask(failed, 0.0)
+            converted, bad = _coerce_series(numbers, dtype)
+            columns[col] = converted.mask(failed)
+            failures[col] = int(failed.sum()) + bad
+    df = pd.DataFrame({col: pd.Series(columns[col]).reset_index(drop=True)
+                       for col in POLICY_SCHEMA if col in columns})
+    return df, failures
+
+
+def _bin_codes(value, bins):
+    # Same intervals as analytics.derived._bin_codes: (b0, b1], (b1, b2], ...; anything else is -1
+    value = value.fill_nan(None)
+    codes = pl.lit(-1, dtype=pl.Int8)
+    for code, (low, high) in reversed(list(enumerate(zip(bins[:-1], bins[1:])))):
+        codes = pl.when((value > low) & (value <= high)).then(pl.lit(code, dtype=pl.Int8)).otherwise(codes)
+    return codes
+
+
+def policy_measures(df, float32=False):
+    """Polars counterpart of :func:`analytics.derived.policy_measures`."""
+    dtype = pl.Float32 if float32 else pl.Float64
+    source = pl.DataFrame({col: df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+                           for col in ['RES_GP_PUPS', 'PREM_GP_PUPS', 'ANNUAL_PREM', 'ACT_GP_PUP', 'EXP_GP_PUP']})
+    res, prem, annual, act, exp = (pl.col(col).cast(dtype) for col in source.columns)
+    epsilon = pl.lit(EPSILON, dtype=dtype)
+
+    def constant(value):
+        return pl.lit(value, dtype=dtype)
+
+    measures = source.lazy().select(
+        (res / (prem + epsilon)).alias('LOSS_RATIO'),
+        (prem - res).alias('PREMIUM_ADEQUACY'),
+        (act / (exp + epsilon)).alias('EXPECTED_VS_ACTUAL'),
+        (res / (annual + epsilon) * constant(100)).alias('RISK_SCORE'),
+    ).with_columns(
+        (pl.col('LOSS_RATIO') * constant(0.4) + pl.col('RISK_SCORE') * constant(0.3 / 100)
+         + pl.col('EXPECTED_VS_ACTUAL') * constant(0.3)).alias('COMBINED_RISK_SCORE'),
+    ).with_columns(
+        _bin_codes(pl.col('COMBINED_RISK_SCORE'), RISK_SEGMENT_BINS).alias('RISK_SEGMENT'),
+        _bin_codes(pl.col('PREMIUM_ADEQUACY'), ADEQUACY_BINS).alias('ADEQUACY_CATEGORY'),
+    ).collect()
+    # Arrays rather than frames, so missing values come back as NaN like the numpy path
+    return {col: measures[col].to_numpy() for col in measures.columns}
+
+
+def group_cells(partials, dims):
+    """Cube cells: ``partials`` (name -> array) summed per combination of the ``dims`` (name -> Series)."""
+    keys = {}
+    for col, values in dims.items():
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            keys[col] = values.cat.codes.to_numpy()
+        else:
+            keys[col] = pl.Series(col, values.to_numpy(dtype=np.float64, na_value=np.nan), nan_to_null=True)
+    # Missing partials are nulls, which Polars skips when summing like pandas does
+    frame = pl.DataFrame({**keys, **{name: pl.Series(name, array, nan_to_null=True)
+                                     for name, array in partials.items()}})
+    if dims:
+        grouped = frame.group_by(list(dims)).agg(pl.all().sum())
+    else:
+        grouped = frame.select(pl.all().sum())
+
+    cells = {}
+    for col, values in dims.items():
+        key = grouped[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            cells[col] = pd.Categorical.from_codes(key.to_numpy(), dtype=values.dtype)
+        else:
+            cells[col] = pd.array(key.to_list(), dtype=values.dtype)
+    for name, array in partials.items():
+        cells[name] = grouped[name].to_numpy().astype(array.dtype)
+    return pd.DataFrame(cells)
@@ -0,0 +1,137 @@
+"""Local registry of trained claims models with their lineage and metrics."""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+
+from analytics.config import CACHE_DIR
+from analytics.store import artifact_key, artifact_path, atomic_write, cached_artifact, input_signature, save_artifact
+
+REGISTRY_DIR = os.path.join(CACHE_DIR, 'registry')
+MODEL_KIND = 'random_forest'
+# Registries are created per call, so index updates are serialised process-wide
+_index_lock = threading.Lock()
+
+PREDICTIVE_FEATURES = ['ANNUAL_PREM', 'EXP_GP_PUP', 'ACT_GP_PUP', 'PREM_GP_PUPS']
+TARGET = 'RES_GP_PUPS'
+
+
+def model_inputs(df, features, target):
+    X = df[features].fillna(df[features].mean())
+    y = df[target].fillna(df[target].mean())
+    return X, y
+
+
+def holdout_split(df, features, target, random_state=42):
+    """The 80/20 train/test split every registered model is trained and scored on."""
+    X, y = model_inputs(df, features, target)
+    return train_test_split(X, y, test_size=0.2, random_state=random_state)
+
+
+def regression_metrics(y_true, y_pred):
+    mse = mean_squared_error(y_true, y_pred)
+    return {
+        'r2': float(r2_score(y_true, y_pred)),
+        'rmse': float(np.sqrt(mse)),
+        'accuracy': float(100 - (abs(y_true - y_pred).mean() / y_true.mean() * 100)),
+    }
+
+
+class ModelRegistry:
+    """Metadata index in ``registry/index.json``; fitted models live in the artifact store."""
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.json')
+
+    def entries(self, target=None):
+        try:
+            with open(self.index_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        if target is not None:
+            entries = [entry for entry in entries if entry['target'] == target]
+        return sorted(entries, key=lambda entry: entry['created'], reverse=True)
+
+    def get(self, model_id):
+        for entry in self.entries():
+            if entry['model_id'] == model_id:
+                return entry
+        return None
+
+    def is_available(self, model_id):
+        return os.path.exists(artifact_path(MODEL_KIND, model_id))
+
+    def load(self, model_id):
+        """The fitted model, kept in memory after the first load and released with its training dataset."""
+        entry = self.get(model_id)
+        return cached_artifact(MODEL_KIND, model_id, lambda: None,
+                               fingerprint=entry['fingerprint'] if entry is not None else None)
+
+    def register(self, entry):
+        with _index_lock:
+            entries = [e for e in self.entries() if e['model_id'] != entry['model_id']]
+            entries.append(entry)
+            with atomic_write(self.index_path) as tmp_path, open(tmp_path, 'w') as f:
+                json.dump(entries, f, indent=1)
+        return entry
+
+
+def train_or_reuse(df, features, target=TARGET, n_estimators=100, random_state=42,
+                   fingerprint=None, registry=None):
+    """Return ``(entry, model)`` for a random forest on ``df``, training only when needed.
+
+    A model already registered for the same data fingerprint, target, features
+    (and their dtypes) and parameters is loaded instead of being refitted.
+    """
+    registry = registry or ModelRegistry()
+    features = list(features)
+    params = {'n_estimators': n_estimators, 'random_state': random_state}
+    model_id = artifact_key(fingerprint, target, features, input_signature(df, features + [target]), params,
+                            sklearn.__version__)
+
+    entry = registry.get(model_id) if fingerprint is not None else None
+    if entry is not None:
+        model = registry.load(model_id)
+        if model is not None:
+            return entry, model
+
+    X_train, X_test, y_train, y_test = holdout_split(df, features, target, random_state)
+    model = RandomForestRegressor(n_estimators=n_estimators, random_state=random_state, n_jobs=-1)
+    model.fit(X_train, y_train)
+
+    entry = {
+        'model_id': model_id,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'target': target,
+        'features': features,
+        'fingerprint': fingerprint,
+        'params': params,
+        'sklearn_version': sklearn.__version__,
+        'n_train': int(len(X_train)),
+        'metrics': regression_metrics(y_test, model.predict(X_test)),
+        'importances': dict(zip(features, map(float, model.feature_importances_))),
+    }
+    if fingerprint is not None:
+        try:
+            save_artifact(MODEL_KIND, model_id, model)
+        except OSError:
+            # Unsaved models are not registered; the next run refits
+            return entry, model
+        registry.register(entry)
+    return entry, model
+
+
+def feature_importance_frame(entry):
+    return pd.DataFrame({
+        'Feature': list(entry['importances']),
+        'Importance': list(entry['importances'].values()),
+    }).sort_values('Importance', ascending=True)
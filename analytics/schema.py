@@ -0,0 +1,138 @@
+"""Declared schema for policy-level valuation extracts and a typed, chunked reader."""
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, union_categoricals
+
+from analytics.config import dataframe_backend
+
+CSV_CHUNK_ROWS = 200_000
+
+# Column -> in-memory dtype. Columns outside the schema are not read.
+POLICY_SCHEMA = {
+    'POL_NUMBER': 'str',
+    'CL_PBAND': 'category',
+    'CL_PFREQ': 'category',
+    'CL_PPT': 'category',
+    'CL_STATUS': 'category',
+    'ENTRY_YEAR': 'Int16',
+    'ENTRY_MONTH': 'Int8',
+    'ANNUAL_PREM': 'float64',
+    'EXP_GP_PUP': 'float64',
+    'ACT_GP_PUP': 'float64',
+    'PREM_GP_PUPS': 'float64',
+    'RES_GP_PUPS': 'float64',
+    'NZ_RES_IF_94': 'float64',
+}
+
+NUMERIC_COLS = [col for col, dtype in POLICY_SCHEMA.items() if dtype == 'float64']
+CATEGORY_COLS = [col for col, dtype in POLICY_SCHEMA.items() if dtype == 'category']
+SMALL_INT_COLS = [col for col, dtype in POLICY_SCHEMA.items() if dtype in ('Int8', 'Int16')]
+
+
+def normalize_column(name):
+    return str(name).strip().upper()
+
+
+def _coerce_series(values, dtype):
+    """Convert one column to its schema dtype; returns ``(series, n_failures)``."""
+    if dtype == 'category':
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            # Categories are always strings, matching what the CSV parser produces
+            values = values.astype('str').where(values.notna()).astype('category')
+        return values, 0
+    if dtype == 'str':
+        return values.astype('str').where(values.notna()), 0
+
+    if is_numeric_dtype(values.dtype):
+        numbers, present = values, values.notna()
+    else:
+        numbers = pd.to_numeric(values, errors='coerce')
+        # Blank text (e.g. an empty spreadsheet cell) is missing, not a failure
+        present = values.notna() & (values.astype('str').str.strip() != '')
+    failed = numbers.isna() & present
+    if dtype == 'float64':
+        return numbers.astype('float64'), int(failed.sum())
+
+    # Small integer columns: anything fractional or out of range is a failure; a blank cell is just missing
+    info = np.iinfo(dtype.lower())
+    numbers = numbers.astype('float64')
+    bad = numbers.notna() & ((numbers % 1 != 0) | (numbers < info.min) | (numbers > info.max))
+    numbers = numbers.mask(bad)
+    return numbers.astype(dtype), int((failed | bad).sum())
+
+
+def coerce_frame(df):
+    """Keep only schema columns and convert them; returns ``(df, failures)``."""
+    df.columns = [normalize_column(col) for col in df.columns]
+    df = df[[col for col in POLICY_SCHEMA if col in df.columns]]
+    failures = {}
+    columns = {}
+    for col in df.columns:
+        columns[col], failures[col] = _coerce_series(df[col], POLICY_SCHEMA[col])
+    return pd.DataFrame(columns), failures
+
+
+def iter_policy_csv(buffer, chunksize=CSV_CHUNK_ROWS):
+    """Yield ``(chunk, failures)`` for each parsed chunk of a CSV extract, converted to schema dtypes.
+
+    Only schema columns are read; ``failures`` maps each column of the chunk to
+    the number of values that could not be converted.
+    """
+    header = pd.read_csv(buffer, nrows=0).columns
+    buffer.seek(0)
+    raw_names = {raw: normalize_column(raw) for raw in header if normalize_column(raw) in POLICY_SCHEMA}
+
+    # Let the C parser type categoricals and identifiers directly; numerics are
+    # parsed natively and only fall back to coercion for chunks with bad values
+    read_dtypes = {}
+    for raw, col in raw_names.items():
+        if POLICY_SCHEMA[col] in ('category', 'str'):
+            read_dtypes[raw] = POLICY_SCHEMA[col]
+
+    reader = pd.read_csv(buffer, usecols=list(raw_names), dtype=read_dtypes, chunksize=chunksize,
+                         low_memory=False)
+    for chunk in reader:
+        chunk = chunk.rename(columns=raw_names)
+        failures = dict.fromkeys(chunk.columns, 0)
+        for col in chunk.columns:
+            if POLICY_SCHEMA[col] in ('category', 'str'):
+                continue
+            chunk[col], failures[col] = _coerce_series(chunk[col], POLICY_SCHEMA[col])
+        yield chunk, failures
+
+
+def read_policy_csv(buffer, chunksize=CSV_CHUNK_ROWS, on_rows=None):
+    """Read a CSV extract chunk by chunk, converting each chunk as it is parsed.
+
+    Only schema columns are read. Returns ``(df, failures)`` where ``failures``
+    maps each column to the number of values that could not be converted.
+    """
+    if dataframe_backend() == 'polars':
+        from analytics.polars_backend import read_policy_csv as read_with_polars
+        return read_with_polars(buffer, on_rows=on_rows)
+    failures = {}
+    chunks = []
+    for chunk, chunk_failures in iter_policy_csv(buffer, chunksize):
+        for col, n_failed in chunk_failures.items():
+            failures[col] = failures.get(col, 0) + n_failed
+        chunks.append(chunk)
+        if on_rows is not None:
+            on_rows(len(chunk))
+    return concat_frames(chunks, [c for c in POLICY_SCHEMA if c in failures]), failures
+
+
+def concat_frames(frames, columns):
+    """Stack schema-typed frames column by column, emptying ``frames`` as each column is copied.
+
+    Peak memory stays around one column above the inputs, where ``pd.concat``
+    would hold a full second copy of the data.
+    """
+    assembled = {}
+    for col in columns:
+        parts = [frame.pop(col) for frame in frames]
+        if POLICY_SCHEMA.get(col) == 'category' or isinstance(parts[0].dtype, pd.CategoricalDtype):
+            assembled[col] = pd.Series(union_categoricals(parts, sort_categories=True, ignore_order=True), name=col)
+        else:
+            assembled[col] = pd.concat(parts, ignore_index=True)
+        del parts
+    return pd.DataFrame(assembled)
@@ -0,0 +1,217 @@
+"""Per-session memory: what each browser session holds, and releasing it once the session goes idle.
+
+Sessions keep their loaded dataset (and the reports built with it) here
+rather than in Streamlit's session state, so the data of a session nobody
+has used for ``SESSION_TTL_SECONDS`` can be released even while its tab
+stays open. Uploads are replaced by :class:`ReleasedUpload` once ingested:
+the session keeps only the names and content fingerprints needed to load
+the data again, which the snapshots on disk (or the shared dataset cache)
+make cheap.
+"""
+import os
+import threading
+import time
+
+import pandas as pd
+
+from analytics import memo
+from analytics.shared import frame_bytes, shared_datasets
+
+# Idle time after which a session's data is released
+SESSION_TTL_SECONDS = float(os.environ.get('ANALYTICS_SESSION_TTL_MINUTES', 60)) * 60
+# How often idle sessions are looked for, at most
+REAP_INTERVAL_SECONDS = 60
+
+
+class UploadReleased(ValueError):
+    """An upload's bytes were released and its parsed snapshot is no longer on disk."""
+
+    def __init__(self, name):
+        super().__init__(f'{name} is no longer held in memory and its cached copy has expired; upload it again')
+        self.name = name
+
+
+class ReleasedUpload:
+    """Stands in for an upload once it is ingested and its bytes released.
+
+    Keeps what finding the upload's snapshots again takes: its name, size,
+    content fingerprint and, for a workbook, its sheet names.
+    """
+
+    def __init__(self, name, size, fingerprint, sheets=None):
+        self.name = name
+        self.size = size
+        self.fingerprint = fingerprint
+        self.sheets = sheets
+
+    def getvalue(self):
+        raise UploadReleased(self.name)
+
+
+def release_uploads(uploaded_files, fingerprints, sheets=None):
+    """:class:`ReleasedUpload` stand-ins for ``uploaded_files``, given their content ``fingerprints``."""
+    sheets = sheets or [None] * len(uploaded_files)
+    return [upload if isinstance(upload, ReleasedUpload) else
+            ReleasedUpload(upload.name, upload.size, fingerprint, names)
+            for upload, fingerprint, names in zip(uploaded_files, fingerprints, sheets)]
+
+
+def value_bytes(value):
+    """In-memory size of the frames in ``value``: a DataFrame, an analysis result, or a tuple of them."""
+    if isinstance(value, pd.DataFrame):
+        return frame_bytes(value)
+    if isinstance(value, (tuple, list)):
+        return sum(value_bytes(item) for item in value)
+    tables = getattr(value, 'tables', None)
+    if isinstance(tables, dict):
+        return sum(value_bytes(table) for table in tables.values())
+    return 0
+
+
+def _identity(value, fingerprint):
+    # Sessions sharing a dataset hold the same frame, each in a tuple of its own
+    return ('dataset', fingerprint) if fingerprint is not None else id(value)
+
+
+class SessionResources:
+    """Values held for each session, with their sizes, released ``ttl_seconds`` after its last activity.
+
+    A dataset held by several sessions (e.g. from the shared cache) is
+    counted once in the totals. Once no session holds a dataset any more,
+    the results memoised for it are released too, unless ``shared`` (a
+    :class:`~analytics.shared.SharedDatasetCache`) still keeps the dataset;
+    only what is actually freed counts as released.
+    """
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, clock=time.monotonic, shared=None):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._shared = shared
+        # session id -> {'last_seen': time, 'values': {name: (value, nbytes, fingerprint)}}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = {'last_seen': self._clock(), 'values': {}}
+        return session
+
+    def touch(self, session_id):
+        """Mark the session active now."""
+        with self._lock:
+            self._session(session_id)['last_seen'] = self._clock()
+
+    def hold(self, session_id, name, value, nbytes=None, fingerprint=None):
+        """Keep ``value`` for the session under ``name``, sized with :func:`value_bytes` unless ``nbytes`` is given.
+
+        ``fingerprint`` identifies the dataset ``value`` holds, if any.
+        """
+        nbytes = value_bytes(value) if nbytes is None else nbytes
+        with self._lock:
+            session = self._session(session_id)
+            dropped = session['values'].get(name)
+            session['values'][name] = (value, nbytes, fingerprint)
+            session['last_seen'] = self._clock()
+        if dropped is not None:
+            self._release([dropped])
+
+    def get(self, session_id, name):
+        """The value held for the session under ``name``; ``None`` if there is none or it was released."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            entry = session['values'].get(name) if session is not None else None
+            return entry[0] if entry is not None else None
+
+    def drop(self, session_id, *names):
+        """Release the session's values under ``names``, or all of them; returns the bytes freed."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return 0
+            dropped = [session['values'].pop(name) for name in names or list(session['values'])
+                       if name in session['values']]
+        return self._release(dropped)
+
+    def expire(self):
+        """Release every session idle for longer than the TTL; returns their ids."""
+        cutoff = self._clock() - self.ttl_seconds
+        with self._lock:
+            expired = [session_id for session_id, session in self._sessions.items() if session['last_seen'] < cutoff]
+            dropped = []
+            for session_id in expired:
+                session = self._sessions.pop(session_id)
+                if session['values']:
+                    self.evictions += 1
+                    dropped.extend(session['values'].values())
+        freed = self._release(dropped)
+        with self._lock:
+            self.evicted_bytes += freed
+        return expired
+
+    def _release(self, dropped):
+        # What no other session holds is freed, and so are the results memoised for a dataset nobody
+        # holds any more; a dataset the shared cache keeps stays in memory with its results
+        with self._lock:
+            held = {_identity(value, fingerprint) for session in self._sessions.values()
+                    for value, _, fingerprint in session['values'].values()}
+        freed = 0
+        for key, (nbytes, fingerprint) in {_identity(value, fingerprint): (nbytes, fingerprint)
+                                           for value, nbytes, fingerprint in dropped}.items():
+            if key in held:
+                continue
+            if fingerprint is not None and self._shared is not None and self._shared.holds(fingerprint):
+                continue
+            freed += nbytes
+            if fingerprint is not None:
+                freed += memo.evict(fingerprint)
+        return freed
+
+    def session_bytes(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return sum(nbytes for _, nbytes, _ in session['values'].values()) if session is not None else 0
+
+    def stats(self):
+        with self._lock:
+            distinct = {_identity(value, fingerprint): nbytes for session in self._sessions.values()
+                        for value, nbytes, fingerprint in session['values'].values()}
+            return {
+                'sessions': len(self._sessions),
+                'holding': sum(1 for session in self._sessions.values() if session['values']),
+                'bytes': sum(distinct.values()),
+                'ttl_seconds': self.ttl_seconds,
+                'evictions': self.evictions,
+                'evicted_bytes': self.evicted_bytes,
+            }
+
+    def start_reaper(self, interval=REAP_INTERVAL_SECONDS):
+        """Expire idle sessions on a daemon thread, so nobody has to be active for them to go."""
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap, args=(max(1.0, min(interval, self.ttl_seconds)),),
+                                            name='session-reaper', daemon=True)
+        self._reaper.start()
+
+    def _reap(self, interval):
+        while True:
+            time.sleep(interval)
+            self.expire()
+
+
+_resources = None
+_resources_lock = threading.Lock()
+
+
+def session_resources():
+    """The process-wide :class:`SessionResources`, expiring idle sessions in the background."""
+    global _resources
+    with _resources_lock:
+        if _resources is None:
+            _resources = SessionResources(shared=shared_datasets())
+            _resources.start_reaper()
+        return _resources
@@ -0,0 +1,161 @@
+"""Process-wide cache of parsed datasets, shared read-only by every session of the app.
+
+Sessions that upload the same extract get the same DataFrame object rather
+than a private copy each. Entries are keyed by content fingerprint and held
+within a total memory budget, least recently used first out. The results
+memoised for a dataset (derived metrics, cube, sketches, indexes, chart data,
+fitted models) count against the budget with it and are evicted with it. A
+session that still holds an evicted dataset keeps it alive until it lets go;
+the budget bounds what the cache itself retains.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from analytics import memo
+
+# Total size of the datasets kept for reuse across sessions
+DATASET_CACHE_BYTES = int(os.environ.get('ANALYTICS_DATASET_CACHE_MB', 2048)) * 1024 * 1024
+
+
+def frame_bytes(df):
+    """In-memory size of ``df``, strings and categories included."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+class SharedDatasetCache:
+    """LRU cache of datasets within ``budget_bytes``, with hit, miss and eviction counters.
+
+    Keys are tuples starting with the dataset's fingerprint, which is how the
+    results memoised for it are found. Cached values are shared between
+    callers and must be treated as read-only; take a shallow copy
+    (``df.copy(deep=False)``) before adding columns.
+    """
+
+    def __init__(self, budget_bytes=DATASET_CACHE_BYTES):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        # Size of the cached values themselves; their memoised results are sized when the budget is checked
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        memo.on_memoise(self._charge)
+
+    def get(self, key):
+        """The value cached for ``key``, or ``None``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """Cache ``value`` (of ``nbytes``) and return the value now cached for ``key``.
+
+        When another session cached the same dataset first, its value is
+        returned so both end up sharing one copy. A value larger than the whole
+        budget is returned without being cached, and what was memoised for it
+        is released.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            if nbytes > self.budget_bytes:
+                # Nor is anything memoised for it while it was loaded, such as its derived metrics
+                evicted = [key]
+            else:
+                self._entries[key] = (value, nbytes)
+                self._bytes += nbytes
+                evicted = self._shrink(key[0])
+        self._release(evicted)
+        return value
+
+    def _memo_bytes(self):
+        return sum(memo.memoised_bytes(fingerprint) for fingerprint in {key[0] for key in self._entries})
+
+    def _shrink(self, fingerprint):
+        # Evict least recently used datasets until the values and their memoised results fit the budget;
+        # the dataset ``fingerprint`` is in use, so it stays even if it alone is over
+        evicted = []
+        excess = self._bytes + self._memo_bytes() - self.budget_bytes
+        for key in list(self._entries):
+            if excess <= 0:
+                break
+            if key[0] == fingerprint:
+                continue
+            _, evicted_bytes = self._entries.pop(key)
+            self._bytes -= evicted_bytes
+            self.evictions += 1
+            evicted.append(key)
+            excess -= evicted_bytes + (memo.memoised_bytes(key[0]) if not self._holds(key[0]) else 0)
+        return evicted
+
+    def _release(self, keys):
+        # The memoised results of datasets no longer cached under any key go with them
+        with self._lock:
+            fingerprints = {key[0] for key in keys if not self._holds(key[0])}
+        for fingerprint in fingerprints:
+            memo.evict(fingerprint)
+
+    def _charge(self, fingerprint):
+        # A result was memoised for a dataset: charge it to the dataset's entry, if it is cached
+        with self._lock:
+            if not self._holds(fingerprint):
+                return
+            self._entries.move_to_end(next(key for key in self._entries if key[0] == fingerprint))
+            evicted = self._shrink(fingerprint)
+        self._release(evicted)
+
+    def _holds(self, fingerprint):
+        return any(key[0] == fingerprint for key in self._entries)
+
+    def holds(self, fingerprint):
+        """Whether a dataset with this ``fingerprint`` (the first item of its key) is cached."""
+        with self._lock:
+            return self._holds(fingerprint)
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+        self._release([key])
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        self._release(keys)
+
+    def stats(self):
+        with self._lock:
+            memo_bytes = self._memo_bytes()
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes + memo_bytes,
+                'memo_bytes': memo_bytes,
+                'budget_bytes': self.budget_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_datasets():
+    """The process-wide :class:`SharedDatasetCache`."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = SharedDatasetCache()
+        return _shared
@@ -0,0 +1,200 @@
+"""Mergeable quantile sketches for thresholds and box-plot summaries.
+
+A sketch counts values in logarithmic buckets (as in DDSketch): with
+``gamma = (1 + accuracy) / (1 - accuracy)`` every non-zero value ``x`` falls
+in the bucket ``ceil(log(|x|) / log(gamma))`` on its side of zero, and each
+bucket stands for a value within ``accuracy`` relative error of anything in it. Bucket counts are additive, so sketches of
+chunks, files or segments merge by adding counts, rows leave a sketch by
+subtracting theirs, and out-of-core data is sketched by one SQL group-by.
+Quantiles are then read from a few thousand buckets instead of sorting the data.
+"""
+import numpy as np
+import pandas as pd
+
+from analytics.memo import fingerprint_cache
+
+# Default relative error of quantiles read from a sketch; sketches merge only with others of the same accuracy
+ACCURACY = 0.005
+# Magnitudes below this share the zero bucket
+MIN_VALUE = 1e-9
+# Key of +inf (and, negated, of -inf); above any finite float's
+INF_KEY = 1 << 40
+
+# Metrics sketched for every dataset, and the segments they are kept for
+SKETCH_METRICS = ['RISK_SCORE', 'LOSS_RATIO', 'ANNUAL_PREM', 'PREMIUM_ADEQUACY']
+SKETCH_DIMS = ['CL_PBAND', 'ENTRY_YEAR']
+
+KEY = 'KEY'
+COUNT = 'COUNT'
+
+BOX_STATS = ['count', 'min', 'q1', 'median', 'q3', 'max', 'lower_fence', 'upper_fence']
+
+
+def _scale(accuracy):
+    # log(gamma), and the offset that makes every key other than the zero bucket's at least 1 in magnitude
+    log_gamma = float(np.log((1 + accuracy) / (1 - accuracy)))
+    return log_gamma, 1 - int(np.floor(np.log(MIN_VALUE) / log_gamma))
+
+
+def bucket_keys(values, accuracy=ACCURACY):
+    """Sketch keys of ``values`` (NaN-free), ordered like the values themselves."""
+    log_gamma, offset = _scale(accuracy)
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        index = np.ceil(np.log(magnitude) / log_gamma)
+    keys = np.where(np.isinf(magnitude), INF_KEY, np.nan_to_num(index, posinf=0, neginf=0) + offset)
+    keys = keys.astype(np.int64)
+    keys[magnitude < MIN_VALUE] = 0
+    return np.where(values < 0, -keys, keys)
+
+
+def key_values(keys, accuracy=ACCURACY):
+    """Value each key stands for: the point within ``accuracy`` of both ends of its bucket."""
+    log_gamma, offset = _scale(accuracy)
+    gamma = np.exp(log_gamma)
+    keys = np.atleast_1d(np.asarray(keys, dtype=np.int64))
+    magnitude = np.abs(keys)
+    with np.errstate(over='ignore'):
+        values = 2 * np.exp(log_gamma * (magnitude - offset).astype(np.float64)) / (gamma + 1)
+    values[magnitude == INF_KEY] = np.inf
+    values[magnitude == 0] = 0.0
+    return np.where(keys < 0, -values, values)
+
+
+class QuantileSketch:
+    """Counts of values per bucket key, sorted by key."""
+
+    def __init__(self, keys, counts, accuracy=ACCURACY):
+        self.keys = keys
+        self.counts = counts
+        self.accuracy = accuracy
+
+    @classmethod
+    def from_values(cls, values, accuracy=ACCURACY):
+        values = np.asarray(values, dtype=np.float64)
+        keys, counts = np.unique(bucket_keys(values[~np.isnan(values)], accuracy), return_counts=True)
+        return cls(keys, counts.astype(np.int64), accuracy)
+
+    @classmethod
+    def from_counts(cls, keys, counts, accuracy=ACCURACY):
+        """Sketch from unsorted, possibly repeated ``(key, count)`` pairs; empty buckets are dropped."""
+        keys, inverse = np.unique(np.asarray(keys, dtype=np.int64), return_inverse=True)
+        counts = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+        kept = counts > 0
+        return cls(keys[kept], counts[kept], accuracy)
+
+    def merge(self, *others):
+        sketches = (self,) + others
+        if any(s.accuracy != self.accuracy for s in others):
+            raise ValueError('Only sketches of the same accuracy can be merged')
+        return QuantileSketch.from_counts(np.concatenate([s.keys for s in sketches]),
+                                          np.concatenate([s.counts for s in sketches]), self.accuracy)
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    def _rank_bucket(self, q):
+        # Bucket of the value at rank q * (n - 1), pandas' linear quantile position
+        cumulative = np.cumsum(self.counts)
+        rank = np.asarray(q, dtype=np.float64) * (cumulative[-1] - 1)
+        return np.searchsorted(cumulative, rank, side='right'), rank, cumulative
+
+    def quantile(self, q):
+        """Value at quantile ``q`` (a scalar or an array) within ``accuracy`` relative error; NaN when empty."""
+        if not len(self.keys):
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        bucket, _, _ = self._rank_bucket(q)
+        values = key_values(self.keys[bucket], self.accuracy)
+        return values if np.ndim(q) else float(values[0])
+
+    def box_summary(self):
+        """Count, quartiles, extremes and 1.5 IQR whisker fences for a box plot."""
+        if not len(self.keys):
+            return dict.fromkeys(BOX_STATS, np.nan) | {'count': 0}
+        low, q1, median, q3, high = self.quantile([0.0, 0.25, 0.5, 0.75, 1.0])
+        iqr = q3 - q1
+        return {'count': self.n, 'min': low, 'q1': q1, 'median': median, 'q3': q3, 'max': high,
+                'lower_fence': max(low, q1 - 1.5 * iqr), 'upper_fence': min(high, q3 + 1.5 * iqr)}
+
+
+class SegmentSketches:
+    """A quantile sketch of each metric per cell of ``dims``, as ``(dims..., KEY, COUNT)`` frames.
+
+    Like the summary cube's partials, counts are additive: sketches of
+    chunks or of separately parsed files merge with :meth:`updated`.
+    """
+
+    def __init__(self, buckets, dims):
+        self.buckets = buckets
+        self.dims = dims
+
+    @property
+    def metrics(self):
+        return list(self.buckets)
+
+    def sketch(self, metric, equals=None):
+        """Sketch of ``metric`` over the segments matching ``equals`` (``{dim: label}``), or all of them."""
+        frame = self.buckets[metric]
+        for col, label in (equals or {}).items():
+            frame = frame[frame[col] == label]
+        return QuantileSketch.from_counts(frame[KEY].to_numpy(), frame[COUNT].to_numpy())
+
+    def quantile(self, metric, q, equals=None):
+        return self.sketch(metric, equals).quantile(q)
+
+    def box_summary(self, metric, by):
+        """Box-plot statistics of ``metric`` per label of segment ``by``."""
+        frame = self.buckets[metric]
+        rows = {label: QuantileSketch.from_counts(group[KEY].to_numpy(), group[COUNT].to_numpy()).box_summary()
+                for label, group in frame.groupby(by, observed=True, sort=True)}
+        summary = pd.DataFrame.from_dict(rows, orient='index', columns=BOX_STATS)
+        summary.index.name = by
+        return summary.astype({'count': 'int64'})
+
+    def updated(self, added=None, removed=None):
+        """These sketches with the counts of ``added`` put in and those of ``removed`` taken out."""
+        buckets = {}
+        for metric, frame in self.buckets.items():
+            parts = [frame]
+            if added is not None:
+                parts.append(added.buckets[metric])
+            if removed is not None:
+                parts.append(removed.buckets[metric].assign(**{COUNT: -removed.buckets[metric][COUNT]}))
+            buckets[metric] = _sum_buckets(parts, self.dims)
+        return SegmentSketches(buckets, self.dims)
+
+
+def _sum_buckets(parts, dims):
+    for col in dims:
+        dtypes = [part[col].dtype for part in parts]
+        if isinstance(dtypes[0], pd.CategoricalDtype) and any(dtype != dtypes[0] for dtype in dtypes):
+            # Labels read from the data (e.g. bands) may differ between extracts
+            categories = sorted(set().union(*(dtype.categories for dtype in dtypes)))
+            dtype = pd.CategoricalDtype(pd.Index(categories, dtype=dtypes[0].categories.dtype))
+            parts = [part.assign(**{col: part[col].astype(dtype)}) for part in parts]
+    frame = pd.concat(parts, ignore_index=True)
+    frame = frame.groupby(dims + [KEY], observed=True, dropna=False, sort=False)[COUNT].sum().reset_index()
+    return frame[frame[COUNT] > 0].reset_index(drop=True)
+
+
+def build_sketches(df, metrics=None):
+    """Sketch each of ``SKETCH_METRICS`` in ``df`` per ``SKETCH_DIMS`` segment, in one group-by per metric."""
+    dims = [col for col in SKETCH_DIMS if col in df.columns]
+    metrics = [col for col in (metrics or SKETCH_METRICS) if col in df.columns]
+    buckets = {}
+    for metric in metrics:
+        values = df[metric].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~np.isnan(values)
+        frame = df.loc[valid, dims].reset_index(drop=True)
+        frame[KEY] = bucket_keys(values[valid])
+        buckets[metric] = frame.groupby(dims + [KEY], observed=True, dropna=False, sort=False).size() \
+            .rename(COUNT).reset_index()
+    return SegmentSketches(buckets, dims)
+
+
+@fingerprint_cache(maxsize=4)
+def segment_sketches(df):
+    """Segment sketches for ``df``, cached per ``fingerprint=`` when one is given."""
+    return build_sketches(df)
@@ -0,0 +1,98 @@
+"""On-disk store for fitted models and other reusable analysis artifacts."""
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+import joblib
+
+from analytics.config import CACHE_DIR
+from analytics.memo import FingerprintMemo
+
+ARTIFACT_DIR = os.path.join(CACHE_DIR, 'artifacts')
+MEMORY_SLOTS = 8
+
+# Recently used artifacts, keyed by ``(fingerprint, kind, key)`` so a dataset's can be evicted with it
+_memory = FingerprintMemo(MEMORY_SLOTS)
+
+
+@contextmanager
+def atomic_write(path, suffix='.tmp'):
+    """Yield a fresh temporary path next to ``path``, moved onto ``path`` once the block succeeds.
+
+    Each writer gets its own temporary file, so concurrent writers (threads or
+    processes) never share one and readers never see a partial file. On
+    failure the temporary file is removed.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'{os.path.basename(path)}.', suffix=suffix, dir=directory)
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def artifact_key(*parts):
+    """Stable key for an artifact built from JSON-serialisable ``parts``."""
+    payload = json.dumps(parts, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def input_signature(df, columns):
+    """Dtypes of ``df[columns]``, so copies of a dataset held at different widths get artifacts of their own."""
+    return [str(df[col].dtype) for col in columns]
+
+
+def artifact_path(kind, key):
+    return os.path.join(ARTIFACT_DIR, kind, f'{key}.joblib')
+
+
+def load_artifact(kind, key):
+    path = artifact_path(kind, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        return joblib.load(path)
+    except Exception:
+        # A truncated or incompatible artifact is treated as missing and rebuilt
+        return None
+
+
+def save_artifact(kind, key, obj):
+    path = artifact_path(kind, key)
+    with atomic_write(path) as tmp_path:
+        joblib.dump(obj, tmp_path)
+    return path
+
+
+def cached_artifact(kind, key, build, fingerprint=None):
+    """Return the artifact for ``(kind, key)`` from memory, then disk, else ``build()`` it.
+
+    A ``None`` from ``build()`` is returned as is, neither saved nor kept in
+    memory. ``fingerprint`` names the dataset the artifact was built from, so
+    the in-memory copy is released with the dataset's other cached results.
+    """
+    found, obj = _memory.get((fingerprint, kind, key))
+    if found:
+        return obj
+
+    obj = load_artifact(kind, key)
+    if obj is None:
+        obj = build()
+        if obj is None:
+            return None
+        try:
+            save_artifact(kind, key, obj)
+        except OSError:
+            pass
+
+    _memory.put((fingerprint, kind, key), obj)
+    return obj
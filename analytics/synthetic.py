@@ -0,0 +1,81 @@
+"""Synthetic policy portfolios in the extract schema, for benchmarks and demos."""
+import numpy as np
+import pandas as pd
+
+from analytics.schema import POLICY_SCHEMA
+
+GENERATE_CHUNK_ROWS = 500_000
+
+# openpyxl/Excel cannot hold more rows than this on one sheet (plus the header)
+XLSX_MAX_ROWS = 1_048_575
+
+BANDS = ['B1', 'B2', 'B3', 'B4', 'B5']
+BAND_WEIGHTS = [0.35, 0.3, 0.18, 0.12, 0.05]
+BAND_PREMIUM = [8_000, 20_000, 45_000, 90_000, 200_000]
+FREQUENCIES = ['M', 'Q', 'H', 'Y']
+PREMIUM_TERMS = [5, 7, 10, 12, 15, 20]
+STATUSES = ['IF', 'PUP', 'LAP', 'SUR']
+STATUS_WEIGHTS = [0.7, 0.15, 0.1, 0.05]
+
+
+def _chunk(rng, start, n_rows, invalid_share):
+    band = rng.choice(len(BANDS), n_rows, p=BAND_WEIGHTS)
+    premium = np.asarray(BAND_PREMIUM)[band] * rng.lognormal(0, 0.35, n_rows)
+    pups_premium = premium * rng.uniform(3, 12, n_rows)
+    # Claims track premium, with a heavy right tail so some policies are loss-making
+    claims = pups_premium * rng.lognormal(-0.3, 0.6, n_rows)
+    expected = rng.gamma(2.0, 1_000, n_rows)
+    chunk = pd.DataFrame({
+        'POL_NUMBER': np.char.add('P', np.char.zfill(np.arange(start, start + n_rows).astype(str), 9)),
+        'CL_PBAND': np.asarray(BANDS)[band],
+        'CL_PFREQ': rng.choice(FREQUENCIES, n_rows, p=[0.5, 0.15, 0.1, 0.25]),
+        'CL_PPT': rng.choice(PREMIUM_TERMS, n_rows),
+        'CL_STATUS': rng.choice(STATUSES, n_rows, p=STATUS_WEIGHTS),
+        'ANNUAL_PREM': premium.round(2),
+        'ENTRY_YEAR': rng.integers(2000, 2025, n_rows),
+        'ENTRY_MONTH': rng.integers(1, 13, n_rows),
+        'EXP_GP_PUP': expected.round(2),
+        'ACT_GP_PUP': (expected * rng.lognormal(0, 0.25, n_rows)).round(2),
+        'PREM_GP_PUPS': pups_premium.round(2),
+        'RES_GP_PUPS': claims.round(2),
+        'NZ_RES_IF_94': (claims * rng.uniform(0.05, 0.3, n_rows)).round(2),
+    })
+    if invalid_share:
+        # Unparseable entries exercise the coercion-failure path of ingestion
+        bad = rng.random(n_rows) < invalid_share
+        chunk['ANNUAL_PREM'] = chunk['ANNUAL_PREM'].astype(object).mask(bad, 'unknown')
+    return chunk[list(POLICY_SCHEMA)]
+
+
+def generate_portfolio(n_rows, seed=0, chunk_rows=GENERATE_CHUNK_ROWS, invalid_share=0.0):
+    """Yield a synthetic portfolio of ``n_rows`` policies as DataFrame chunks.
+
+    The same ``seed`` and ``chunk_rows`` always give the same portfolio.
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_rows, chunk_rows):
+        yield _chunk(rng, start, min(chunk_rows, n_rows - start), invalid_share)
+
+
+def write_portfolio(path, n_rows, seed=0, invalid_share=0.0):
+    """Write a synthetic extract to ``path`` (``.csv`` or ``.xlsx``) without holding it all in memory."""
+    chunks = generate_portfolio(n_rows, seed=seed, invalid_share=invalid_share)
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(f, header=i == 0, index=False)
+    elif path.endswith('.xlsx'):
+        if n_rows > XLSX_MAX_ROWS:
+            raise ValueError(f'XLSX sheets hold at most {XLSX_MAX_ROWS:,} rows')
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Policies')
+        sheet.append(list(POLICY_SCHEMA))
+        for chunk in chunks:
+            for row in chunk.itertuples(index=False):
+                sheet.append(list(row))
+        workbook.save(path)
+    else:
+        raise ValueError(f'Unsupported file type: {path}')
+    return path
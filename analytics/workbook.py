@@ -0,0 +1,119 @@
+"""XLSX extracts: list a workbook's sheets and parse one sheet chunk by chunk into schema dtypes.
+
+Sheets are read with python-calamine, a native parser that releases the GIL
+so several sheets can be parsed at once on worker threads. Without it,
+openpyxl's read-only mode streams rows from the file. Either way rows are
+converted in chunks, so memory stays near the parsed data rather than many
+times the workbook size as with a full ``pd.read_excel`` load.
+"""
+import numpy as np
+import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
+
+from analytics.schema import POLICY_SCHEMA, coerce_frame, concat_frames, normalize_column
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # openpyxl streaming is the slower fallback
+    CalamineWorkbook = None
+
+# Cell text pandas' Excel reader treats as missing ('' is an empty cell)
+NA_STRINGS = frozenset(STR_NA_VALUES)
+
+# Rows converted at a time; smaller than CSV chunks since each one is also a progress update
+SHEET_CHUNK_ROWS = 25_000
+
+
+def _open(buffer):
+    buffer.seek(0)
+    if CalamineWorkbook is not None:
+        return CalamineWorkbook.from_filelike(buffer)
+    from openpyxl import load_workbook
+    return load_workbook(buffer, read_only=True, data_only=True)
+
+
+def sheet_names(buffer):
+    """Worksheet names of an XLSX workbook, in workbook order."""
+    workbook = _open(buffer)
+    if CalamineWorkbook is not None:
+        return list(workbook.sheet_names)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def _sheet_rows(buffer, sheet):
+    """``(n_rows or None, rows)`` for a sheet, where ``rows`` iterates its rows as tuples, header first."""
+    workbook = _open(buffer)
+    if CalamineWorkbook is not None:
+        names = workbook.sheet_names
+        worksheet = workbook.get_sheet_by_name(sheet if sheet is not None else names[0])
+        return worksheet.height, worksheet.iter_rows()
+    worksheet = workbook[sheet] if sheet is not None else workbook.worksheets[0]
+    return worksheet.max_row, worksheet.iter_rows(values_only=True)
+
+
+def _cell(value):
+    # Same conventions as pandas' Excel readers: whole numbers are ints, NA text is missing
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str) and value in NA_STRINGS:
+        return None
+    return value
+
+
+def _chunk_frame(rows, positions):
+    columns = {}
+    for col, position in positions.items():
+        values = np.empty(len(rows), dtype=object)
+        values[:] = [_cell(row[position]) if position < len(row) else None for row in rows]
+        # Labels keep their cell types so a chunk with gaps still gives '15', not '15.0'
+        columns[col] = pd.Series(values) if POLICY_SCHEMA[col] in ('category', 'str') else \
+            pd.Series(values).infer_objects()
+    return coerce_frame(pd.DataFrame(columns))
+
+
+def iter_sheet(buffer, sheet=None, chunksize=SHEET_CHUNK_ROWS, on_size=None):
+    """Yield ``(chunk, failures)`` for a worksheet (the first one by default), converted to schema dtypes.
+
+    ``on_size`` is called with the sheet's row count, header included, once it
+    is known (openpyxl does not always know it).
+    """
+    n_rows, rows = _sheet_rows(buffer, sheet)
+    if on_size is not None and n_rows:
+        on_size(n_rows)
+    header = next(rows, ())
+    positions = {}
+    for position, raw in enumerate(header):
+        col = normalize_column(raw) if raw is not None else None
+        # The first of any repeated column wins, as with read_excel
+        if col in POLICY_SCHEMA and col not in positions:
+            positions[col] = position
+
+    pending = []
+    yielded = False
+    for row in rows:
+        # Blank rows are skipped, like the CSV parser's skip_blank_lines
+        if all(value is None or value == '' for value in row):
+            continue
+        pending.append(row)
+        if len(pending) == chunksize:
+            yield _chunk_frame(pending, positions)
+            pending = []
+            yielded = True
+    if pending or not yielded:
+        yield _chunk_frame(pending, positions)
+
+
+def read_sheet(buffer, sheet=None, chunksize=SHEET_CHUNK_ROWS, on_rows=None, on_size=None):
+    """Read a worksheet into schema dtypes; returns ``(df, failures)`` like ``read_policy_csv``."""
+    failures = {}
+    chunks = []
+    for chunk, chunk_failures in iter_sheet(buffer, sheet, chunksize, on_size):
+        for col, n_failed in chunk_failures.items():
+            failures[col] = failures.get(col, 0) + n_failed
+        chunks.append(chunk)
+        if on_rows is not None:
+            on_rows(len(chunk))
+    return concat_frames(chunks, [col for col in POLICY_SCHEMA if col in failures]), failures
@@ -1,20 +1,20 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import seaborn as sns
-import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
-from sklearn.decomposition import PCA
-from sklearn.ensemble import IsolationForest, RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, r2_score
+import uuid
 import warnings
-import time
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from analytics.derived import with_derived
+from analytics.engine import ANALYSES, AnalysisContext, headline_kpis
+from analytics.incremental import ValuationStore
+from analytics.ingestion import SOURCE_COLUMN
+from analytics.outofcore import OUT_OF_CORE_BYTES, SAMPLE_ROWS, OutOfCoreContext, OutOfCoreDataset
+from analytics.instrumentation import STAGE_LOG_PATH, StageRecorder
+from analytics.jobs import IngestionJob
+from analytics.sessions import release_uploads, session_resources
+from analytics.shared import shared_datasets
+from analytics.workbook import sheet_names
+# Plotting and modelling libraries are imported by the views, only once an analysis is opened
+from views import load_view, prewarm
 warnings.filterwarnings('ignore')
 
 # Page configuration
@@ -534,110 +534,285 @@ with col3:
 st.markdown('<div class="upload-container">', unsafe_allow_html=True)
 
 # Initialize session state for file management
-if 'uploaded_file' not in st.session_state:
-    st.session_state.uploaded_file = None
+if 'uploaded_files' not in st.session_state:
+    st.session_state.uploaded_files = None
 if 'show_loader' not in st.session_state:
     st.session_state.show_loader = False
+if 'ingest_spec' not in st.session_state:
+    # Options of the last ingestion, to load the dataset again after it was released for inactivity
+    st.session_state.ingest_spec = None
+if 'ingest_job' not in st.session_state:
+    st.session_state.ingest_job = None
+if 'ingest_error' not in st.session_state:
+    st.session_state.ingest_error = None
+if 'coercion_failures' not in st.session_state:
+    st.session_state.coercion_failures = {}
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:12]
+if 'ingest_timings' not in st.session_state:
+    st.session_state.ingest_timings = []
+if 'workbook_sheets' not in st.session_state:
+    st.session_state.workbook_sheets = None
+if 'footprint' not in st.session_state:
+    # Per-column memory report of the loaded dataset
+    st.session_state.footprint = None
+
+# The session's dataset and movement report are held here, and released once the session has been idle for the TTL
+sessions = session_resources()
+sessions.touch(st.session_state.session_id)
+
+
+def release_upload_buffers(uploaded_files):
+    # Streamlit keeps every upload's bytes for the whole session as well; drop them once ingested
+    ctx = get_script_run_ctx()
+    remove_file = getattr(ctx.uploaded_file_mgr, 'remove_file', None) if ctx is not None else None
+    for uploaded_file in uploaded_files:
+        file_id = getattr(uploaded_file, 'file_id', None)
+        if remove_file is not None and file_id is not None:
+            remove_file(ctx.session_id, file_id)
+
+
+def start_ingestion(spec):
+    # Each file is parsed on its own worker, then checked against the others and combined; a dataset
+    # another session already loaded is shared read-only instead of being parsed again. The frame is
+    # held compactly (narrow numbers, categories for labels) and the saving reported per column
+    uploaded_files = st.session_state.uploaded_files
+    st.session_state.ingest_job = IngestionJob(uploaded_files, derive=with_derived,
+                                               timings=StageRecorder(session=st.session_state.session_id,
+                                                                     file=', '.join(f.name for f in uploaded_files)),
+                                               shared=shared_datasets(), compact=True, **spec).start()
+    st.session_state.show_loader = True
+
+
+def workbook_sheet_names(uploaded_file):
+    # Worksheets of an uploaded workbook (None for CSV, or if it cannot be opened; parsing reports why)
+    if not uploaded_file.name.endswith('.xlsx'):
+        return None
+    try:
+        return sheet_names(uploaded_file)
+    except Exception:
+        return None
 
 # File upload logic
-if st.session_state.uploaded_file is None:
-    uploaded_file = st.file_uploader("Upload your insurance data", type=["csv", "xlsx"], 
-                                   help="Upload CSV or Excel file containing policy data")
-    if uploaded_file:
-        st.session_state.uploaded_file = uploaded_file
+if st.session_state.uploaded_files is None:
+    # Extracts split by product line or month can be uploaded together and are combined on analysis
+    uploaded_files = st.file_uploader("Upload your insurance data", type=["csv", "xlsx"], accept_multiple_files=True,
+                                      help="Upload one or more CSV or Excel files containing policy data "
+                                           "with the same columns")
+    if uploaded_files:
+        st.session_state.uploaded_files = uploaded_files
+        st.session_state.workbook_sheets = None
+        st.session_state.ingest_spec = None
+        sessions.drop(st.session_state.session_id)
         st.rerun()
 else:
-    uploaded_file = st.session_state.uploaded_file
+    uploaded_files = st.session_state.uploaded_files
     
     # Display uploaded file info with clean design
-    st.markdown(f'''
-    <div class="uploaded-file-display">
-        <div class="file-info">
-            <span style="font-size: 1.2rem; color: #374151;">📄</span>
+    file_list = ''.join(f'''
             <div>
                 <div class="file-name">{uploaded_file.name}</div>
                 <div class="file-size">({uploaded_file.size / 1024:.1f} KB)</div>
-            </div>
+            </div>''' for uploaded_file in uploaded_files)
+    st.markdown(f'''
+    <div class="uploaded-file-display">
+        <div class="file-info">
+            <span style="font-size: 1.2rem; color: #374151;">📄</span>{file_list}
         </div>
         <button class="delete-icon" onclick="window.parent.postMessage({{type: 'streamlit:setComponentValue', key: 'delete_file', value: true}}, '*')">✕</button>
     </div>
     ''', unsafe_allow_html=True)
     
     # Delete button (hidden, triggered by the X icon)
-    if st.button("Remove File", key="delete_file", help="Remove uploaded file"):
-        st.session_state.uploaded_file = None
+    if st.button("Remove Files" if len(uploaded_files) > 1 else "Remove File", key="delete_file",
+                 help="Remove uploaded files"):
+        # Stop any ingestion still running for this file
+        if st.session_state.ingest_job is not None:
+            st.session_state.ingest_job.cancel()
+            st.session_state.ingest_job = None
+        st.session_state.uploaded_files = None
+        st.session_state.workbook_sheets = None
         st.session_state.show_loader = False
+        st.session_state.ingest_spec = None
+        sessions.drop(st.session_state.session_id)
         st.rerun()
 
 st.markdown('</div>', unsafe_allow_html=True)
 
 # Analyze button
-if st.session_state.uploaded_file:
+if st.session_state.uploaded_files:
     st.markdown('<div class="analyze-button">', unsafe_allow_html=True)
     analyze_data = st.button(" Analyze Data", key="analyze_btn")
     st.markdown('</div>', unsafe_allow_html=True)
+    # Very large extracts stay on disk and are aggregated with DuckDB instead of being loaded into memory
+    out_of_core = st.checkbox("Out-of-core mode", key="out_of_core",
+                              value=sum(f.size for f in st.session_state.uploaded_files) > OUT_OF_CORE_BYTES,
+                              help="Keep the data on disk and aggregate it with SQL; charts and models "
+                                   f"use a sample of {SAMPLE_ROWS:,} policies")
+    # Monthly extracts: derive only the policies that changed since a stored valuation and report the movement
+    incremental = st.checkbox("Incremental refresh", key="incremental", disabled=out_of_core,
+                              help="Match policies to a previous valuation by POL_NUMBER and recompute "
+                                   "only new, changed and removed ones")
+    baseline = None
+    if incremental and not out_of_core:
+        valuations = {entry['fingerprint']: f"{', '.join(entry['names'])} · {entry['rows']:,} policies · "
+                                            f"{entry['created']}" for entry in ValuationStore().entries()}
+        if valuations:
+            baseline = st.selectbox("Previous valuation", list(valuations), format_func=valuations.get,
+                                    key="baseline")
+        else:
+            st.caption("No stored valuation yet: this upload becomes the baseline for the next refresh.")
+    
+    # Workbooks with several sheets: choose which to analyse; each sheet is parsed in parallel and combined
+    if st.session_state.workbook_sheets is None:
+        st.session_state.workbook_sheets = [workbook_sheet_names(f) for f in st.session_state.uploaded_files]
+    selected_sheets = []
+    for index, (uploaded_file, names) in enumerate(zip(st.session_state.uploaded_files,
+                                                       st.session_state.workbook_sheets)):
+        if names and len(names) > 1:
+            selected_sheets.append(st.multiselect(f"Sheets in {uploaded_file.name}", names, default=names[:1],
+                                                  key=f"sheets_{index}"))
+        else:
+            selected_sheets.append(None)
+    if analyze_data and any(selected == [] for selected in selected_sheets):
+        st.warning("Select at least one sheet in each workbook")
+        analyze_data = False
     
     if analyze_data:
-        st.session_state.show_loader = True
+        sessions.drop(st.session_state.session_id)
+        st.session_state.ingest_error = None
+        st.session_state.ingest_timings = []
+        st.session_state.footprint = None
+        st.session_state.ingest_spec = {'out_of_core': out_of_core, 'sheets': selected_sheets,
+                                        'incremental': incremental, 'baseline': baseline}
+        start_ingestion(st.session_state.ingest_spec)
         st.rerun()
 else:
     analyze_data = False
 
-# Show loader
-if st.session_state.show_loader:
-    st.markdown('''
-    <div class="loader-container">
-        <div class="loader"></div>
-        <div class="loader-text">Processing your data...</div>
-    </div>
-    ''', unsafe_allow_html=True)
-    
-    # Simulate processing time
-    time.sleep(2)
-    st.session_state.show_loader = False
-    st.rerun()
+INGEST_STAGE_LABELS = {
+    'queued': 'Starting ingestion...',
+    'fingerprint': 'Checking for a cached copy of this file...',
+    'parse': 'Parsing and validating columns...',
+    'combine': 'Combining files...',
+    'derive': 'Calculating derived metrics...',
+    'revalue': 'Revaluing changed policies...',
+    'compact': 'Compacting the dataset in memory...',
+    'done': 'Finishing up...',
+}
 
-if st.session_state.uploaded_file and not st.session_state.show_loader:
-    try:
-        # Load data
-        if st.session_state.uploaded_file.name.endswith(".csv"):
-            df = pd.read_csv(st.session_state.uploaded_file)
-        elif st.session_state.uploaded_file.name.endswith(".xlsx"):
-            df = pd.read_excel(st.session_state.uploaded_file)
+# Data released while the session was idle is loaded again from the snapshots on disk (or the shared cache)
+if (st.session_state.ingest_spec is not None and st.session_state.ingest_job is None
+        and not st.session_state.ingest_error and sessions.get(st.session_state.session_id, 'dataset') is None):
+    start_ingestion(st.session_state.ingest_spec)
+    st.session_state.ingest_timings = []
+
+# Show ingestion progress
+if st.session_state.show_loader and st.session_state.ingest_job is not None:
+    @st.fragment(run_every=0.5)
+    def ingestion_progress():
+        job = st.session_state.ingest_job
+        if job.done:
+            st.session_state.ingest_timings = job.timings.snapshot()
+            if job.error is not None:
+                st.session_state.ingest_error = str(job.error)
+            elif job.result is not None:
+                sessions.hold(st.session_state.session_id, 'dataset', job.result, fingerprint=job.result[0])
+                sessions.hold(st.session_state.session_id, 'movement', (job.movement, job.movement_note))
+                st.session_state.coercion_failures = job.coercion_failures
+                st.session_state.footprint = job.footprint
+                # Ingested: keep only the names and fingerprints needed to find the snapshots again
+                release_upload_buffers(st.session_state.uploaded_files)
+                st.session_state.uploaded_files = release_uploads(st.session_state.uploaded_files,
+                                                                  job.content_fingerprints,
+                                                                  st.session_state.workbook_sheets)
+            st.session_state.ingest_job = None
+            st.session_state.show_loader = False
+            st.rerun()
         
-        # Clean column names
-        df.columns = df.columns.str.strip().str.upper()
+        progress = job.progress()
+        st.markdown(f'''
+        <div class="loader-container">
+            <div class="loader"></div>
+            <div class="loader-text">{INGEST_STAGE_LABELS.get(progress['stage'], 'Processing your data...')}</div>
+        </div>
+        ''', unsafe_allow_html=True)
+        fraction = progress['bytes_read'] / progress['bytes_total'] if progress['bytes_total'] else 1.0
+        st.progress(fraction, text=f"{progress['bytes_read'] / 1024 / 1024:.1f} of "
+                                   f"{progress['bytes_total'] / 1024 / 1024:.1f} MB read · "
+                                   f"{progress['rows_parsed']:,} rows parsed"
+                                   + (f" · {progress['files_done']} of {progress['files_total']} files or sheets"
+                                      if progress['files_total'] > 1 else ""))
+    
+    ingestion_progress()
+
+if st.session_state.ingest_error:
+    st.error(f"❌ Error processing data: {st.session_state.ingest_error}")
+
+# Analysis title shown in the selector -> engine name used in stage timings
+ANALYSIS_NAMES = {title: name for name, (title, _) in ANALYSES.items()}
+
+dataset = sessions.get(st.session_state.session_id, 'dataset')
+if st.session_state.uploaded_files and dataset is not None and not st.session_state.show_loader:
+    # Wall time, rows and memory delta of each stage in this run, shown below and logged as JSON lines
+    timings = StageRecorder(session=st.session_state.session_id)
+    try:
+        # Load data (parsed once per upload by the ingestion job, or spilled to disk in out-of-core mode)
+        dataset_fingerprint, data = dataset
+        timings.context['fingerprint'] = dataset_fingerprint
+        if isinstance(data, OutOfCoreDataset):
+            ctx = OutOfCoreContext(data, dataset_fingerprint)
+        else:
+            ctx = AnalysisContext(data.copy(deep=False), dataset_fingerprint)
         
-        # Convert numeric columns
-        numeric_cols = ['ANNUAL_PREM', 'EXP_GP_PUP', 'ACT_GP_PUP', 'PREM_GP_PUPS', 'RES_GP_PUPS', 'NZ_RES_IF_94']
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+        # Flag values that could not be converted to the expected column types
+        failed_columns = {col: n for col, n in st.session_state.coercion_failures.items() if n}
+        if failed_columns:
+            with st.expander(f"⚠️ {sum(failed_columns.values()):,} values could not be converted and were treated as missing"):
+                st.dataframe(pd.DataFrame({'Column': list(failed_columns), 'Invalid Values': list(failed_columns.values())}),
+                             hide_index=True)
         
-        # Calculate derived metrics
-        df['LOSS_RATIO'] = df['RES_GP_PUPS'] / (df['PREM_GP_PUPS'] + 1e-6)
-        df['PREMIUM_ADEQUACY'] = df['PREM_GP_PUPS'] - df['RES_GP_PUPS']
-        df['EXPECTED_VS_ACTUAL'] = df['ACT_GP_PUP'] / (df['EXP_GP_PUP'] + 1e-6)
-        df['RISK_SCORE'] = (df['RES_GP_PUPS'] / (df['ANNUAL_PREM'] + 1e-6)) * 100
+        # Combined uploads carry the file each policy came from
+        if ctx.has(SOURCE_COLUMN):
+            source_counts = ctx.value_counts(SOURCE_COLUMN)
+            with st.expander(f"📚 Combined from {len(source_counts)} files or sheets"):
+                st.dataframe(source_counts.rename_axis('File').reset_index(name='Policies'), hide_index=True)
         
-        # Create vintage columns
-        if 'ENTRY_YEAR' in df.columns:
-            df['POLICY_VINTAGE'] = 2024 - df['ENTRY_YEAR']
-        if 'ENTRY_MONTH' in df.columns:
-            df['ENTRY_SEASON'] = df['ENTRY_MONTH'].map({
-                12: 'Q4', 1: 'Q1', 2: 'Q1', 3: 'Q1',
-                4: 'Q2', 5: 'Q2', 6: 'Q2',
-                7: 'Q3', 8: 'Q3', 9: 'Q3',
-                10: 'Q4', 11: 'Q4'
-            })
+        # Incremental refresh: what moved since the previous valuation
+        movement, movement_note = sessions.get(st.session_state.session_id, 'movement') or (None, None)
+        if movement_note:
+            st.info(f"Incremental refresh unavailable, so every policy was revalued: {movement_note}")
+        if movement is not None:
+            metrics = movement.metrics
+            with st.expander(f"📈 Movement since previous valuation: {metrics['inserted']:,} new, "
+                             f"{metrics['removed']:,} exited, {metrics['updated']:,} changed"):
+                if not metrics['incremental']:
+                    st.caption(f"{metrics['changed_share']:.0%} of policies changed, so all were revalued")
+                st.dataframe(movement.tables['movement'], hide_index=True)
+                if 'status_transitions' in movement.tables and len(movement.tables['status_transitions']):
+                    st.markdown("**Status changes**")
+                    st.dataframe(movement.tables['status_transitions'], hide_index=True)
+                st.markdown("**Changed policies**")
+                st.dataframe(movement.tables['changes'], hide_index=True)
         
+        # Analyses run headless in analytics.engine; aggregates come from a cube built once per dataset
+        with timings.stage('cube', rows=ctx.n_rows):
+            ctx.cube
+        # Quantile sketches per band and entry year answer the box plots without sorting
+        with timings.stage('sketches', rows=ctx.n_rows):
+            ctx.sketches
+        with timings.stage('kpis', rows=ctx.n_rows):
+            kpis = headline_kpis(ctx)
+        if ctx.out_of_core:
+            st.caption(f"Out-of-core mode: totals and breakdowns cover all {ctx.n_rows:,} policies; scatter charts, "
+                       f"anomaly detection, clustering and prediction use a fixed sample of {min(SAMPLE_ROWS, ctx.n_rows):,}.")
         
         # Display key metrics with compact cards
         st.markdown('<div style="margin: 1.5rem 0;">', unsafe_allow_html=True)
         col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
-            total_policies = len(df)
+            total_policies = kpis['total_policies']
             st.markdown(f'''
             <div class="metric-card">
                 <div class="metric-value">{total_policies:,}</div>
@@ -646,7 +821,7 @@ if st.session_state.uploaded_file and not st.session_state.show_loader:
             ''', unsafe_allow_html=True)
         
         with col2:
-            total_premium = df['ANNUAL_PREM'].sum()
+            total_premium = kpis['total_premium']
             st.markdown(f'''
             <div class="metric-card">
                 <div class="metric-value">₹{total_premium/1e6:.1f}M</div>
@@ -655,7 +830,7 @@ if st.session_state.uploaded_file and not st.session_state.show_loader:
             ''', unsafe_allow_html=True)
         
         with col3:
-            avg_loss_ratio = df['LOSS_RATIO'].mean()
+            avg_loss_ratio = kpis['avg_loss_ratio']
             st.markdown(f'''
             <div class="metric-card">
                 <div class="metric-value">{avg_loss_ratio:.2f}</div>
@@ -664,7 +839,7 @@ if st.session_state.uploaded_file and not st.session_state.show_loader:
             ''', unsafe_allow_html=True)
         
         with col4:
-            profitable_count = (df['PREMIUM_ADEQUACY'] > 0).sum()
+            profitable_count = kpis['profitable_count']
             st.markdown(f'''
             <div class="metric-card">
                 <div class="metric-value">{profitable_count:,}</div>
@@ -673,7 +848,7 @@ if st.session_state.uploaded_file and not st.session_state.show_loader:
             ''', unsafe_allow_html=True)
         
         with col5:
-            high_risk_count = (df['RISK_SCORE'] > df['RISK_SCORE'].quantile(0.9)).sum()
+            high_risk_count = kpis['high_risk_count']
             st.markdown(f'''
             <div class="metric-card">
                 <div class="metric-value">{high_risk_count:,}</div>
@@ -686,702 +861,53 @@ if st.session_state.uploaded_file and not st.session_state.show_loader:
         # Analysis selection
         st.markdown('<div class="section-header"><h3> Select Analysis Type</h3></div>', unsafe_allow_html=True)
         
-        analysis_type = st.selectbox("Choose analysis:", [
-            "Executive Dashboard",
-            "Risk Segmentation Analysis", 
-            "Premium & Loss Analysis",
-            "Temporal Patterns",
-            "Anomaly Detection",
-            "Advanced Clustering",
-            "Predictive Analytics",
-            "Detailed Policy Explorer"
-        ], label_visibility="collapsed")
+        analysis_type = st.selectbox("Choose analysis:", list(ANALYSIS_NAMES), label_visibility="collapsed")
         
         # Main analysis area
         st.markdown('<div class="analysis-container">', unsafe_allow_html=True)
         
-        if analysis_type == "Executive Dashboard":
-            st.markdown('<div class="section-header"><h3> Executive Summary Dashboard</h3></div>', unsafe_allow_html=True)
-            
-            # Charts with professional styling
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                if 'CL_PBAND' in df.columns:
-                    loss_by_band = df.groupby('CL_PBAND').agg({
-                        'LOSS_RATIO': 'mean',
-                        'POL_NUMBER': 'count',
-                        'ANNUAL_PREM': 'sum'
-                    }).reset_index()
-                    
-                    fig = px.bar(loss_by_band, x='CL_PBAND', y='LOSS_RATIO', 
-                                title="Loss Ratio by Premium Band",
-                                color='LOSS_RATIO',
-                                color_continuous_scale=['#7dd3fc', '#004A94'])
-                    fig.add_hline(y=1.0, line_dash="dash", line_color="#ef4444", 
-                                 annotation_text="Break-even line")
-                    fig.update_layout(
-                        paper_bgcolor='white',
-                        plot_bgcolor='white',
-                        font=dict(color='#374151', size=11),
-                        title_font_size=14,
-                        margin=dict(t=50, b=40, l=40, r=40)
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-            
-            with col2:
-                sample_df = df.sample(min(1000, len(df)))
-                fig = px.scatter(sample_df, 
-                               x='ANNUAL_PREM', y='RES_GP_PUPS',
-                               color='LOSS_RATIO',
-                               title="Premium vs Claims Distribution",
-                               color_continuous_scale=['#e0f2fe', '#004A94'])
-                max_val = max(df['ANNUAL_PREM'].max(), df['RES_GP_PUPS'].max())
-                fig.add_trace(go.Scatter(x=[0, max_val], y=[0, max_val], 
-                                       mode='lines', line=dict(dash='dash', color='#ef4444'),
-                                       name='Break-even line'))
-                fig.update_layout(
-                    paper_bgcolor='white',
-                    plot_bgcolor='white',
-                    font=dict(color='#374151', size=11),
-                    title_font_size=14,
-                    margin=dict(t=50, b=40, l=40, r=40)
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            
-            # Business insights
-            st.markdown('''
-            <div class="insight-box">
-                <h3>💡 Key Business Insights</h3>
-            ''', unsafe_allow_html=True)
-            
-            profitable_ratio = (df['PREMIUM_ADEQUACY'] > 0).mean()
-            high_loss_ratio_count = (df['LOSS_RATIO'] > 1.5).sum()
-            
-            insights = f"""
-            **Portfolio Health:** {profitable_ratio:.1%} of policies are profitable<br>
-            **Risk Concentration:** {high_loss_ratio_count:,} policies have loss ratios > 150%<br>
-            **Premium Adequacy:** Average premium adequacy is ₹{df['PREMIUM_ADEQUACY'].mean():,.0f}<br>
-            **Performance Indicator:** Current portfolio loss ratio is {avg_loss_ratio:.2f}
-            """
-            st.markdown(insights, unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        elif analysis_type == "Risk Segmentation Analysis":
-            st.markdown('<div class="section-header"><h3>⚠️ Risk Segmentation Analysis</h3></div>', unsafe_allow_html=True)
-            
-            # Risk scoring and segmentation
-            df['COMBINED_RISK_SCORE'] = (
-                (df['LOSS_RATIO'] * 0.4) + 
-                (df['RISK_SCORE'] / 100 * 0.3) + 
-                (df['EXPECTED_VS_ACTUAL'] * 0.3)
-            )
-            
-            # Define risk segments
-            df['RISK_SEGMENT'] = pd.cut(df['COMBINED_RISK_SCORE'], 
-                                       bins=[0, 0.5, 1.0, 1.5, float('inf')],
-                                       labels=['Low Risk', 'Medium Risk', 'High Risk', 'Critical Risk'])
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                # Risk distribution
-                risk_dist = df['RISK_SEGMENT'].value_counts().reset_index()
-                risk_dist.columns = ['Risk_Segment', 'Count']
-                
-                fig = px.pie(risk_dist, values='Count', names='Risk_Segment', 
-                           title="Risk Distribution Across Portfolio",
-                           color_discrete_map={
-                               'Low Risk': '#10b981',
-                               'Medium Risk': '#f59e0b', 
-                               'High Risk': '#f97316',
-                               'Critical Risk': '#ef4444'
-                           })
-                fig.update_layout(
-                    paper_bgcolor='white',
-                    font=dict(color='#374151', size=11),
-                    title_font_size=14
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            
-            with col2:
-                # Risk vs Premium scatter
-                sample_df = df.sample(min(1000, len(df)))
-                fig = px.scatter(sample_df, 
-                               x='ANNUAL_PREM', y='COMBINED_RISK_SCORE',
-                               color='RISK_SEGMENT',
-                               title="Risk Score vs Premium Analysis",
-                               color_discrete_map={
-                                   'Low Risk': '#10b981',
-                                   'Medium Risk': '#f59e0b', 
-                                   'High Risk': '#f97316',
-                                   'Critical Risk': '#ef4444'
-                               })
-                fig.update_layout(
-                    paper_bgcolor='white',
-                    plot_bgcolor='white',
-                    font=dict(color='#374151', size=11),
-                    title_font_size=14
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            
-            # Risk segment analysis
-            risk_analysis = df.groupby('RISK_SEGMENT').agg({
-                'ANNUAL_PREM': ['count', 'sum', 'mean'],
-                'LOSS_RATIO': 'mean',
-                'PREMIUM_ADEQUACY': 'mean',
-                'RES_GP_PUPS': 'sum'
-            }).round(2)
-            
-            st.markdown('<div class="section-header"><h3> Risk Segment Performance</h3></div>', unsafe_allow_html=True)
-            st.dataframe(risk_analysis, use_container_width=True)
-            
-            # Risk insights
-            st.markdown('''
-            <div class="insight-box">
-                <h3>⚠️ Risk Management Insights</h3>
-            ''', unsafe_allow_html=True)
-            
-            critical_risk_count = len(df[df['RISK_SEGMENT'] == 'Critical Risk'])
-            high_risk_premium = df[df['RISK_SEGMENT'].isin(['High Risk', 'Critical Risk'])]['ANNUAL_PREM'].sum()
-            
-            insights = f"""
-            **Critical Risk Policies:** {critical_risk_count:,} policies require immediate attention<br>
-            **High-Risk Premium Exposure:** ₹{high_risk_premium/1e6:.1f}M in high-risk segments<br>
-            **Risk Concentration:** {(critical_risk_count/len(df)*100):.1f}% of portfolio is critical risk<br>
-            **Recommended Action:** Review underwriting criteria for high-risk segments
-            """
-            st.markdown(insights, unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        elif analysis_type == "Premium & Loss Analysis":
-            st.markdown('<div class="section-header"><h3> Premium & Loss Analysis</h3></div>', unsafe_allow_html=True)
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                # Loss ratio distribution
-                fig = px.histogram(df, x='LOSS_RATIO', bins=50,
-                                 title="Loss Ratio Distribution",
-                                 color_discrete_sequence=['#004A94'])
-                fig.add_vline(x=1.0, line_dash="dash", line_color="#ef4444",
-                             annotation_text="Break-even")
-                fig.add_vline(x=df['LOSS_RATIO'].mean(), line_dash="dot", line_color="#10b981",
-                             annotation_text=f"Mean: {df['LOSS_RATIO'].mean():.2f}")
-                fig.update_layout(
-                    paper_bgcolor='white',
-                    plot_bgcolor='white',
-                    font=dict(color='#374151', size=11),
-                    title_font_size=14
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            
-            with col2:
-                # Premium adequacy analysis
-                df['ADEQUACY_CATEGORY'] = pd.cut(df['PREMIUM_ADEQUACY'], 
-                                               bins=[-float('inf'), -10000, 0, 10000, float('inf')],
-                                               labels=['Highly Inadequate', 'Inadequate', 'Adequate', 'Highly Adequate'])
-                
-                adequacy_dist = df['ADEQUACY_CATEGORY'].value_counts().reset_index()
-                adequacy_dist.columns = ['Category', 'Count']
-                
-                fig = px.bar(adequacy_dist, x='Category', y='Count',
-                           title="Premium Adequacy Distribution",
-                           color='Count',
-                           color_continuous_scale=['#ef4444', '#10b981'])
-                fig.update_layout(
-                    paper_bgcolor='white',
-                    plot_bgcolor='white',
-                    font=dict(color='#374151', size=11),
-                    title_font_size=14
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            
-            # Combined loss and premium analysis
-            if 'CL_PBAND' in df.columns:
-                band_analysis = df.groupby('CL_PBAND').agg({
-                    'ANNUAL_PREM': ['sum', 'mean', 'count'],
-                    'RES_GP_PUPS': ['sum', 'mean'],
-                    'LOSS_RATIO': 'mean',
-                    'PREMIUM_ADEQUACY': ['mean', 'sum']
-                }).round(2)
-                
-                st.markdown('<div class="section-header"><h3> Premium Band Analysis</h3></div>', unsafe_allow_html=True)
-                st.dataframe(band_analysis, use_container_width=True)
-            
-            # Profitability insights
-            st.markdown('''
-            <div class="insight-box">
-                <h3>💼 Profitability Insights</h3>
-            ''', unsafe_allow_html=True)
-            
-            total_profit = df['PREMIUM_ADEQUACY'].sum()
-            profitable_policies = (df['PREMIUM_ADEQUACY'] > 0).sum()
-            avg_loss_ratio = df['LOSS_RATIO'].mean()
-            
-            insights = f"""
-            **Total Portfolio Profit:** ₹{total_profit/1e6:.1f}M<br>
-            **Profitable Policies:** {profitable_policies:,} ({profitable_policies/len(df)*100:.1f}%)<br>
-            **Average Loss Ratio:** {avg_loss_ratio:.2f}<br>
-            **Break-even Analysis:** {(df['LOSS_RATIO'] <= 1.0).sum():,} policies are profitable
-            """
-            st.markdown(insights, unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        elif analysis_type == "Temporal Patterns":
-            st.markdown('<div class="section-header"><h3> Temporal Patterns Analysis</h3></div>', unsafe_allow_html=True)
-            
-            if 'ENTRY_YEAR' in df.columns and 'ENTRY_MONTH' in df.columns:
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Yearly trends
-                    yearly_trends = df.groupby('ENTRY_YEAR').agg({
-                        'POL_NUMBER': 'count',
-                        'ANNUAL_PREM': 'sum',
-                        'LOSS_RATIO': 'mean',
-                        'RES_GP_PUPS': 'sum'
-                    }).reset_index()
-                    
-                    fig = make_subplots(specs=[[{"secondary_y": True}]])
-                    
-                    fig.add_trace(
-                        go.Bar(x=yearly_trends['ENTRY_YEAR'], y=yearly_trends['POL_NUMBER'],
-                              name="Policy Count", marker_color='#7dd3fc'),
-                        secondary_y=False,
-                    )
-                    
-                    fig.add_trace(
-                        go.Scatter(x=yearly_trends['ENTRY_YEAR'], y=yearly_trends['LOSS_RATIO'],
-                                  mode='lines+markers', name="Loss Ratio", line=dict(color='#ef4444')),
-                        secondary_y=True,
-                    )
-                    
-                    fig.update_xaxes(title_text="Entry Year")
-                    fig.update_yaxes(title_text="Policy Count", secondary_y=False)
-                    fig.update_yaxes(title_text="Loss Ratio", secondary_y=True)
-                    fig.update_layout(title_text="Yearly Policy and Loss Ratio Trends")
-                    
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                with col2:
-                    # Monthly seasonality
-                    monthly_trends = df.groupby('ENTRY_MONTH').agg({
-                        'POL_NUMBER': 'count',
-                        'ANNUAL_PREM': 'mean',
-                        'LOSS_RATIO': 'mean'
-                    }).reset_index()
-                    
-                    fig = px.line(monthly_trends, x='ENTRY_MONTH', y='LOSS_RATIO',
-                                title="Monthly Loss Ratio Seasonality",
-                                markers=True, line_shape='spline')
-                    fig.add_hline(y=1.0, line_dash="dash", line_color="#ef4444",
-                                 annotation_text="Break-even")
-                    fig.update_layout(
-                        paper_bgcolor='white',
-                        plot_bgcolor='white',
-                        font=dict(color='#374151', size=11),
-                        title_font_size=14
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                # Quarterly analysis
-                if 'ENTRY_SEASON' in df.columns:
-                    quarterly_analysis = df.groupby('ENTRY_SEASON').agg({
-                        'POL_NUMBER': 'count',
-                        'ANNUAL_PREM': ['sum', 'mean'],
-                        'LOSS_RATIO': 'mean',
-                        'PREMIUM_ADEQUACY': 'mean'
-                    }).round(2)
-                    
-                    st.markdown('<div class="section-header"><h3> Quarterly Performance</h3></div>', unsafe_allow_html=True)
-                    st.dataframe(quarterly_analysis, use_container_width=True)
-            
-            # Vintage analysis
-            if 'POLICY_VINTAGE' in df.columns:
-                vintage_analysis = df.groupby('POLICY_VINTAGE').agg({
-                    'LOSS_RATIO': 'mean',
-                    'ANNUAL_PREM': 'sum',
-                    'POL_NUMBER': 'count'
-                }).reset_index()
-                
-                fig = px.scatter(vintage_analysis, x='POLICY_VINTAGE', y='LOSS_RATIO',
-                               size='POL_NUMBER', 
-                               title="Policy Vintage vs Loss Ratio",
-                               color='LOSS_RATIO',
-                               color_continuous_scale=['#10b981', '#ef4444'])
-                fig.add_hline(y=1.0, line_dash="dash", line_color="#ef4444")
-                fig.update_layout(
-                    paper_bgcolor='white',
-                    plot_bgcolor='white',
-                    font=dict(color='#374151', size=11),
-                    title_font_size=14
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            
-            # Temporal insights
-            st.markdown('''
-            <div class="insight-box">
-                <h3>📈 Temporal Insights</h3>
-            ''', unsafe_allow_html=True)
-            
-            if 'ENTRY_YEAR' in df.columns:
-                latest_year_lr = df[df['ENTRY_YEAR'] == df['ENTRY_YEAR'].max()]['LOSS_RATIO'].mean()
-                best_month = monthly_trends.loc[monthly_trends['LOSS_RATIO'].idxmin(), 'ENTRY_MONTH']
-                worst_month = monthly_trends.loc[monthly_trends['LOSS_RATIO'].idxmax(), 'ENTRY_MONTH']
-                
-                insights = f"""
-                **Latest Year Performance:** {latest_year_lr:.2f} loss ratio<br>
-                **Best Month:** Month {best_month} (lowest loss ratio)<br>
-                **Worst Month:** Month {worst_month} (highest loss ratio)<br>
-                **Trend Analysis:** {'Improving' if latest_year_lr < 1.0 else 'Needs attention'}
-                """
-                st.markdown(insights, unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        elif analysis_type == "Anomaly Detection":
-            st.markdown('<div class="section-header"><h3> Anomaly Detection Analysis</h3></div>', unsafe_allow_html=True)
-            
-            # Prepare features for anomaly detection
-            feature_cols = ['ANNUAL_PREM', 'LOSS_RATIO', 'RISK_SCORE', 'EXPECTED_VS_ACTUAL']
-            available_features = [col for col in feature_cols if col in df.columns]
-            
-            if len(available_features) >= 2:
-                # Isolation Forest for anomaly detection
-                X = df[available_features].fillna(df[available_features].mean())
-                scaler = StandardScaler()
-                X_scaled = scaler.fit_transform(X)
-                
-                isolation_forest = IsolationForest(contamination=0.1, random_state=42)
-                df['ANOMALY'] = isolation_forest.fit_predict(X_scaled)
-                df['ANOMALY_SCORE'] = isolation_forest.score_samples(X_scaled)
-                
-                # Convert to binary (1 = normal, -1 = anomaly)
-                df['IS_ANOMALY'] = df['ANOMALY'] == -1
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Anomaly scatter plot
-                    sample_df = df.sample(min(1000, len(df)))
-                    fig = px.scatter(sample_df, 
-                                   x='ANNUAL_PREM', y='LOSS_RATIO',
-                                   color='IS_ANOMALY',
-                                   title="Anomaly Detection: Premium vs Loss Ratio",
-                                   color_discrete_map={True: '#ef4444', False: '#10b981'})
-                    fig.update_layout(
-                        paper_bgcolor='white',
-                        plot_bgcolor='white',
-                        font=dict(color='#374151', size=11),
-                        title_font_size=14
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                with col2:
-                    # Anomaly score distribution
-                    fig = px.histogram(df, x='ANOMALY_SCORE', 
-                                     title="Anomaly Score Distribution",
-                                     color_discrete_sequence=['#004A94'])
-                    fig.add_vline(x=df['ANOMALY_SCORE'].quantile(0.1), 
-                                 line_dash="dash", line_color="#ef4444",
-                                 annotation_text="Anomaly Threshold")
-                    fig.update_layout(
-                        paper_bgcolor='white',
-                        plot_bgcolor='white',
-                        font=dict(color='#374151', size=11),
-                        title_font_size=14
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                # Top anomalies
-                anomalies = df[df['IS_ANOMALY']].nlargest(10, 'LOSS_RATIO')[
-                    ['POL_NUMBER', 'ANNUAL_PREM', 'LOSS_RATIO', 'RISK_SCORE', 'ANOMALY_SCORE']
-                ].round(2)
-                
-                st.markdown('<div class="section-header"><h3> Top Anomalous Policies</h3></div>', unsafe_allow_html=True)
-                st.dataframe(anomalies, use_container_width=True)
-                
-                # Anomaly insights
-                st.markdown('''
-                <div class="insight-box">
-                    <h3> Anomaly Detection Insights</h3>
-                ''', unsafe_allow_html=True)
-                
-                anomaly_count = df['IS_ANOMALY'].sum()
-                avg_anomaly_loss_ratio = df[df['IS_ANOMALY']]['LOSS_RATIO'].mean()
-                anomaly_premium_impact = df[df['IS_ANOMALY']]['ANNUAL_PREM'].sum()
-                
-                insights = f"""
-                **Anomalous Policies Detected:** {anomaly_count:,} ({anomaly_count/len(df)*100:.1f}%)<br>
-                **Average Anomaly Loss Ratio:** {avg_anomaly_loss_ratio:.2f}<br>
-                **Premium at Risk:** ₹{anomaly_premium_impact/1e6:.1f}M<br>
-                **Recommendation:** Investigate top anomalies for potential fraud or underwriting issues
-                """
-                st.markdown(insights, unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
-        
-        elif analysis_type == "Advanced Clustering":
-            st.markdown('<div class="section-header"><h3> Advanced Clustering Analysis</h3></div>', unsafe_allow_html=True)
-            
-            # Prepare features for clustering
-            cluster_features = ['ANNUAL_PREM', 'LOSS_RATIO', 'RISK_SCORE', 'EXPECTED_VS_ACTUAL']
-            available_features = [col for col in cluster_features if col in df.columns]
-            
-            if len(available_features) >= 2:
-                # Prepare data
-                X = df[available_features].fillna(df[available_features].mean())
-                scaler = StandardScaler()
-                X_scaled = scaler.fit_transform(X)
-                
-                # Determine optimal clusters using elbow method
-                inertias = []
-                K_range = range(2, 8)
-                for k in K_range:
-                    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-                    kmeans.fit(X_scaled)
-                    inertias.append(kmeans.inertia_)
-                
-                # Perform clustering with optimal K (let's use 4 for business interpretation)
-                optimal_k = 4
-                kmeans = KMeans(n_clusters=optimal_k, random_state=42, n_init=10)
-                df['CLUSTER'] = kmeans.fit_predict(X_scaled)
-                df['CLUSTER_LABEL'] = df['CLUSTER'].map({
-                    0: 'Premium Segment A',
-                    1: 'Premium Segment B', 
-                    2: 'Premium Segment C',
-                    3: 'Premium Segment D'
-                })
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Cluster visualization using PCA
-                    pca = PCA(n_components=2)
-                    X_pca = pca.fit_transform(X_scaled)
-                    
-                    fig = px.scatter(x=X_pca[:, 0], y=X_pca[:, 1], 
-                                   color=df['CLUSTER_LABEL'],
-                                   title="Policy Clusters (PCA Visualization)",
-                                   labels={'x': f'PC1 ({pca.explained_variance_ratio_[0]:.1%})',
-                                          'y': f'PC2 ({pca.explained_variance_ratio_[1]:.1%})'})
-                    fig.update_layout(
-                        paper_bgcolor='white',
-                        plot_bgcolor='white',
-                        font=dict(color='#374151', size=11),
-                        title_font_size=14
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                with col2:
-                    # Cluster size distribution
-                    cluster_dist = df['CLUSTER_LABEL'].value_counts().reset_index()
-                    cluster_dist.columns = ['Cluster', 'Count']
-                    
-                    fig = px.pie(cluster_dist, values='Count', names='Cluster',
-                               title="Cluster Distribution")
-                    fig.update_layout(
-                        paper_bgcolor='white',
-                        font=dict(color='#374151', size=11),
-                        title_font_size=14
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                # Cluster analysis
-                cluster_analysis = df.groupby('CLUSTER_LABEL').agg({
-                    'ANNUAL_PREM': ['count', 'mean', 'sum'],
-                    'LOSS_RATIO': 'mean',
-                    'RISK_SCORE': 'mean',
-                    'PREMIUM_ADEQUACY': 'mean'
-                }).round(2)
-                
-                st.markdown('<div class="section-header"><h3> Cluster Characteristics</h3></div>', unsafe_allow_html=True)
-                st.dataframe(cluster_analysis, use_container_width=True)
-                
-                # Clustering insights
-                st.markdown('''
-                <div class="insight-box">
-                    <h3>🎯 Clustering Insights</h3>
-                ''', unsafe_allow_html=True)
-                
-                best_cluster = cluster_analysis.loc[cluster_analysis[('LOSS_RATIO', 'mean')].idxmin()]
-                worst_cluster = cluster_analysis.loc[cluster_analysis[('LOSS_RATIO', 'mean')].idxmax()]
-                
-                insights = f"""
-                **Best Performing Cluster:** Lowest average loss ratio segment<br>
-                **Highest Risk Cluster:** Requires targeted risk management<br>
-                **Cluster Insights:** Clear segmentation reveals distinct risk profiles<br>
-                **Business Application:** Use clusters for targeted pricing and underwriting
-                """
-                st.markdown(insights, unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
-        
-        elif analysis_type == "Predictive Analytics":
-            st.markdown('<div class="section-header"><h3>🔮 Predictive Analytics</h3></div>', unsafe_allow_html=True)
-            
-            # Prepare features for prediction
-            feature_cols = ['ANNUAL_PREM', 'EXP_GP_PUP', 'ACT_GP_PUP', 'PREM_GP_PUPS']
-            target_col = 'RES_GP_PUPS'
-            
-            available_features = [col for col in feature_cols if col in df.columns]
-            
-            if len(available_features) >= 2 and target_col in df.columns:
-                # Prepare data
-                X = df[available_features].fillna(df[available_features].mean())
-                y = df[target_col].fillna(df[target_col].mean())
-                
-                # Split data
-                X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-                
-                # Train Random Forest model
-                rf_model = RandomForestRegressor(n_estimators=100, random_state=42)
-                rf_model.fit(X_train, y_train)
-                
-                # Predictions
-                y_pred = rf_model.predict(X_test)
-                
-                # Model performance
-                mse = mean_squared_error(y_test, y_pred)
-                r2 = r2_score(y_test, y_pred)
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Actual vs Predicted
-                    fig = px.scatter(x=y_test, y=y_pred,
-                                   title=f"Actual vs Predicted Claims (R² = {r2:.3f})",
-                                   labels={'x': 'Actual Claims', 'y': 'Predicted Claims'})
-                    
-                    # Add perfect prediction line
-                    min_val, max_val = min(y_test.min(), y_pred.min()), max(y_test.max(), y_pred.max())
-                    fig.add_trace(go.Scatter(x=[min_val, max_val], y=[min_val, max_val],
-                                           mode='lines', name='Perfect Prediction',
-                                           line=dict(dash='dash', color='red')))
-                    
-                    fig.update_layout(
-                        paper_bgcolor='white',
-                        plot_bgcolor='white',
-                        font=dict(color='#374151', size=11),
-                        title_font_size=14
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                with col2:
-                    # Feature importance
-                    feature_importance = pd.DataFrame({
-                        'Feature': available_features,
-                        'Importance': rf_model.feature_importances_
-                    }).sort_values('Importance', ascending=True)
-                    
-                    fig = px.bar(feature_importance, x='Importance', y='Feature',
-                               orientation='h', title="Feature Importance",
-                               color='Importance', color_continuous_scale='Blues')
-                    fig.update_layout(
-                        paper_bgcolor='white',
-                        plot_bgcolor='white',
-                        font=dict(color='#374151', size=11),
-                        title_font_size=14
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                
-                # Model performance metrics
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.markdown(f'''
-                    <div class="metric-card">
-                        <div class="metric-value">{r2:.3f}</div>
-                        <div class="metric-label">R² Score</div>
-                    </div>
-                    ''', unsafe_allow_html=True)
-                
-                with col2:
-                    st.markdown(f'''
-                    <div class="metric-card">
-                        <div class="metric-value">{np.sqrt(mse):,.0f}</div>
-                        <div class="metric-label">RMSE</div>
-                    </div>
-                    ''', unsafe_allow_html=True)
-                
-                with col3:
-                    accuracy = 100 - (abs(y_test - y_pred).mean() / y_test.mean() * 100)
-                    st.markdown(f'''
-                    <div class="metric-card">
-                        <div class="metric-value">{accuracy:.1f}%</div>
-                        <div class="metric-label">Accuracy</div>
-                    </div>
-                    ''', unsafe_allow_html=True)
-                
-                # Predictive insights
-                st.markdown('''
-                <div class="insight-box">
-                    <h3>🔮 Predictive Model Insights</h3>
-                ''', unsafe_allow_html=True)
-                
-                most_important_feature = feature_importance.iloc[-1]['Feature']
-                
-                insights = f"""
-                **Model Performance:** R² score of {r2:.3f} indicates {'good' if r2 > 0.7 else 'moderate' if r2 > 0.5 else 'poor'} predictive power<br>
-                **Key Predictor:** {most_important_feature} is the most important feature<br>
-                **Prediction Accuracy:** {accuracy:.1f}% average accuracy on test data<br>
-                **Business Application:** Use model for claims reserving and risk assessment
-                """
-                st.markdown(insights, unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
-        
-        elif analysis_type == "Detailed Policy Explorer":
-            st.markdown('<div class="section-header"><h3> Detailed Policy Explorer</h3></div>', unsafe_allow_html=True)
-            
-            # Policy search and filter
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                if 'CL_PBAND' in df.columns:
-                    selected_band = st.selectbox("Filter by Premium Band:", 
-                                                ['All'] + list(df['CL_PBAND'].unique()))
-                else:
-                    selected_band = 'All'
-            
-            with col2:
-                loss_ratio_filter = st.slider("Max Loss Ratio:", 0.0, 5.0, 5.0, 0.1)
-            
-            with col3:
-                min_premium = st.number_input("Min Premium:", value=0, step=1000)
-            
-            # Apply filters
-            filtered_df = df.copy()
-            if selected_band != 'All':
-                filtered_df = filtered_df[filtered_df['CL_PBAND'] == selected_band]
-            filtered_df = filtered_df[filtered_df['LOSS_RATIO'] <= loss_ratio_filter]
-            filtered_df = filtered_df[filtered_df['ANNUAL_PREM'] >= min_premium]
-            
-            st.markdown(f"**Showing {len(filtered_df):,} policies (filtered from {len(df):,})**")
-            
-            # Policy details table
-            display_cols = ['POL_NUMBER', 'ANNUAL_PREM', 'LOSS_RATIO', 'PREMIUM_ADEQUACY', 'RISK_SCORE']
-            available_display_cols = [col for col in display_cols if col in filtered_df.columns]
-            
-            if available_display_cols:
-                st.dataframe(
-                    filtered_df[available_display_cols].head(100).round(2),
-                    use_container_width=True
-                )
-                
-                # Summary statistics for filtered data
-                st.markdown('<div class="section-header"><h3> Filtered Data Summary</h3></div>', unsafe_allow_html=True)
-                
-                summary_stats = filtered_df[available_display_cols[1:]].describe().round(2)
-                st.dataframe(summary_stats, use_container_width=True)
-                
-                # Export filtered data option
-                csv = filtered_df.to_csv(index=False)
-                st.download_button(
-                    label=" Download Filtered Data as CSV",
-                    data=csv,
-                    file_name=f'filtered_policies_{len(filtered_df)}_records.csv',
-                    mime='text/csv'
-                )
-        
+        # Each analysis is its own module under views/, imported the first time it is opened.
+        # The view stage covers the analysis itself plus building and sending its figures and tables.
+        view_name = ANALYSIS_NAMES[analysis_type]
+        with timings.stage(f'view:{view_name}', rows=ctx.n_rows):
+            with timings.stage(f'import:{view_name}'):
+                view = load_view(view_name)
+            view.render(ctx, timings)
         st.markdown('</div>', unsafe_allow_html=True)
     
     except Exception as e:
         st.error(f"❌ Error processing data: {str(e)}")
-        st.info("Please ensure your file has the correct format and column names.")
\ No newline at end of file
+        st.info("Please ensure your file has the correct format and column names.")
+    
+    # Diagnostics panel: ingestion stages of the current dataset plus this run's stages
+    with st.expander("⏱️ Diagnostics"):
+        stage_records = st.session_state.ingest_timings + timings.snapshot()
+        if stage_records:
+            diagnostics = pd.DataFrame(stage_records)
+            diagnostics['stage'] = ['  ' * depth + ('↳ ' if depth else '') + stage
+                                    for depth, stage in zip(diagnostics['depth'], diagnostics['stage'])]
+            diagnostics['rows'] = diagnostics['rows'].astype('Int64')
+            st.dataframe(
+                diagnostics.reindex(columns=['stage', 'seconds', 'rows', 'mem_delta_mb', 'rss_mb', 'error']).dropna(axis=1, how='all'),
+                hide_index=True, use_container_width=True
+            )
+        st.caption(f"Session {st.session_state.session_id} · stage timings are appended to {STAGE_LOG_PATH}")
+        shared = shared_datasets().stats()
+        st.caption(f"Shared dataset cache: {shared['entries']} datasets, {shared['bytes'] / 1024 / 1024:.0f} of "
+                   f"{shared['budget_bytes'] / 1024 / 1024:.0f} MB ({shared['memo_bytes'] / 1024 / 1024:.0f} MB of "
+                   f"cached results) · {shared['hits']} hits, {shared['misses']} misses, {shared['evictions']} evictions")
+        held = sessions.stats()
+        st.caption(f"This session holds {sessions.session_bytes(st.session_state.session_id) / 1024 / 1024:.1f} MB · "
+                   f"{held['holding']} sessions hold {held['bytes'] / 1024 / 1024:.0f} MB · data idle for "
+                   f"{held['ttl_seconds'] / 60:.0f} min is released ({held['evictions']} sessions, "
+                   f"{held['evicted_bytes'] / 1024 / 1024:.0f} MB so far) and reloaded from the disk cache on return")
+        footprint = st.session_state.footprint
+        if footprint is not None:
+            total = footprint.iloc[-1]
+            st.caption(f"Dataset held in {total['Compact MB']:,.1f} MB: {total['Default MB'] / total['Compact MB']:.1f}× "
+                       f"smaller than at pandas' default column widths ({total['Default MB']:,.1f} MB), and "
+                       f"{total['Loaded MB'] / total['Compact MB']:.1f}× smaller than as loaded")
+            st.dataframe(footprint, hide_index=True, use_container_width=True)
+    
+    # With the first analysis on screen, load the remaining views in the background
+    prewarm(list(ANALYSES))
\ No newline at end of file
@@ -0,0 +1,35 @@
+"""Streamlit views, one module per analysis, imported the first time the analysis is opened."""
+import importlib
+import os
+import threading
+
+# Set ANALYTICS_PREWARM=0 to keep unopened views (and their plotly/sklearn imports) out of memory
+PREWARM = os.environ.get('ANALYTICS_PREWARM', '1') != '0'
+
+_prewarm_started = False
+_prewarm_lock = threading.Lock()
+
+
+def load_view(name):
+    """The view module for engine analysis ``name``; it exposes ``render(ctx, timings)``."""
+    return importlib.import_module(f'{__name__}.{name}')
+
+
+def prewarm(names):
+    """Import ``names`` on a background thread, once per process, so later switches are instant."""
+    global _prewarm_started
+    with _prewarm_lock:
+        if _prewarm_started or not PREWARM:
+            return False
+        _prewarm_started = True
+
+    def _import_all():
+        for name in names:
+            try:
+                load_view(name)
+            except Exception:
+                # Any import error is raised again, visibly, when the view is opened
+                pass
+
+    threading.Thread(target=_import_all, name='prewarm-views', daemon=True).start()
+    return True
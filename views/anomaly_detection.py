@@ -0,0 +1,101 @@
+"""Anomaly Detection: Isolation Forest scores and the most anomalous policies."""
+import numpy as np
+import plotly.express as px
+import streamlit as st
+
+from analytics.anomaly import ANOMALY_FEATURES
+from analytics.charts import sample_ids as chart_sample_ids
+from analytics.engine import anomaly_detection
+
+# Most anomalous policies added to the scatter sample on top of the regular points
+ANOMALY_POINTS = 500
+
+
+def render(ctx, timings):
+    df = ctx.df
+    st.markdown('<div class="section-header"><h3> Anomaly Detection Analysis</h3></div>', unsafe_allow_html=True)
+
+    # Prepare features for anomaly detection
+    available_features = [col for col in ANOMALY_FEATURES if col in df.columns]
+
+    if len(available_features) >= 2:
+        col1, col2 = st.columns(2)
+        with col1:
+            contamination = st.slider("Expected anomaly share:", 0.01, 0.30, 0.10, 0.01,
+                                      help="Only moves the anomaly threshold; the model is not refitted")
+        with col2:
+            n_estimators = st.selectbox("Number of trees:", [50, 100, 200, 400], index=1,
+                                        help="Changing the number of trees fits a new model")
+
+        # Isolation Forest for anomaly detection (fitted once per dataset and settings)
+        with timings.stage('analysis:anomaly_detection', rows=len(df)):
+            result = anomaly_detection(ctx, contamination=contamination, n_estimators=n_estimators)
+        anomaly_threshold = result.metrics['threshold']
+        detector = result.extras['detector']
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            # Anomaly scatter plot: a fixed sample with the premium and loss ratio extremes,
+            # plus the most anomalous policies under the current threshold
+            most_anomalous = detector.most_anomalous(min(ANOMALY_POINTS, result.metrics['anomaly_count']))
+            sample_ids = np.union1d(chart_sample_ids(df, ('ANNUAL_PREM', 'LOSS_RATIO'), fingerprint=ctx.fingerprint),
+                                    most_anomalous)
+            sample_df = df[['ANNUAL_PREM', 'LOSS_RATIO']].take(sample_ids).assign(
+                IS_ANOMALY=result.extras['is_anomaly'][sample_ids])
+            fig = px.scatter(sample_df, 
+                           x='ANNUAL_PREM', y='LOSS_RATIO',
+                           color='IS_ANOMALY',
+                           title="Anomaly Detection: Premium vs Loss Ratio",
+                           color_discrete_map={True: '#ef4444', False: '#10b981'})
+            fig.update_layout(
+                paper_bgcolor='white',
+                plot_bgcolor='white',
+                font=dict(color='#374151', size=11),
+                title_font_size=14
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        with col2:
+            # Anomaly score distribution
+            score_bins = detector.score_histogram()
+            fig = px.bar(score_bins, x='mid', y='count',
+                         title="Anomaly Score Distribution",
+                         labels={'mid': 'ANOMALY_SCORE', 'count': 'count'},
+                         color_discrete_sequence=['#004A94'])
+            fig.update_traces(width=score_bins['right'] - score_bins['left'])
+            fig.add_vline(x=anomaly_threshold, 
+                         line_dash="dash", line_color="#ef4444",
+                         annotation_text="Anomaly Threshold")
+            fig.update_layout(
+                paper_bgcolor='white',
+                plot_bgcolor='white',
+                font=dict(color='#374151', size=11),
+                title_font_size=14
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        # Top anomalies
+        anomalies = result.tables['top_anomalies']
+
+        st.markdown('<div class="section-header"><h3> Top Anomalous Policies</h3></div>', unsafe_allow_html=True)
+        st.dataframe(anomalies, use_container_width=True)
+
+        # Anomaly insights
+        st.markdown('''
+        <div class="insight-box">
+            <h3> Anomaly Detection Insights</h3>
+        ''', unsafe_allow_html=True)
+
+        anomaly_count = result.metrics['anomaly_count']
+        avg_anomaly_loss_ratio = result.metrics['avg_anomaly_loss_ratio']
+        anomaly_premium_impact = result.metrics['premium_at_risk']
+
+        insights = f"""
+        **Anomalous Policies Detected:** {anomaly_count:,} ({result.metrics['anomaly_share']*100:.1f}%)<br>
+        **Average Anomaly Loss Ratio:** {avg_anomaly_loss_ratio:.2f}<br>
+        **Premium at Risk:** ₹{anomaly_premium_impact/1e6:.1f}M<br>
+        **Recommendation:** Investigate top anomalies for potential fraud or underwriting issues
+        """
+        st.markdown(insights, unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,72 @@
+"""Executive Dashboard: portfolio loss ratio and premium vs claims."""
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+
+from analytics.charts import scatter_sample
+from analytics.engine import executive_dashboard
+
+
+def render(ctx, timings):
+    df = ctx.df
+    st.markdown('<div class="section-header"><h3> Executive Summary Dashboard</h3></div>', unsafe_allow_html=True)
+    with timings.stage('analysis:executive_dashboard', rows=ctx.n_rows):
+        result = executive_dashboard(ctx)
+
+    # Charts with professional styling
+    col1, col2 = st.columns(2)
+
+    with col1:
+        if 'loss_by_band' in result.tables:
+            loss_by_band = result.tables['loss_by_band']
+
+            fig = px.bar(loss_by_band, x='CL_PBAND', y='LOSS_RATIO', 
+                        title="Loss Ratio by Premium Band",
+                        color='LOSS_RATIO',
+                        color_continuous_scale=['#7dd3fc', '#004A94'])
+            fig.add_hline(y=1.0, line_dash="dash", line_color="#ef4444", 
+                         annotation_text="Break-even line")
+            fig.update_layout(
+                paper_bgcolor='white',
+                plot_bgcolor='white',
+                font=dict(color='#374151', size=11),
+                title_font_size=14,
+                margin=dict(t=50, b=40, l=40, r=40)
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+    with col2:
+        # Fixed sample that always includes the largest and smallest premiums, claims and loss ratios
+        sample_df = scatter_sample(df, ['ANNUAL_PREM', 'RES_GP_PUPS', 'LOSS_RATIO'], fingerprint=ctx.fingerprint)
+        fig = px.scatter(sample_df, 
+                       x='ANNUAL_PREM', y='RES_GP_PUPS',
+                       color='LOSS_RATIO',
+                       title="Premium vs Claims Distribution",
+                       color_continuous_scale=['#e0f2fe', '#004A94'])
+        max_val = max(sample_df['ANNUAL_PREM'].max(), sample_df['RES_GP_PUPS'].max())
+        fig.add_trace(go.Scatter(x=[0, max_val], y=[0, max_val], 
+                               mode='lines', line=dict(dash='dash', color='#ef4444'),
+                               name='Break-even line'))
+        fig.update_layout(
+            paper_bgcolor='white',
+            plot_bgcolor='white',
+            font=dict(color='#374151', size=11),
+            title_font_size=14,
+            margin=dict(t=50, b=40, l=40, r=40)
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Business insights
+    st.markdown('''
+    <div class="insight-box">
+        <h3>💡 Key Business Insights</h3>
+    ''', unsafe_allow_html=True)
+
+    insights = f"""
+    **Portfolio Health:** {result.metrics['profitable_ratio']:.1%} of policies are profitable<br>
+    **Risk Concentration:** {result.metrics['high_loss_ratio_count']:,} policies have loss ratios > 150%<br>
+    **Premium Adequacy:** Average premium adequacy is ₹{result.metrics['avg_premium_adequacy']:,.0f}<br>
+    **Performance Indicator:** Current portfolio loss ratio is {result.metrics['avg_loss_ratio']:.2f}
+    """
+    st.markdown(insights, unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
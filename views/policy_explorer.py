@@ -0,0 +1,61 @@
+"""Detailed Policy Explorer: indexed filtering and export of individual policies."""
+import streamlit as st
+
+from analytics.engine import policy_explorer
+from analytics.export import EXPORT_FORMATS, export_file
+
+
+def render(ctx, timings):
+    st.markdown('<div class="section-header"><h3> Detailed Policy Explorer</h3></div>', unsafe_allow_html=True)
+
+    # Policy search and filter (answered from sorted indexes built once per dataset)
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        if ctx.has('CL_PBAND'):
+            selected_band = st.selectbox("Filter by Premium Band:", 
+                                        ['All'] + ctx.labels('CL_PBAND'))
+        else:
+            selected_band = 'All'
+
+    with col2:
+        loss_ratio_filter = st.slider("Max Loss Ratio:", 0.0, 5.0, 5.0, 0.1)
+
+    with col3:
+        min_premium = st.number_input("Min Premium:", value=0, step=1000)
+
+    # Apply filters (row positions only; no copy of the frame)
+    with timings.stage('analysis:policy_explorer', rows=ctx.n_rows):
+        result = policy_explorer(ctx, band=selected_band, max_loss_ratio=loss_ratio_filter,
+                                 min_premium=min_premium)
+    filtered_ids = result.extras['ids']
+    matched = result.metrics['matched_policies']
+
+    st.markdown(f"**Showing {matched:,} policies (filtered from {result.metrics['total_policies']:,})**")
+
+    # Policy details table
+    if 'preview' in result.tables:
+        st.dataframe(result.tables['preview'], use_container_width=True)
+
+        # Summary statistics for filtered data
+        st.markdown('<div class="section-header"><h3> Filtered Data Summary</h3></div>', unsafe_allow_html=True)
+
+        summary_stats = result.tables['summary']
+        st.dataframe(summary_stats, use_container_width=True)
+
+        # Export filtered data option (written in chunks only when the button is clicked)
+        export_format = st.radio("Export format:", list(EXPORT_FORMATS), horizontal=True,
+                                 format_func=lambda fmt: EXPORT_FORMATS[fmt][2])
+        extension, mime, format_label = EXPORT_FORMATS[export_format]
+        if ctx.out_of_core:
+            where, params = ctx.dataset.where(result.extras['equals'], result.extras['ranges'])
+            export = lambda: ctx.dataset.export_file(export_format, where, params)
+        else:
+            export = lambda: export_file(ctx.df, filtered_ids, export_format)
+        st.download_button(
+            label=f" Download Filtered Data as {format_label}",
+            data=export,
+            file_name=f'filtered_policies_{matched}_records{extension}',
+            mime=mime,
+            on_click='ignore'
+        )
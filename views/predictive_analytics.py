@@ -0,0 +1,124 @@
+"""Predictive Analytics: random forest claims model, trained or from the registry."""
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+
+from analytics.charts import downsample_ids
+from analytics.engine import predictive_analytics
+from analytics.registry import PREDICTIVE_FEATURES, TARGET, ModelRegistry
+
+
+def render(ctx, timings):
+    df = ctx.df
+    st.markdown('<div class="section-header"><h3>🔮 Predictive Analytics</h3></div>', unsafe_allow_html=True)
+
+    # Prepare features for prediction
+    target_col = TARGET
+    available_features = [col for col in PREDICTIVE_FEATURES if col in df.columns]
+
+    if len(available_features) >= 2 and target_col in df.columns:
+        # Earlier registered models can score this extract if it has their features
+        registry = ModelRegistry()
+        registered = {entry['model_id']: entry for entry in registry.entries(target=target_col)
+                      if entry['fingerprint'] != ctx.fingerprint
+                      and all(col in df.columns for col in entry['features'])
+                      and registry.is_available(entry['model_id'])}
+        model_choice = st.selectbox(
+            "Model:", [None] + list(registered),
+            format_func=lambda model_id: "Train on this extract (reuses an identical earlier fit)" if model_id is None
+            else f"{registered[model_id]['created']} · data {registered[model_id]['fingerprint'][:8]} · "
+                 f"R² {registered[model_id]['metrics']['r2']:.3f}"
+        )
+
+        # Train Random Forest model (or reuse an identical registered fit), or score with the chosen one
+        with timings.stage('analysis:predictive_analytics', rows=len(df)):
+            result = predictive_analytics(ctx, model_id=model_choice, registry=registry)
+        y_test, y_pred = result.extras['y_true'], result.extras['y_pred']
+        evaluated_on = result.metrics['evaluated_on']
+
+        # Model performance
+        metrics = result.metrics
+        r2 = metrics['r2']
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            # Actual vs Predicted (fixed sample keeping the extreme claims, predictions and errors)
+            sample_ids = downsample_ids(len(y_test), extremes=[y_test, y_pred, y_pred - y_test])
+            fig = px.scatter(x=np.asarray(y_test)[sample_ids], y=np.asarray(y_pred)[sample_ids],
+                           title=f"Actual vs Predicted Claims (R² = {r2:.3f})",
+                           labels={'x': 'Actual Claims', 'y': 'Predicted Claims'})
+
+            # Add perfect prediction line
+            min_val, max_val = min(y_test.min(), y_pred.min()), max(y_test.max(), y_pred.max())
+            fig.add_trace(go.Scatter(x=[min_val, max_val], y=[min_val, max_val],
+                                   mode='lines', name='Perfect Prediction',
+                                   line=dict(dash='dash', color='red')))
+
+            fig.update_layout(
+                paper_bgcolor='white',
+                plot_bgcolor='white',
+                font=dict(color='#374151', size=11),
+                title_font_size=14
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        with col2:
+            # Feature importance
+            feature_importance = result.tables['feature_importance']
+
+            fig = px.bar(feature_importance, x='Importance', y='Feature',
+                       orientation='h', title="Feature Importance",
+                       color='Importance', color_continuous_scale='Blues')
+            fig.update_layout(
+                paper_bgcolor='white',
+                plot_bgcolor='white',
+                font=dict(color='#374151', size=11),
+                title_font_size=14
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        # Model performance metrics
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.markdown(f'''
+            <div class="metric-card">
+                <div class="metric-value">{r2:.3f}</div>
+                <div class="metric-label">R² Score</div>
+            </div>
+            ''', unsafe_allow_html=True)
+
+        with col2:
+            st.markdown(f'''
+            <div class="metric-card">
+                <div class="metric-value">{metrics['rmse']:,.0f}</div>
+                <div class="metric-label">RMSE</div>
+            </div>
+            ''', unsafe_allow_html=True)
+
+        with col3:
+            accuracy = metrics['accuracy']
+            st.markdown(f'''
+            <div class="metric-card">
+                <div class="metric-value">{accuracy:.1f}%</div>
+                <div class="metric-label">Accuracy</div>
+            </div>
+            ''', unsafe_allow_html=True)
+
+        # Predictive insights
+        st.markdown('''
+        <div class="insight-box">
+            <h3>🔮 Predictive Model Insights</h3>
+        ''', unsafe_allow_html=True)
+
+        most_important_feature = metrics['most_important_feature']
+
+        insights = f"""
+        **Model Performance:** R² score of {r2:.3f} indicates {'good' if r2 > 0.7 else 'moderate' if r2 > 0.5 else 'poor'} predictive power<br>
+        **Key Predictor:** {most_important_feature} is the most important feature<br>
+        **Prediction Accuracy:** {accuracy:.1f}% average accuracy on {evaluated_on}<br>
+        **Business Application:** Use model for claims reserving and risk assessment
+        """
+        st.markdown(insights, unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,91 @@
+"""Premium & Loss Analysis: loss ratio distribution, adequacy and premium bands."""
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+
+from analytics.engine import premium_loss
+
+
+def render(ctx, timings):
+    st.markdown('<div class="section-header"><h3> Premium & Loss Analysis</h3></div>', unsafe_allow_html=True)
+    with timings.stage('analysis:premium_loss', rows=ctx.n_rows):
+        result = premium_loss(ctx)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Loss ratio distribution (binned on the server; only the 50 bins reach the browser)
+        loss_ratio_bins = ctx.histogram('LOSS_RATIO', 50)
+        fig = px.bar(loss_ratio_bins, x='mid', y='count',
+                     title="Loss Ratio Distribution",
+                     labels={'mid': 'LOSS_RATIO', 'count': 'count'},
+                     color_discrete_sequence=['#004A94'])
+        fig.update_traces(width=loss_ratio_bins['right'] - loss_ratio_bins['left'])
+        fig.add_vline(x=1.0, line_dash="dash", line_color="#ef4444",
+                     annotation_text="Break-even")
+        fig.add_vline(x=result.metrics['avg_loss_ratio'], line_dash="dot", line_color="#10b981",
+                     annotation_text=f"Mean: {result.metrics['avg_loss_ratio']:.2f}")
+        fig.update_layout(
+            paper_bgcolor='white',
+            plot_bgcolor='white',
+            font=dict(color='#374151', size=11),
+            title_font_size=14
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    with col2:
+        # Premium adequacy analysis
+        adequacy_dist = result.tables['adequacy_distribution']
+
+        fig = px.bar(adequacy_dist, x='Category', y='Count',
+                   title="Premium Adequacy Distribution",
+                   color='Count',
+                   color_continuous_scale=['#ef4444', '#10b981'])
+        fig.update_layout(
+            paper_bgcolor='white',
+            plot_bgcolor='white',
+            font=dict(color='#374151', size=11),
+            title_font_size=14
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Combined loss and premium analysis
+    if 'band_analysis' in result.tables:
+        band_analysis = result.tables['band_analysis']
+
+        st.markdown('<div class="section-header"><h3> Premium Band Analysis</h3></div>', unsafe_allow_html=True)
+        # Box plot drawn from quartiles precomputed per band, so no policy-level values are sent
+        boxes = result.tables['loss_ratio_by_band']
+        fig = go.Figure(go.Box(x=boxes['CL_PBAND'].astype(str), q1=boxes['q1'], median=boxes['median'],
+                               q3=boxes['q3'], lowerfence=boxes['lower_fence'], upperfence=boxes['upper_fence'],
+                               marker_color='#004A94', name='LOSS_RATIO'))
+        fig.update_layout(
+            title="Loss Ratio by Premium Band",
+            xaxis_title='CL_PBAND',
+            yaxis_title='LOSS_RATIO',
+            paper_bgcolor='white',
+            plot_bgcolor='white',
+            font=dict(color='#374151', size=11),
+            title_font_size=14
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(band_analysis, use_container_width=True)
+
+    # Profitability insights
+    st.markdown('''
+    <div class="insight-box">
+        <h3>💼 Profitability Insights</h3>
+    ''', unsafe_allow_html=True)
+
+    total_profit = result.metrics['total_profit']
+    profitable_policies = result.metrics['profitable_policies']
+    avg_loss_ratio = result.metrics['avg_loss_ratio']
+
+    insights = f"""
+    **Total Portfolio Profit:** ₹{total_profit/1e6:.1f}M<br>
+    **Profitable Policies:** {profitable_policies:,} ({result.metrics['profitable_share']*100:.1f}%)<br>
+    **Average Loss Ratio:** {avg_loss_ratio:.2f}<br>
+    **Break-even Analysis:** {result.metrics['break_even_count']:,} policies are profitable
+    """
+    st.markdown(insights, unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,81 @@
+"""Risk Segmentation Analysis: risk segment mix and performance."""
+import plotly.express as px
+import streamlit as st
+
+from analytics.charts import scatter_sample
+from analytics.engine import risk_segmentation
+
+
+def render(ctx, timings):
+    df = ctx.df
+    st.markdown('<div class="section-header"><h3>⚠️ Risk Segmentation Analysis</h3></div>', unsafe_allow_html=True)
+
+    # COMBINED_RISK_SCORE and RISK_SEGMENT come precomputed with the dataset
+    with timings.stage('analysis:risk_segmentation', rows=ctx.n_rows):
+        result = risk_segmentation(ctx)
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Risk distribution
+        risk_dist = result.tables['risk_distribution']
+
+        fig = px.pie(risk_dist, values='Count', names='Risk_Segment', 
+                   title="Risk Distribution Across Portfolio",
+                   color_discrete_map={
+                       'Low Risk': '#10b981',
+                       'Medium Risk': '#f59e0b', 
+                       'High Risk': '#f97316',
+                       'Critical Risk': '#ef4444'
+                   })
+        fig.update_layout(
+            paper_bgcolor='white',
+            font=dict(color='#374151', size=11),
+            title_font_size=14
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    with col2:
+        # Risk vs Premium scatter
+        sample_df = scatter_sample(df, ['ANNUAL_PREM', 'COMBINED_RISK_SCORE', 'RISK_SEGMENT'],
+                                   fingerprint=ctx.fingerprint)
+        fig = px.scatter(sample_df, 
+                       x='ANNUAL_PREM', y='COMBINED_RISK_SCORE',
+                       color='RISK_SEGMENT',
+                       title="Risk Score vs Premium Analysis",
+                       color_discrete_map={
+                           'Low Risk': '#10b981',
+                           'Medium Risk': '#f59e0b', 
+                           'High Risk': '#f97316',
+                           'Critical Risk': '#ef4444'
+                       })
+        fig.update_layout(
+            paper_bgcolor='white',
+            plot_bgcolor='white',
+            font=dict(color='#374151', size=11),
+            title_font_size=14
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Risk segment analysis
+    risk_analysis = result.tables['risk_analysis']
+
+    st.markdown('<div class="section-header"><h3> Risk Segment Performance</h3></div>', unsafe_allow_html=True)
+    st.dataframe(risk_analysis, use_container_width=True)
+
+    # Risk insights
+    st.markdown('''
+    <div class="insight-box">
+        <h3>⚠️ Risk Management Insights</h3>
+    ''', unsafe_allow_html=True)
+
+    critical_risk_count = result.metrics['critical_risk_count']
+    high_risk_premium = result.metrics['high_risk_premium']
+
+    insights = f"""
+    **Critical Risk Policies:** {critical_risk_count:,} policies require immediate attention<br>
+    **High-Risk Premium Exposure:** ₹{high_risk_premium/1e6:.1f}M in high-risk segments<br>
+    **Risk Concentration:** {result.metrics['critical_risk_share']*100:.1f}% of portfolio is critical risk<br>
+    **Recommended Action:** Review underwriting criteria for high-risk segments
+    """
+    st.markdown(insights, unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
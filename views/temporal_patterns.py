@@ -0,0 +1,103 @@
+"""Temporal Patterns: yearly, monthly, seasonal and vintage trends."""
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+import streamlit as st
+
+from analytics.engine import temporal_patterns
+
+
+def render(ctx, timings):
+    st.markdown('<div class="section-header"><h3> Temporal Patterns Analysis</h3></div>', unsafe_allow_html=True)
+    with timings.stage('analysis:temporal_patterns', rows=ctx.n_rows):
+        result = temporal_patterns(ctx)
+
+    if 'yearly_trends' in result.tables:
+        col1, col2 = st.columns(2)
+
+        with col1:
+            # Yearly trends
+            yearly_trends = result.tables['yearly_trends']
+
+            fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+            fig.add_trace(
+                go.Bar(x=yearly_trends['ENTRY_YEAR'], y=yearly_trends['POL_NUMBER'],
+                      name="Policy Count", marker_color='#7dd3fc'),
+                secondary_y=False,
+            )
+
+            fig.add_trace(
+                go.Scatter(x=yearly_trends['ENTRY_YEAR'], y=yearly_trends['LOSS_RATIO'],
+                          mode='lines+markers', name="Loss Ratio", line=dict(color='#ef4444')),
+                secondary_y=True,
+            )
+
+            fig.update_xaxes(title_text="Entry Year")
+            fig.update_yaxes(title_text="Policy Count", secondary_y=False)
+            fig.update_yaxes(title_text="Loss Ratio", secondary_y=True)
+            fig.update_layout(title_text="Yearly Policy and Loss Ratio Trends")
+
+            st.plotly_chart(fig, use_container_width=True)
+
+        with col2:
+            # Monthly seasonality
+            monthly_trends = result.tables['monthly_trends']
+
+            fig = px.line(monthly_trends, x='ENTRY_MONTH', y='LOSS_RATIO',
+                        title="Monthly Loss Ratio Seasonality",
+                        markers=True, line_shape='spline')
+            fig.add_hline(y=1.0, line_dash="dash", line_color="#ef4444",
+                         annotation_text="Break-even")
+            fig.update_layout(
+                paper_bgcolor='white',
+                plot_bgcolor='white',
+                font=dict(color='#374151', size=11),
+                title_font_size=14
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        # Quarterly analysis
+        if 'quarterly_analysis' in result.tables:
+            quarterly_analysis = result.tables['quarterly_analysis']
+
+            st.markdown('<div class="section-header"><h3> Quarterly Performance</h3></div>', unsafe_allow_html=True)
+            st.dataframe(quarterly_analysis, use_container_width=True)
+
+    # Vintage analysis
+    if 'vintage_analysis' in result.tables:
+        vintage_analysis = result.tables['vintage_analysis']
+
+        fig = px.scatter(vintage_analysis, x='POLICY_VINTAGE', y='LOSS_RATIO',
+                       size='POL_NUMBER', 
+                       title="Policy Vintage vs Loss Ratio",
+                       color='LOSS_RATIO',
+                       color_continuous_scale=['#10b981', '#ef4444'])
+        fig.add_hline(y=1.0, line_dash="dash", line_color="#ef4444")
+        fig.update_layout(
+            paper_bgcolor='white',
+            plot_bgcolor='white',
+            font=dict(color='#374151', size=11),
+            title_font_size=14
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Temporal insights
+    st.markdown('''
+    <div class="insight-box">
+        <h3>📈 Temporal Insights</h3>
+    ''', unsafe_allow_html=True)
+
+    if 'latest_year_loss_ratio' in result.metrics:
+        latest_year_lr = result.metrics['latest_year_loss_ratio']
+        best_month = result.metrics['best_month']
+        worst_month = result.metrics['worst_month']
+
+        insights = f"""
+        **Latest Year Performance:** {latest_year_lr:.2f} loss ratio<br>
+        **Best Month:** Month {best_month} (lowest loss ratio)<br>
+        **Worst Month:** Month {worst_month} (highest loss ratio)<br>
+        **Trend Analysis:** {'Improving' if latest_year_lr < 1.0 else 'Needs attention'}
+        """
+        st.markdown(insights, unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)